@@ -0,0 +1,9 @@
+"""
+benchmarks - 可复现的性能基准
+corpus.py 生成合成的多剧集字幕语料（与vedio-understand输出相同的subtitle.txt/names.txt目录结构）
+run.py 在合成语料上测量启动、搜索、押韵、对话和随机抽句的耗时，输出JSON并与基线比较
+
+用法:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline results.json      # 与之前提交的结果比较，超过阈值时返回非零退出码
+"""
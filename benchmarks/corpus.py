@@ -0,0 +1,165 @@
+"""
+corpus.py - 合成字幕语料生成器
+按剧集数、每剧集集数和每集字幕条数生成 <根目录>/<剧集ID>/<集名>/subtitles/subtitle.txt 和 names.txt，
+每行格式为 [HH:MM:SS.mmm - HH:MM:SS.mmm] 文本，与DataLoader读取的格式一致
+同样的参数和随机种子总是生成相同的语料
+
+用法:
+    python -m benchmarks.corpus --output /tmp/bench_corpus --dramas 3 --episodes 20 --lines 800
+"""
+
+import argparse
+import json
+import os
+import random
+from typing import Dict, List
+
+from drama_config import DRAMAS
+
+# 语料根目录下的说明文件，记录生成参数和剧集配置
+MANIFEST_FILE = "manifest.json"
+# 每集的目录名模式
+EPISODE_PATTERN = "E{episode:03d}"
+
+NAMES = ["甄嬛", "皇上", "华妃", "皇后", "沈眉庄", "安陵容", "果郡王", "余则成", "翠平", "站长", "李涯", "晚秋"]
+SUBJECTS = ["我", "你", "他", "她", "我们", "你们", "皇上", "臣妾", "娘娘", "本宫", "站长", "老余", "大家", "这件事"]
+VERBS = ["知道", "去", "来", "看看", "告诉", "相信", "喜欢", "害怕", "答应", "查清楚", "记得", "等着", "回去", "放心"]
+OBJECTS = ["皇上", "娘娘", "这个人", "那封信", "消息", "真相", "规矩", "东西", "这一切", "家里", "宫里", "天津", "情报"]
+ADVERBS = ["一定", "已经", "真的", "还是", "不", "没", "也", "都", "马上", "千万", "其实", "竟然"]
+PARTICLES = ["啊", "呢", "吗", "吧", "呀", "了", "嘛", ""]
+# 常见的短回应，使同一句话在语料中多次出现（用于挖掘真实对话）
+STOCK_LINES = ["是", "知道了", "臣妾遵旨", "好", "不行", "为什么", "谁", "怎么了", "你说什么", "明白", "没有",
+               "皇上万岁", "多谢娘娘", "我不知道", "你放心吧", "这是什么", "走吧", "快去"]
+
+
+def format_timestamp(seconds: float) -> str:
+    """秒数 -> HH:MM:SS.mmm"""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    return f"{hours:02d}:{minutes:02d}:{millis / 1000:06.3f}"
+
+
+def make_clause(rng: random.Random) -> str:
+    """主语 + (副词) + 动词 + (宾语) + 语气词"""
+    parts = [rng.choice(SUBJECTS)]
+    if rng.random() < 0.5:
+        parts.append(rng.choice(ADVERBS))
+    parts.append(rng.choice(VERBS))
+    if rng.random() < 0.7:
+        parts.append(rng.choice(OBJECTS))
+    return "".join(parts) + rng.choice(PARTICLES)
+
+
+def make_line(rng: random.Random) -> str:
+    """生成一句字幕文本，偶尔由两个分句组成"""
+    roll = rng.random()
+    if roll < 0.15:
+        return rng.choice(STOCK_LINES)
+    text = make_clause(rng)
+    if rng.random() < 0.2:
+        text += "，" + make_clause(rng)
+    if roll < 0.35:
+        text += "？"
+    elif roll < 0.45:
+        text += "！"
+    return text
+
+
+def generate_episode(rng: random.Random, lines: int):
+    """生成一集的字幕行和人名行：每1~4句为一段，由同一人说，相邻两段换人"""
+    subtitle_lines = []
+    name_lines = []
+    now = rng.uniform(1, 10)
+    speaker = None
+    remaining = 0
+    turn_start = now
+    for i in range(lines):
+        if remaining == 0:
+            speaker = rng.choice([name for name in NAMES if name != speaker])
+            remaining = rng.randint(1, 4)
+            turn_start = now
+        duration = rng.uniform(0.8, 3.5)
+        subtitle_lines.append(f"[{format_timestamp(now)} - {format_timestamp(now + duration)}] {make_line(rng)}")
+        now += duration
+        remaining -= 1
+        if remaining == 0 or i == lines - 1:
+            name_lines.append(f"[{format_timestamp(turn_start)} - {format_timestamp(now)}] {speaker}")
+        now += rng.uniform(0.1, 2.5)
+    return subtitle_lines, name_lines
+
+
+def drama_ids(count: int) -> List[str]:
+    """剧集ID：先使用已配置的剧集ID（保证默认剧集存在），不够时补充synthetic{n}"""
+    ids = list(DRAMAS)[:count]
+    ids += [f"synthetic{i}" for i in range(len(ids) + 1, count + 1)]
+    return ids
+
+
+def generate_corpus(root: str, dramas: int = 2, episodes: int = 10, lines: int = 500, seed: int = 0) -> Dict:
+    """
+    生成合成语料并写入说明文件
+
+    Args:
+        root: 语料根目录
+        dramas: 剧集数
+        episodes: 每个剧集的集数
+        lines: 每集字幕条数
+        seed: 随机种子
+
+    Returns:
+        说明文件内容（生成参数和每个剧集的配置）
+    """
+    rng = random.Random(seed)
+    configs = {}
+    for index, drama_id in enumerate(drama_ids(dramas), 1):
+        output_path = os.path.join(os.path.abspath(root), drama_id)
+        for episode in range(1, episodes + 1):
+            directory = os.path.join(output_path, EPISODE_PATTERN.format(episode=episode), "subtitles")
+            os.makedirs(directory, exist_ok=True)
+            subtitle_lines, name_lines = generate_episode(rng, lines)
+            with open(os.path.join(directory, "subtitle.txt"), "w", encoding="utf-8") as f:
+                f.write("\n".join(subtitle_lines) + "\n")
+            with open(os.path.join(directory, "names.txt"), "w", encoding="utf-8") as f:
+                f.write("\n".join(name_lines) + "\n")
+
+        configs[drama_id] = {
+            "id": drama_id,
+            "name": DRAMAS[drama_id]["name"] if drama_id in DRAMAS else f"合成剧集{index}",
+            "video_root": os.path.join(os.path.abspath(root), "videos", drama_id),
+            "output_path": output_path,
+            "episodes": {"start": 1, "end": episodes, "pattern": EPISODE_PATTERN},
+            "video_pattern": {"primary": "{episode}.mp4", "fallback": "{episode_num}.mp4"},
+        }
+
+    manifest = {
+        "params": {"dramas": dramas, "episodes": episodes, "lines": lines, "seed": seed},
+        "dramas": configs,
+    }
+    with open(os.path.join(root, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def load_manifest(root: str) -> Dict:
+    with open(os.path.join(root, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def use_corpus(manifest: Dict):
+    """把drama_config中的剧集配置替换为合成语料（原地修改，已导入的函数也会读取新配置）"""
+    DRAMAS.clear()
+    DRAMAS.update(manifest["dramas"])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='生成合成字幕语料')
+    parser.add_argument('--output', required=True, help='语料根目录')
+    parser.add_argument('--dramas', type=int, default=2, help='剧集数')
+    parser.add_argument('--episodes', type=int, default=10, help='每个剧集的集数')
+    parser.add_argument('--lines', type=int, default=500, help='每集字幕条数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.output, args.dramas, args.episodes, args.lines, args.seed)
+    print(f"已生成 {len(manifest['dramas'])} 个剧集，每个 {args.episodes} 集，每集 {args.lines} 条字幕: {args.output}")
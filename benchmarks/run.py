@@ -0,0 +1,242 @@
+"""
+run.py - 在合成语料上运行性能基准
+测量启动（init_data）、搜索（字面量、正则、单字）、押韵、对话和随机抽句的耗时，结果输出为JSON
+指定--baseline时与之前的结果比较：中位数超过基线的阈值倍数即视为回归，返回退出码1
+
+查询结果缓存在每次请求前清空，测量的是未命中缓存时的耗时；请求经过Flask测试客户端，包括JSON编码
+启动耗时在韵母表已保存后测量（先执行一次不计时的加载）
+
+用法:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --dramas 4 --episodes 40 --lines 800 --repeat 3
+    python -m benchmarks.run --corpus /tmp/bench_corpus --baseline results.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.corpus import MANIFEST_FILE, generate_corpus, load_manifest, use_corpus
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 默认回归阈值：当前中位数 / 基线中位数超过该值时视为回归
+DEFAULT_THRESHOLD = 1.25
+# 各基准单独的阈值（启动耗时受磁盘缓存影响，波动较大）
+THRESHOLDS = {
+    "startup": 1.5,
+}
+# 中位数相差不到该毫秒数时不视为回归，避免亚毫秒级的测量噪声
+MIN_REGRESSION_MS = 0.05
+
+# 查询使用语料生成器词表中的词，保证在合成语料中有匹配
+LITERAL_QUERIES = ["皇上", "知道", "这个人", "告诉", "消息", "查清楚", "臣妾遵旨", "那封信"]
+REGEX_QUERIES = ["^我.*吗？$", "皇上|娘娘", "(知道|相信)了", "[你我]一定", "^.{10,}$"]
+SINGLE_CHAR_QUERIES = ["了", "我", "吗", "是", "信"]
+RHYME_TEXTS = ["臣妾做不到啊", "我知道了", "你放心吧", "皇上万岁", "这是什么", "快去", "真相", "走吧"]
+DIALOGUE_TEXTS = ["你说什么？", "快去", "我不知道", "皇上万岁", "你相信这个人吗？", "谁", "走吧", "多谢娘娘"]
+
+BENCHMARKS = ("startup", "search_literal", "search_regex", "search_single_char", "rhyme", "dialogue",
+              "random_sampling")
+
+
+def summarize(samples: List[float]) -> Dict:
+    """耗时样本（秒）的统计，单位毫秒"""
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, math.ceil(len(samples) * 0.95) - 1)]
+    return {
+        "samples": len(samples),
+        "median_ms": round(statistics.median(samples) * 1000, 4),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 4),
+        "min_ms": round(samples[0] * 1000, 4),
+        "p95_ms": round(p95 * 1000, 4),
+    }
+
+
+def benchmark_requests(manifest: Dict) -> Dict[str, List[tuple]]:
+    """每个基准发送的请求：(方法, 路径, 查询参数或JSON)"""
+    first_drama = next(iter(manifest["dramas"]))
+    return {
+        "search_literal": [("GET", "/api/search", {"query": query}) for query in LITERAL_QUERIES],
+        "search_regex": [("GET", "/api/search", {"query": query, "regex": "true"}) for query in REGEX_QUERIES],
+        "search_single_char": [("GET", "/api/search", {"query": query}) for query in SINGLE_CHAR_QUERIES],
+        "rhyme": [("GET", "/api/rhyming_sentences", {"text": text}) for text in RHYME_TEXTS],
+        "dialogue": [("POST", "/api/dialogue_responses", {"sentence_text": text, "drama_id": first_drama,
+                                                          "episode": "E001"}) for text in DIALOGUE_TEXTS],
+        "random_sampling": [("GET", "/api/random_sentences", {"count": "8"}) for _ in range(8)],
+    }
+
+
+def run_benchmarks(manifest: Dict, repeat: int = 5, only: List[str] = None) -> Dict:
+    """加载语料并运行基准，返回 {基准名: 统计}"""
+    use_corpus(manifest)
+    import subtitle_api
+
+    selected = [name for name in BENCHMARKS if not only or name in only]
+    results = {}
+
+    # 第一次加载生成并保存韵母表，不计时
+    with contextlib.redirect_stdout(io.StringIO()):
+        subtitle_api.init_data()
+    if "startup" in selected:
+        samples = []
+        for _ in range(repeat):
+            with contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                subtitle_api.init_data()
+                samples.append(time.perf_counter() - started)
+        results["startup"] = summarize(samples)
+
+    client = subtitle_api.app.test_client()
+    for name, requests in benchmark_requests(manifest).items():
+        if name not in selected:
+            continue
+        samples = []
+        # 第一轮预热（构建按需生成的拼接文本等），不计时
+        for round_index in range(repeat + 1):
+            # 对话和随机抽句带有随机性，每轮使用相同的随机种子
+            random.seed(round_index)
+            for method, path, params in requests:
+                subtitle_api.result_cache.bump_version()
+                started = time.perf_counter()
+                if method == "GET":
+                    response = client.get(path, query_string=params)
+                else:
+                    response = client.post(path, json=params)
+                elapsed = time.perf_counter() - started
+                if response.status_code != 200:
+                    raise RuntimeError(f"{name}: {path} {params} 返回 {response.status_code}")
+                if round_index:
+                    samples.append(elapsed)
+        results[name] = summarize(samples)
+
+    for name, stats in results.items():
+        stats["threshold"] = THRESHOLDS.get(name, DEFAULT_THRESHOLD)
+    return results
+
+
+def git_commit() -> str:
+    try:
+        completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                   capture_output=True, text=True, check=True)
+        return completed.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict, baseline: Dict, threshold: float = None) -> List[Dict]:
+    """
+    与基线比较每个基准的中位数
+
+    Args:
+        results: 本次运行的输出
+        baseline: 之前运行的输出
+        threshold: 统一的阈值，None时使用每个基准自己的阈值
+
+    Returns:
+        每个基准的比较结果，regressed为True表示超过阈值
+    """
+    rows = []
+    for name, current in results["benchmarks"].items():
+        previous = baseline["benchmarks"].get(name)
+        if previous is None:
+            continue
+        limit = threshold or current["threshold"]
+        ratio = current["median_ms"] / previous["median_ms"] if previous["median_ms"] else math.inf
+        rows.append({
+            "benchmark": name,
+            "baseline_ms": previous["median_ms"],
+            "current_ms": current["median_ms"],
+            "ratio": round(ratio, 3),
+            "threshold": limit,
+            "regressed": ratio > limit and current["median_ms"] - previous["median_ms"] > MIN_REGRESSION_MS,
+        })
+    return rows
+
+
+def print_results(results: Dict, comparison: List[Dict] = None):
+    print(f"{'基准':<20}{'中位数(ms)':>12}{'平均(ms)':>12}{'P95(ms)':>12}{'样本':>8}")
+    for name, stats in results["benchmarks"].items():
+        print(f"{name:<20}{stats['median_ms']:>12.3f}{stats['mean_ms']:>12.3f}{stats['p95_ms']:>12.3f}"
+              f"{stats['samples']:>8}")
+    if comparison:
+        print(f"\n与基线 {results.get('baseline_commit')} 比较:")
+        for row in comparison:
+            flag = "回归" if row["regressed"] else "正常"
+            print(f"{row['benchmark']:<20}{row['baseline_ms']:>12.3f} -> {row['current_ms']:<12.3f}"
+                  f"x{row['ratio']:<8}阈值 x{row['threshold']:<6}{flag}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='在合成语料上运行性能基准')
+    parser.add_argument('--corpus', default=None, help='已生成的语料目录（不指定则在临时目录中生成）')
+    parser.add_argument('--dramas', type=int, default=2, help='生成语料的剧集数')
+    parser.add_argument('--episodes', type=int, default=20, help='生成语料每个剧集的集数')
+    parser.add_argument('--lines', type=int, default=500, help='生成语料每集的字幕条数')
+    parser.add_argument('--seed', type=int, default=0, help='生成语料的随机种子')
+    parser.add_argument('--repeat', type=int, default=5, help='每个基准重复的轮数')
+    parser.add_argument('--only', nargs='*', choices=BENCHMARKS, help='只运行指定的基准')
+    parser.add_argument('--output', default=None, help='结果JSON文件')
+    parser.add_argument('--baseline', default=None, help='用于比较的基线结果JSON文件')
+    parser.add_argument('--threshold', type=float, default=None, help='统一的回归阈值（倍数），不指定则使用每个基准的阈值')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = tempfile.mkdtemp(prefix="subtitle_bench_")
+    corpus = args.corpus
+    if corpus is None or not os.path.exists(os.path.join(corpus, MANIFEST_FILE)):
+        corpus = corpus or os.path.join(workdir, "corpus")
+        generate_corpus(corpus, args.dramas, args.episodes, args.lines, args.seed)
+    manifest = load_manifest(corpus)
+
+    # subtitle_api导入时会在当前目录创建视频输出目录，在临时目录中运行
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+
+    try:
+        benchmarks = run_benchmarks(manifest, args.repeat, args.only)
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "corpus": manifest["params"],
+        "repeat": args.repeat,
+        "benchmarks": benchmarks,
+    }
+
+    comparison = None
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("corpus") != results["corpus"]:
+            print(f"警告: 基线的语料参数 {baseline.get('corpus')} 与本次 {results['corpus']} 不同，比较结果仅供参考")
+        comparison = compare(results, baseline, args.threshold)
+        results["baseline_commit"] = baseline.get("commit")
+        results["comparison"] = comparison
+
+    print_results(results, comparison)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if comparison and any(row["regressed"] for row in comparison):
+        sys.exit(1)
@@ -1,12 +1,14 @@
 import os
 import json
 import re
+from difflib import SequenceMatcher
 from pathlib import Path
 from typing import Dict, List, Any, Optional
 from drama_config import get_drama_config, DEFAULT_DRAMA
 
 class DataLoader:
-    def __init__(self, drama_id: str = DEFAULT_DRAMA, base_path: str = None):
+    def __init__(self, drama_id: str = DEFAULT_DRAMA, base_path: str = None, merge_threshold: float = None,
+                 merge_max_gap: float = 1.0):
         # 获取剧集配置
         self.drama_config = get_drama_config(drama_id)
         self.drama_id = drama_id
@@ -16,6 +18,11 @@ class DataLoader:
         self.episodes = []
         self.data = {}
         
+        # 合并OCR重复字幕：相邻两条相似度不低于merge_threshold且间隔不超过merge_max_gap秒时合并，None表示不合并
+        self.merge_threshold = merge_threshold
+        self.merge_max_gap = merge_max_gap
+        self.compaction_stats = {"input": 0, "output": 0}
+        
     def load_episode_list(self, start_ep: int = None, end_ep: int = None):
         """Load list of available episodes in the specified range"""
         self.episodes = []
@@ -109,8 +116,48 @@ class DataLoader:
                     "text": text
                 })
         
+        if self.merge_threshold is not None:
+            subtitle_entries = self.compact_subtitles(subtitle_entries)
+        
         return subtitle_entries
     
+    def compact_subtitles(self, subtitle_entries: List[Dict]) -> List[Dict]:
+        """
+        Merge consecutive identical or near-identical subtitle entries (repeated OCR frames)
+        into one entry spanning the combined time range, keeping the longest text
+        """
+        compacted = []
+        previous_end = None
+        for entry in subtitle_entries:
+            start = self.timestamp_to_seconds(entry["start_time"])
+            end = self.timestamp_to_seconds(entry["end_time"])
+            
+            if compacted and start - previous_end <= self.merge_max_gap:
+                last = compacted[-1]
+                if self.text_similarity(last["text"], entry["text"]) >= self.merge_threshold:
+                    # 延长上一条的结束时间，保留较长（通常更完整）的文本
+                    if end >= previous_end:
+                        last["end_time"] = entry["end_time"]
+                        previous_end = end
+                    if len(entry["text"]) > len(last["text"]):
+                        last["text"] = entry["text"]
+                    continue
+            
+            compacted.append(dict(entry))
+            previous_end = end
+        
+        self.compaction_stats["input"] += len(subtitle_entries)
+        self.compaction_stats["output"] += len(compacted)
+        return compacted
+    
+    def text_similarity(self, a: str, b: str) -> float:
+        """Similarity ratio between two subtitle texts (1.0 for identical)"""
+        if a == b:
+            return 1.0
+        if not a or not b:
+            return 0.0
+        return SequenceMatcher(None, a, b).ratio()
+    
     def is_valid_timestamp(self, timestamp: str) -> bool:
         """Check if a string is a valid timestamp format"""
         if not timestamp:
@@ -178,7 +225,58 @@ class DataLoader:
                 })
         
         return name_entries
-    
+
+    def attribute_speakers(self, subtitles: List[Dict], names: List[Dict]) -> List[List[str]]:
+        """
+        Attribute each subtitle to the valid name entries overlapping its time range.
+        Sweep line over sorted interval endpoints: O((n + m) log(n + m) + k)
+        Returns a list of name lists aligned with `subtitles`
+        """
+        speakers = [[] for _ in subtitles]
+
+        # 事件: (时间, 是否结束, 类型, 下标)，同一时刻开始事件排在结束事件之前（闭区间）
+        events = []
+        for i, subtitle in enumerate(subtitles):
+            start = self.timestamp_to_seconds(subtitle["start_time"])
+            end = max(start, self.timestamp_to_seconds(subtitle["end_time"]))
+            events.append((start, 0, 1, i))
+            events.append((end, 1, 1, i))
+
+        for j, name_entry in enumerate(names):
+            # 只使用时间戳有效的人名
+            if not name_entry["is_valid"] or not name_entry["name"].strip():
+                continue
+            start = self.timestamp_to_seconds(name_entry["start_time"])
+            end = max(start, self.timestamp_to_seconds(name_entry["end_time"]))
+            events.append((start, 0, 0, j))
+            events.append((end, 1, 0, j))
+
+        events.sort()
+
+        active_subtitles = {}
+        active_names = {}
+        for _, is_end, kind, idx in events:
+            if kind == 1:
+                if is_end:
+                    active_subtitles.pop(idx, None)
+                    continue
+                active_subtitles[idx] = True
+                for j in active_names:
+                    name = names[j]["name"].strip()
+                    if name not in speakers[idx]:
+                        speakers[idx].append(name)
+            else:
+                if is_end:
+                    active_names.pop(idx, None)
+                    continue
+                active_names[idx] = True
+                name = names[idx]["name"].strip()
+                for i in active_subtitles:
+                    if name not in speakers[i]:
+                        speakers[i].append(name)
+
+        return speakers
+
     def load_episode_data(self, episode: str) -> Dict:
         """Load and parse subtitle data for a specific episode"""
         subtitle_data = self.load_subtitle_data(episode)
@@ -0,0 +1,147 @@
+"""
+metrics.py - Prometheus格式的运行指标
+计数按线程分片累加：每个线程只写自己的分片，记录时不加锁；导出时再汇总所有分片
+已结束线程的分片在导出（或分片过多）时合并进汇总值后移除，每个请求一个线程时分片数也不会无限增长
+"""
+
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Tuple
+
+# 请求耗时的默认分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 分片数超过该值时清理已结束线程的分片
+MAX_SHARDS = 256
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def format_labels(labels: Labels, extra: str = "") -> str:
+    """格式化标签 {name="value",...}，转义反斜杠、双引号和换行"""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        # 指标名 -> (类型, 说明, 分桶)
+        self.definitions = {}
+        # 导出时计算的指标: 指标名 -> 返回[(标签, 值)]的函数
+        self.callbacks = {}
+        self._local = threading.local()
+        self._shards = []
+        # 已结束线程的分片合并到这里
+        self._retired = ({}, {})
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, metric_type: str, help_text: str, buckets: Iterable[float] = None):
+        """声明指标（counter、gauge或histogram），导出时按声明顺序输出"""
+        self.definitions[name] = (metric_type, help_text, tuple(buckets or DEFAULT_BUCKETS))
+
+    def register_callback(self, name: str, callback: Callable[[], Iterable[Tuple[Labels, float]]]):
+        """注册导出时才计算的指标（如语料大小），callback返回[(标签, 值)]"""
+        self.callbacks[name] = callback
+
+    def _shard(self) -> Tuple[Dict, Dict]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = ({}, {})
+            with self._lock:
+                if len(self._shards) >= MAX_SHARDS:
+                    self._retire_dead_shards()
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1):
+        """计数器或仪表加value（仪表可以加负数）"""
+        counters = self._shard()[0]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Labels = ()):
+        """记录直方图样本"""
+        histograms = self._shard()[1]
+        key = (name, labels)
+        buckets = self.definitions[name][2]
+        state = histograms.get(key)
+        if state is None:
+            # 各分桶计数（不累计）、+Inf分桶、总和、样本数
+            state = histograms[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+        state[bisect_left(buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    @staticmethod
+    def _merge(target: Tuple[Dict, Dict], shard: Tuple[Dict, Dict]):
+        counters, histograms = target
+        for key, value in list(shard[0].items()):
+            counters[key] = counters.get(key, 0) + value
+        for key, state in list(shard[1].items()):
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = list(state)
+            else:
+                for i, value in enumerate(state):
+                    merged[i] += value
+
+    def _retire_dead_shards(self):
+        """把已结束线程的分片合并进汇总值（调用方持有锁）"""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self._merge(self._retired, shard)
+        self._shards = alive
+
+    def snapshot(self) -> Tuple[Dict, Dict]:
+        """汇总所有分片的(计数, 直方图)"""
+        with self._lock:
+            self._retire_dead_shards()
+            total = ({key: value for key, value in self._retired[0].items()},
+                     {key: list(state) for key, state in self._retired[1].items()})
+            for _, shard in self._shards:
+                self._merge(total, shard)
+        return total
+
+    def render(self) -> str:
+        """导出Prometheus文本格式"""
+        counters, histograms = self.snapshot()
+        samples = {}
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, []).append((labels, value))
+        for name, callback in self.callbacks.items():
+            samples.setdefault(name, []).extend(callback())
+
+        lines = []
+        for name, (metric_type, help_text, buckets) in self.definitions.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type != "histogram":
+                for labels, value in sorted(samples.get(name, []), key=lambda sample: sample[0]):
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                continue
+
+            for (metric_name, labels), state in sorted(histograms.items(), key=lambda item: item[0]):
+                if metric_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ("+Inf",), state):
+                    cumulative += count
+                    bucket_labels = format_labels(labels, 'le="%s"' % bound)
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {format_value(state[-2])}")
+                lines.append(f"{name}_count{format_labels(labels)} {state[-1]}")
+        return "\n".join(lines) + "\n"
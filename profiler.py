@@ -0,0 +1,212 @@
+"""
+profiler.py - 按需开启的请求性能分析
+运行时指定路由和采样比例，被采样的请求用cProfile分析（mode="cprofile"），或由后台线程定时采样调用栈（mode="sample"）
+结果在内存中累计，可导出为pstats文件（python -m pstats、snakeviz）或折叠调用栈（flamegraph.pl、speedscope）
+命名的计时区间(span)记录一次请求中各阶段（候选收集、评分、排序、序列化）的耗时
+"""
+
+import cProfile
+import marshal
+import math
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+PROFILE_MODES = ("cprofile", "sample")
+# 调用栈采样间隔（秒）
+DEFAULT_SAMPLE_INTERVAL = 0.005
+MIN_SAMPLE_INTERVAL = 0.001
+MAX_SAMPLE_INTERVAL = 1.0
+# 折叠调用栈只保留最内层的帧数
+MAX_STACK_DEPTH = 64
+
+
+def collapse_stack(frame) -> str:
+    """把调用栈折叠为 外层;...;内层 形式，每帧为 文件名:函数名"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+class RequestProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.route = None
+        self.sample_rate = 0.0
+        self.mode = PROFILE_MODES[0]
+        self.interval = DEFAULT_SAMPLE_INTERVAL
+        self.started_at = None
+        self.profiled_requests = 0
+        self.skipped_requests = 0
+        # 每次span结束时调用 on_span(名称, 耗时)，不论是否在分析中（用于记录指标）
+        self.on_span: Optional[Callable[[str, float], None]] = None
+        self._stats = None
+        self._stacks = Counter()
+        self._samples = 0
+        # span名称 -> [次数, 总耗时]，只统计被分析的请求
+        self._spans = {}
+        # 正在被采样的线程ID集合（sample模式）
+        self._active = set()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._sampler_stop = None
+
+    def start(self, route: str, sample_rate: float = 1.0, mode: str = "cprofile",
+              interval: float = DEFAULT_SAMPLE_INTERVAL):
+        """开始分析route上sample_rate比例的请求，清空之前的结果"""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"不支持的分析模式: {mode}")
+        if not 0 < sample_rate <= 1:
+            raise ValueError("采样比例必须在(0, 1]之间")
+        if not (math.isfinite(interval) and MIN_SAMPLE_INTERVAL <= interval <= MAX_SAMPLE_INTERVAL):
+            raise ValueError(f"采样间隔必须在[{MIN_SAMPLE_INTERVAL}, {MAX_SAMPLE_INTERVAL}]秒之间")
+
+        self.stop()
+        with self._lock:
+            self.route = route
+            self.sample_rate = sample_rate
+            self.mode = mode
+            self.interval = interval
+            self.started_at = time.time()
+            self.profiled_requests = 0
+            self.skipped_requests = 0
+            self._stats = None
+            self._stacks = Counter()
+            self._samples = 0
+            self._spans = {}
+            self._active = set()
+        if mode == "sample":
+            self._sampler_stop = threading.Event()
+            self._sampler = threading.Thread(target=self._sample_loop, args=(self._sampler_stop,),
+                                             name="request-profiler-sampler", daemon=True)
+            self._sampler.start()
+        self.enabled = True
+
+    def stop(self):
+        """停止分析，保留已累计的结果供下载"""
+        self.enabled = False
+        if self._sampler is not None:
+            self._sampler_stop.set()
+            self._sampler.join()
+            self._sampler = None
+
+    def should_profile(self, route: str) -> bool:
+        """请求是否被采样"""
+        return self.enabled and route == self.route and random.random() < self.sample_rate
+
+    def begin(self) -> bool:
+        """开始分析当前线程中的请求，同一时刻只能有一个cProfile时（Python 3.12+）返回False"""
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                self.skipped_requests += 1
+                return False
+            self._local.profile = profile
+        else:
+            with self._lock:
+                self._active.add(threading.get_ident())
+        self._local.spans = {}
+        return True
+
+    def end(self):
+        """结束当前线程中的分析并累计结果"""
+        profile = getattr(self._local, "profile", None)
+        spans = getattr(self._local, "spans", None) or {}
+        self._local.profile = None
+        self._local.spans = None
+        if profile is not None:
+            profile.disable()
+            stats = pstats.Stats(profile)
+        with self._lock:
+            self._active.discard(threading.get_ident())
+            if profile is not None:
+                if self._stats is None:
+                    self._stats = stats
+                else:
+                    self._stats.add(stats)
+            for name, (count, total) in spans.items():
+                aggregate = self._spans.setdefault(name, [0, 0.0])
+                aggregate[0] += count
+                aggregate[1] += total
+            self.profiled_requests += 1
+
+    @contextmanager
+    def span(self, name: str):
+        """计时区间，在被分析的请求中累计到该请求的span统计"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if self.on_span is not None:
+                self.on_span(name, elapsed)
+            spans = getattr(self._local, "spans", None)
+            if spans is not None:
+                entry = spans.get(name)
+                if entry is None:
+                    spans[name] = (1, elapsed)
+                else:
+                    spans[name] = (entry[0] + 1, entry[1] + elapsed)
+
+    def _sample_loop(self, stop_event: threading.Event):
+        """后台线程：每隔interval秒记录一次被采样线程的调用栈"""
+        while not stop_event.wait(self.interval):
+            with self._lock:
+                if not self._active:
+                    continue
+                idents = list(self._active)
+            frames = sys._current_frames()
+            stacks = [collapse_stack(frames[ident]) for ident in idents if ident in frames]
+            with self._lock:
+                self._stacks.update(stacks)
+                self._samples += len(stacks)
+
+    def pstats_data(self) -> Optional[bytes]:
+        """pstats文件内容（与Stats.dump_stats的格式相同），没有cProfile结果时返回None"""
+        with self._lock:
+            if self._stats is None:
+                return None
+            return marshal.dumps(self._stats.stats)
+
+    def collapsed_stacks(self) -> str:
+        """折叠调用栈文本，每行为 调用栈 采样次数"""
+        with self._lock:
+            items = sorted(self._stacks.items())
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def status(self) -> Dict:
+        with self._lock:
+            spans = {
+                name: {
+                    "count": count,
+                    "total_seconds": round(total, 6),
+                    "mean_ms": round(total / count * 1000, 3),
+                }
+                for name, (count, total) in sorted(self._spans.items())
+            }
+            return {
+                "enabled": self.enabled,
+                "route": self.route,
+                "sample_rate": self.sample_rate,
+                "mode": self.mode,
+                "interval": self.interval,
+                "started_at": self.started_at,
+                "profiled_requests": self.profiled_requests,
+                "skipped_requests": self.skipped_requests,
+                "stack_samples": self._samples,
+                "has_pstats": self._stats is not None,
+                "spans": spans,
+            }
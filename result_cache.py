@@ -0,0 +1,97 @@
+"""
+result_cache.py - 查询结果缓存
+按接口分区的LRU缓存，键中包含语料版本号，数据重新加载后旧结果自动失效
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+# 各接口的缓存条数上限
+DEFAULT_LIMITS = {
+    "search": 128,
+    "rhyme": 512,
+    "dialogue": 256,
+    "similar": 256,
+}
+
+
+def make_key(*parts) -> tuple:
+    """
+    规范化缓存键
+    列表/集合转为排序后的元组（如drama_ids），None和空列表视为相同
+    """
+    key = []
+    for part in parts:
+        if isinstance(part, (list, tuple, set, frozenset)):
+            part = tuple(sorted(set(part))) if part else None
+        key.append(part)
+    return tuple(key)
+
+
+class ResultCache:
+    def __init__(self, limits: Dict[str, int] = None, default_limit: int = 128):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.default_limit = default_limit
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def bump_version(self) -> int:
+        """语料重新加载时调用，清空所有缓存并返回新的版本号"""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            return self.version
+
+    def get(self, namespace: str, key: Hashable, default: Any = None) -> Any:
+        """只读取缓存，不存在时返回default"""
+        full_key = (self.version, key)
+        with self._lock:
+            entries = self._entries.get(namespace)
+            if entries is None or full_key not in entries:
+                return default
+            entries.move_to_end(full_key)
+            self.hits += 1
+            return entries[full_key]
+
+    def get_or_compute(self, namespace: str, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        从缓存获取结果，不存在时调用compute计算并缓存
+        缓存的结果会被多个请求共享，调用方不能修改返回值
+        """
+        full_key = (self.version, key)
+        with self._lock:
+            entries = self._entries.setdefault(namespace, OrderedDict())
+            if full_key in entries:
+                entries.move_to_end(full_key)
+                self.hits += 1
+                return entries[full_key]
+            self.misses += 1
+
+        # 在锁外计算，避免慢查询阻塞其他请求
+        value = compute()
+
+        with self._lock:
+            # 计算期间版本变化时不写入旧结果
+            if full_key[0] != self.version:
+                return value
+            entries = self._entries.setdefault(namespace, OrderedDict())
+            entries[full_key] = value
+            entries.move_to_end(full_key)
+            limit = self.limits.get(namespace, self.default_limit)
+            while len(entries) > limit:
+                entries.popitem(last=False)
+        return value
+
+    def stats(self) -> Dict:
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": {namespace: len(entries) for namespace, entries in self._entries.items()},
+            }
@@ -0,0 +1,77 @@
+"""
+rhyme_table.py - 汉字韵母表
+语料中出现的每个字 -> 不带声调的韵母，首次加载时生成并保存在数据目录中，之后直接读取
+押韵计算只做字典查找，表中没有的字（来自请求文本）才按需导入pypinyin转换，结果只进入有上限的缓存
+"""
+
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable
+
+# 保存在数据目录下的文件名
+RHYME_TABLE_FILE = "rhyme_finals.json"
+RHYME_TABLE_VERSION = 1
+# 表外字符的韵母缓存大小（这些字不加入表中，表不随请求文本增长）
+EXTRA_FINALS_CACHE_SIZE = 4096
+
+
+def convert_final(char: str) -> str:
+    """用pypinyin获取单个字的韵母（去掉数字），标点等没有韵母的字符可能原样返回"""
+    from pypinyin import pinyin, Style
+
+    final = pinyin(char, style=Style.FINALS)[0][0]
+    return ''.join(c for c in final if not c.isdigit())
+
+
+@lru_cache(maxsize=EXTRA_FINALS_CACHE_SIZE)
+def cached_final(char: str) -> str:
+    """表外字符的韵母，最近使用的EXTRA_FINALS_CACHE_SIZE个保存在缓存中"""
+    return convert_final(char)
+
+
+class RhymeTable:
+    """字 -> 韵母 查找表"""
+
+    def __init__(self, finals: Dict[str, str] = None):
+        self.finals = dict(finals or {})
+
+    def load(self, path) -> int:
+        """合并已保存的韵母表，返回读取的字数；文件不存在或版本不符时忽略"""
+        path = Path(path)
+        if not path.exists():
+            return 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取韵母表出错 {path}: {e}")
+            return 0
+        if data.get("version") != RHYME_TABLE_VERSION:
+            return 0
+        self.finals.update(data["finals"])
+        return len(data["finals"])
+
+    def save(self, path, chars: Iterable[str] = None):
+        """保存韵母表（chars不为None时只保存这些字），先写临时文件再替换，避免写到一半的文件"""
+        path = Path(path)
+        finals = self.finals if chars is None else {char: self.finals[char] for char in chars}
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": RHYME_TABLE_VERSION, "finals": finals}, f, ensure_ascii=False, sort_keys=True)
+        os.replace(temp_path, path)
+
+    def ensure(self, chars: Iterable[str]) -> int:
+        """为表中没有的字生成韵母，返回新增的字数"""
+        missing = set(chars) - self.finals.keys()
+        for char in missing:
+            self.finals[char] = convert_final(char)
+        return len(missing)
+
+    def final(self, char: str) -> str:
+        """获取字的韵母，表中没有的字转换后只进入有上限的缓存，不加入表中（也不会被保存）"""
+        final = self.finals.get(char)
+        if final is None:
+            final = cached_final(char)
+        return final
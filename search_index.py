@@ -0,0 +1,633 @@
+"""
+search_index.py - 字幕搜索索引
+在数据加载时为每条字幕预先计算的辅助文本列和索引，查询时不再逐条转换
+"""
+
+import heapq
+import math
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pypinyin import lazy_pinyin, Style
+
+# 繁简转换库（可选），未安装时使用内置的常用字表
+try:
+    from zhconv import convert as zhconv_convert
+except ImportError:
+    zhconv_convert = None
+
+# 汉字范围
+HANZI_PATTERN = re.compile(r'[一-鿿]')
+
+
+def text_to_pinyin(text: str) -> Tuple[List[str], str]:
+    """
+    将字幕文本逐字转换为无声调拼音
+
+    Returns:
+        (每个字对应的拼音列表, 首字母串)，两者都与原文逐字对齐；非汉字保留原字符（小写）
+    """
+    syllables = lazy_pinyin(text, style=Style.NORMAL, errors=lambda chars: list(chars))
+    syllables = [syllable.lower() for syllable in syllables]
+    initials = ''.join(syllable[0] if syllable else ' ' for syllable in syllables)
+    return syllables, initials
+
+
+class PinyinIndex:
+    """
+    拼音索引：每条字幕的音节串（形如" huan huan ni hao "，按音节边界对齐）和首字母串（形如"hhnh"）
+    """
+
+    def __init__(self):
+        self.syllable_texts = []
+        self.initials_texts = []
+        # 语料中出现过的所有汉字音节，用于切分不带空格的拼音查询
+        self.known_syllables = set()
+        self.max_syllable_length = 0
+
+    def add(self, text: str):
+        """添加一条字幕（按all_subtitles中的顺序）"""
+        syllables, initials = text_to_pinyin(text)
+        self.syllable_texts.append(' ' + ' '.join(syllables) + ' ')
+        self.initials_texts.append(initials)
+
+        for char, syllable in zip(text, syllables):
+            if HANZI_PATTERN.match(char):
+                self.known_syllables.add(syllable)
+                self.max_syllable_length = max(self.max_syllable_length, len(syllable))
+
+    def segment(self, query: str) -> Optional[List[str]]:
+        """
+        将不带空格的拼音（如"huanhuan"）切分为音节，无法切分时返回None
+        动态规划，优先选择音节数最少的切分
+        """
+        best = [None] * (len(query) + 1)
+        best[0] = []
+        for end in range(1, len(query) + 1):
+            for start in range(max(0, end - self.max_syllable_length), end):
+                if best[start] is None or query[start:end] not in self.known_syllables:
+                    continue
+                if best[end] is None or len(best[start]) + 1 < len(best[end]):
+                    best[end] = best[start] + [query[start:end]]
+        return best[len(query)]
+
+
+def build_pinyin_matcher(query: str, pinyin_indexes: Dict[str, PinyinIndex]) -> List[Tuple[str, Callable[[str], bool]]]:
+    """
+    构建拼音查询的匹配函数
+    查询可以是汉字（按读音匹配）、带空格或不带空格的全拼（按音节匹配），或首字母（如"hh"）
+    不带空格的字母串可能既是全拼又是首字母（如"xian"、"e"），能切分为音节时两种读法都匹配
+
+    Returns:
+        [(要匹配的文本列名 "pinyin" 或 "initials", 匹配函数), ...]，任一读法匹配即命中
+    """
+    query = query.strip().lower().replace("'", ' ')
+    is_initials = not HANZI_PATTERN.search(query) and ' ' not in query
+
+    if HANZI_PATTERN.search(query):
+        syllables, _ = text_to_pinyin(query.replace(' ', ''))
+    elif ' ' in query:
+        syllables = query.split()
+    else:
+        syllables = None
+        for index in pinyin_indexes.values():
+            syllables = index.segment(query)
+            if syllables:
+                break
+
+    readings = []
+    if syllables:
+        pattern = ' ' + ' '.join(syllables) + ' '
+        readings.append(("pinyin", lambda text: pattern in text))
+    if is_initials:
+        readings.append(("initials", lambda text: query in text))
+    return readings
+
+
+def iter_qgrams(text: str, q: int = 2) -> Iterable[str]:
+    """产生文本的所有q-gram（文本短于q时不产生）"""
+    for i in range(len(text) - q + 1):
+        yield text[i:i + q]
+
+
+def default_max_distance(query_length: int) -> int:
+    """按查询长度确定默认允许的编辑距离"""
+    if query_length <= 3:
+        return 0
+    if query_length <= 7:
+        return 1
+    return 2
+
+
+def max_filtered_distance(query: str, q: int = 2) -> int:
+    """
+    q-gram计数过滤仍然有效（阈值大于0）时允许的最大编辑距离
+    每处编辑最多破坏q个不同的q-gram，距离再大时过滤阈值<=0，只能逐条计算编辑距离
+    查询短于q时返回-1
+    """
+    return (len(set(iter_qgrams(query, q))) - 1) // q
+
+
+def bounded_substring_distance(pattern: str, text: str, max_distance: int) -> Optional[int]:
+    """
+    pattern与text中任意子串的最小编辑距离（Sellers算法），超过max_distance时返回None
+    """
+    m = len(pattern)
+    previous = list(range(m + 1))
+    best = previous[m]
+    for char in text:
+        # 第0行恒为0：匹配可以从text的任意位置开始
+        current = [0] * (m + 1)
+        for i in range(1, m + 1):
+            cost = 0 if pattern[i - 1] == char else 1
+            current[i] = min(previous[i - 1] + cost, previous[i] + 1, current[i - 1] + 1)
+        best = min(best, current[m])
+        previous = current
+    return best if best <= max_distance else None
+
+
+class QGramIndex:
+    """
+    q-gram倒排索引：gram -> 包含该gram的字幕位置（升序）
+    用于模糊搜索的计数过滤：每次编辑最多破坏q个gram，与查询编辑距离不超过k的字幕至少包含 (查询中不同gram数 - q*k) 个查询gram
+    """
+
+    def __init__(self, q: int = 2):
+        self.q = q
+        self.postings = {}
+
+    def add(self, position: int, text: str):
+        """添加一条字幕（位置需递增）"""
+        for gram in set(iter_qgrams(text, self.q)):
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array('I')
+            posting.append(position)
+
+    def candidates(self, query: str, max_distance: int) -> Optional[List[int]]:
+        """
+        返回通过计数过滤的候选位置（升序）
+        查询太短、计数过滤无效时返回None，调用方需要逐条验证
+        """
+        grams = set(iter_qgrams(query, self.q))
+        threshold = len(grams) - self.q * max_distance
+        if threshold <= 0:
+            return None
+
+        counts = {}
+        for gram in grams:
+            for position in self.postings.get(gram, ()):
+                counts[position] = counts.get(position, 0) + 1
+        return sorted(position for position, count in counts.items() if count >= threshold)
+
+
+class LineBuffer:
+    """
+    整列文本拼接为一个字符串（行间以SEPARATOR分隔），用于一次查找多行中的字面量
+    str.find在C层扫描整列，比逐行调用匹配函数快得多；模式不能包含SEPARATOR
+    """
+
+    SEPARATOR = '\x00'
+
+    def __init__(self, texts: Iterable[str]):
+        texts = list(texts)
+        self.buffer = self.SEPARATOR.join(texts)
+        self.line_starts = array('Q')
+        start = 0
+        for text in texts:
+            self.line_starts.append(start)
+            start += len(text) + 1
+
+    def find_lines(self, pattern: str) -> array:
+        """返回包含pattern的行号（升序）"""
+        lines = array('I')
+        line_count = len(self.line_starts)
+        start = self.buffer.find(pattern)
+        while start >= 0:
+            line = bisect_right(self.line_starts, start) - 1
+            lines.append(line)
+            if line + 1 == line_count:
+                break
+            # 同一行只记录一次，从下一行开始继续查找
+            start = self.buffer.find(pattern, self.line_starts[line + 1])
+        return lines
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick多模式匹配自动机：扫描一遍文本找出所有模式的出现位置
+    纯Python逐字符推进，模式很多时才比逐个模式调用str.find快
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.pattern_count = len(patterns)
+        self.goto = [{}]
+        self.output = [[]]
+        for pattern_id, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = self.goto[state][char] = len(self.goto)
+                    self.goto.append({})
+                    self.output.append([])
+                state = next_state
+            self.output[state].append(pattern_id)
+
+        # 按层次遍历计算失配指针，并合并失配状态的输出
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def line_matches(self, lines: LineBuffer) -> List[array]:
+        """扫描整列文本，返回每个模式出现的行号（升序）"""
+        goto, fail, output = self.goto, self.fail, self.output
+        results = [array('I') for _ in range(self.pattern_count)]
+        last_line = [-1] * self.pattern_count
+        separator = LineBuffer.SEPARATOR
+        state = 0
+        line = 0
+        for char in lines.buffer:
+            if char == separator:
+                line += 1
+                state = 0
+                continue
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_id in output[state]:
+                if last_line[pattern_id] != line:
+                    last_line[pattern_id] = line
+                    results[pattern_id].append(line)
+        return results
+
+
+# 布尔查询的运算符（大小写均可），以及"-词"表示排除
+BOOLEAN_OPERATORS = {"AND": "and", "&": "and", "OR": "or", "|": "or", "NOT": "not", "!": "not"}
+BOOLEAN_TOKEN_PATTERN = re.compile(r'"([^"]*)"|(\()|(\))|([^\s()"]+)')
+
+
+def tokenize_boolean_query(query: str) -> List[Tuple[str, str]]:
+    """将布尔查询切分为(类型, 值)列表，类型为term/and/or/not/(/)"""
+    query = query.replace('“', '"').replace('”', '"').replace('（', '(').replace('）', ')')
+    if query.count('"') % 2:
+        raise ValueError("引号不匹配")
+
+    tokens = []
+    for match in BOOLEAN_TOKEN_PATTERN.finditer(query):
+        phrase, left, right, word = match.groups()
+        if phrase is not None:
+            if phrase:
+                tokens.append(("term", phrase))
+        elif left:
+            tokens.append(("(", left))
+        elif right:
+            tokens.append((")", right))
+        elif word.upper() in BOOLEAN_OPERATORS:
+            tokens.append((BOOLEAN_OPERATORS[word.upper()], word))
+        elif word.startswith('-') and len(word) > 1:
+            tokens.append(("not", "-"))
+            tokens.append(("term", word[1:]))
+        else:
+            tokens.append(("term", word))
+    return tokens
+
+
+def parse_boolean_query(query: str) -> tuple:
+    """
+    解析布尔查询，优先级 NOT > AND > OR，相邻的词默认为AND
+    例如: 皇上 臣妾 NOT 娘娘、"皇上 万岁" OR 臣妾、(甄嬛 | 华妃) -皇上
+
+    Returns:
+        语法树节点: ("term", 词) / ("and", [节点]) / ("or", [节点]) / ("not", 节点)
+    """
+    tokens = tokenize_boolean_query(query)
+    position = 0
+
+    def peek():
+        return tokens[position][0] if position < len(tokens) else None
+
+    def parse_or():
+        nonlocal position
+        children = [parse_and()]
+        while peek() == "or":
+            position += 1
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else ("or", children)
+
+    def parse_and():
+        nonlocal position
+        children = [parse_unary()]
+        while peek() in ("and", "not", "term", "("):
+            if peek() == "and":
+                position += 1
+            children.append(parse_unary())
+        return children[0] if len(children) == 1 else ("and", children)
+
+    def parse_unary():
+        nonlocal position
+        kind = peek()
+        if kind == "not":
+            position += 1
+            return ("not", parse_unary())
+        if kind == "(":
+            position += 1
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError("括号不匹配")
+            position += 1
+            return node
+        if kind == "term":
+            position += 1
+            return ("term", tokens[position - 1][1])
+        raise ValueError("查询语法错误")
+
+    if not tokens:
+        raise ValueError("查询为空")
+    node = parse_or()
+    if position != len(tokens):
+        raise ValueError("查询语法错误")
+    return node
+
+
+def positive_terms(node: tuple) -> List[str]:
+    """布尔查询语法树中不在NOT之下的词（参与相关性评分）"""
+    kind = node[0]
+    if kind == "term":
+        return [node[1]]
+    if kind == "not":
+        return []
+    return [term for child in node[1] for term in positive_terms(child)]
+
+
+def intersect_sorted(small: List[int], large) -> List[int]:
+    """有序位置列表求交集：遍历较短的列表，在较长的列表中二分查找"""
+    if len(small) > len(large):
+        small, large = large, small
+    result = []
+    lo = 0
+    for position in small:
+        lo = bisect_left(large, position, lo)
+        if lo == len(large):
+            break
+        if large[lo] == position:
+            result.append(position)
+    return result
+
+
+class BooleanQueryEvaluator:
+    """
+    在单个剧集上计算布尔查询
+    词的位置列表取自最稀有的字符/二元组倒排表再验证子串；AND按列表大小从小到大计算，
+    之后的词只在已有的少量候选上验证
+    """
+
+    def __init__(self, char_index: QGramIndex, qgram_index: QGramIndex, texts: List[str]):
+        self.char_index = char_index
+        self.qgram_index = qgram_index
+        self.texts = texts
+
+    def rarest_posting(self, term: str):
+        """返回词中最稀有的字符或二元组的倒排表"""
+        if len(term) == 1:
+            return self.char_index.postings.get(term, ())
+        postings = [self.qgram_index.postings.get(gram, ()) for gram in set(iter_qgrams(term, self.qgram_index.q))]
+        return min(postings, key=len)
+
+    def estimate(self, node: tuple) -> int:
+        """估计节点结果的大小，用于安排AND的计算顺序"""
+        kind = node[0]
+        if kind == "term":
+            return len(self.rarest_posting(node[1]))
+        if kind == "and":
+            estimates = [self.estimate(child) for child in node[1] if child[0] != "not"]
+            return min(estimates) if estimates else len(self.texts)
+        if kind == "or":
+            return sum(self.estimate(child) for child in node[1])
+        return len(self.texts)
+
+    def evaluate(self, node: tuple) -> List[int]:
+        """返回满足节点条件的字幕位置（升序）"""
+        kind = node[0]
+        if kind == "term":
+            term = node[1]
+            texts = self.texts
+            posting = self.rarest_posting(term)
+            if len(term) == 1:
+                return list(posting)
+            return [position for position in posting if term in texts[position]]
+        if kind == "or":
+            merged = set()
+            for child in node[1]:
+                merged.update(self.evaluate(child))
+            return sorted(merged)
+        if kind == "not":
+            excluded = set(self.evaluate(node[1]))
+            return [position for position in range(len(self.texts)) if position not in excluded]
+        return self.evaluate_and(node[1])
+
+    def evaluate_and(self, children: List[tuple]) -> List[int]:
+        positives = sorted((child for child in children if child[0] != "not"), key=self.estimate)
+        negatives = [child[1] for child in children if child[0] == "not"]
+
+        result = self.evaluate(positives[0]) if positives else list(range(len(self.texts)))
+        for child in positives[1:] + [("not", child) for child in negatives]:
+            if not result:
+                break
+            result = self.filter(result, child)
+        return result
+
+    def filter(self, positions: List[int], node: tuple) -> List[int]:
+        """在已有候选上应用条件，词直接验证子串，其余节点计算后求交/差集"""
+        texts = self.texts
+        if node[0] == "term":
+            return [position for position in positions if node[1] in texts[position]]
+        if node[0] == "not":
+            inner = node[1]
+            if inner[0] == "term":
+                return [position for position in positions if inner[1] not in texts[position]]
+            excluded = set(self.evaluate(inner))
+            return [position for position in positions if position not in excluded]
+        return intersect_sorted(positions, self.evaluate(node))
+
+
+class BM25Scorer:
+    """
+    基于字符二元组的BM25评分
+    文档频率取自匹配时所用文本列（原文或规范化文本）的各剧集二元组/单字倒排表，各列的平均长度在构建时计算
+    """
+
+    def __init__(self, text_columns: Dict[str, Dict[str, List[str]]], columns: Iterable[str] = ("text", "normalized"),
+                 k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.total_lines = sum(len(drama_columns["text"]) for drama_columns in text_columns.values())
+        self.average_lengths = {}
+        for column in columns:
+            total_length = sum(len(text) for drama_columns in text_columns.values() for text in drama_columns[column])
+            self.average_lengths[column] = total_length / self.total_lines if self.total_lines else 1.0
+
+    def document_frequency(self, term: str, indexes: List[Tuple[QGramIndex, QGramIndex]]) -> int:
+        """包含该二元组（或单字）的字幕条数，indexes为各剧集的(单字倒排索引, 二元组倒排索引)"""
+        return sum(len((chars if len(term) == 1 else qgrams).postings.get(term, ())) for chars, qgrams in indexes)
+
+    def query_terms(self, words: Iterable[str], indexes: List[Tuple[QGramIndex, QGramIndex]]) -> List[Tuple[str, float]]:
+        """
+        将查询词拆分为二元组（单字词保留单字），返回(词, idf)列表
+        words需要与被评分的文本列一致（如规范化文本列使用规范化后的查询）
+        """
+        terms = set()
+        for word in words:
+            terms.update(iter_qgrams(word, 2) if len(word) > 1 else [word])
+
+        weighted = []
+        for term in sorted(terms):
+            df = self.document_frequency(term, indexes)
+            idf = math.log(1 + (self.total_lines - df + 0.5) / (df + 0.5))
+            weighted.append((term, idf))
+        return weighted
+
+    def score(self, text: str, terms: List[Tuple[str, float]], column: str = "text") -> float:
+        """计算一条字幕（column列的文本）的BM25得分"""
+        norm = self.k1 * (1 - self.b + self.b * len(text) / self.average_lengths[column])
+        score = 0.0
+        for term, idf in terms:
+            tf = text.count(term)
+            if tf:
+                score += idf * tf * (self.k1 + 1) / (tf + norm)
+        return score
+
+
+class SuggestionIndex:
+    """
+    输入提示索引：整句和高频短语（2~4字n-gram）按频次排序
+    短语按字典序存入有序数组；长度不超过max_prefix_length的前缀预先计算前top_k条，
+    更长的前缀或超过top_k的请求在有序数组中二分定位再选前k条
+    """
+
+    def __init__(self, texts: Iterable[str], top_k: int = 10, max_prefix_length: int = 3,
+                 min_ngram_count: int = 3, max_line_length: int = 20):
+        self.top_k = top_k
+        self.max_prefix_length = max_prefix_length
+
+        line_counts = {}
+        ngram_counts = {}
+        for text in texts:
+            text = text.strip()
+            if not text:
+                continue
+            if len(text) <= max_line_length:
+                line_counts[text] = line_counts.get(text, 0) + 1
+            for n in range(2, 5):
+                for i in range(len(text) - n + 1):
+                    gram = text[i:i + n]
+                    ngram_counts[gram] = ngram_counts.get(gram, 0) + 1
+
+        entries = dict(line_counts)
+        for gram, count in ngram_counts.items():
+            if count >= min_ngram_count and count > entries.get(gram, 0):
+                entries[gram] = count
+
+        self.phrases = sorted(entries)
+        self.counts = [entries[phrase] for phrase in self.phrases]
+
+        # 预先计算短前缀的前top_k条
+        self.top_by_prefix = {}
+        for length in range(1, max_prefix_length + 1):
+            prefixes = sorted(set(phrase[:length] for phrase in self.phrases if len(phrase) >= length))
+            for prefix in prefixes:
+                self.top_by_prefix[prefix] = self.select(prefix, top_k)
+
+    def select(self, prefix: str, k: int) -> List[int]:
+        """在有序数组中定位前缀范围，选出频次最高的k条（频次相同时短语较短的优先）"""
+        lo = bisect_left(self.phrases, prefix)
+        hi = bisect_left(self.phrases, prefix + '\uffff', lo)
+        return heapq.nsmallest(k, range(lo, hi), key=lambda i: (-self.counts[i], len(self.phrases[i]), i))
+
+    def suggest(self, prefix: str, k: int = None) -> List[Tuple[str, int]]:
+        """返回以prefix开头的前k条(短语, 频次)，短前缀且k不超过top_k时直接取预计算结果"""
+        k = k or self.top_k
+        if not prefix:
+            return []
+        if len(prefix) <= self.max_prefix_length and k <= self.top_k:
+            indexes = self.top_by_prefix.get(prefix, [])[:k]
+        else:
+            indexes = self.select(prefix, k)
+        return [(self.phrases[i], self.counts[i]) for i in indexes]
+
+
+# 常用繁体字 -> 简体字，未安装zhconv时使用
+TRADITIONAL_CHARS = (
+    "們這說麼個來時會為國裡對沒還讓從後見進過開關與話請謝樣點東車長門問間聽覺學愛親現"
+    "實動頭臉無兒錢幾邊電氣號應當將認識嗎歡給讀寫買賣殺爺貴嬪嬤喲啟龍鳳華宮壽萬歲傳惡"
+    "罷體務難聖陽陰隨雖雙麗黃齊處總鐘飯餓藥醫戰軍報黨組織種壞錯聲變戲經員團圓夢樂願懷"
+    "聞兩嚇裏媽帶轉麵筆紅綠藍寶貝衛護險獨餘則寧淚燈遠選達運連"
+)
+SIMPLIFIED_CHARS = (
+    "们这说么个来时会为国里对没还让从后见进过开关与话请谢样点东车长门问间听觉学爱亲现"
+    "实动头脸无儿钱几边电气号应当将认识吗欢给读写买卖杀爷贵嫔嬷哟启龙凤华宫寿万岁传恶"
+    "罢体务难圣阳阴随虽双丽黄齐处总钟饭饿药医战军报党组织种坏错声变戏经员团圆梦乐愿怀"
+    "闻两吓里妈带转面笔红绿蓝宝贝卫护险独余则宁泪灯远选达运连"
+)
+TRADITIONAL_TO_SIMPLIFIED = str.maketrans(TRADITIONAL_CHARS, SIMPLIFIED_CHARS)
+
+
+def script_folding_status() -> Dict:
+    """繁简转换的实现：zhconv覆盖全部繁体字，内置字表只覆盖部分常用字（其他繁体字不会与简体匹配）"""
+    if zhconv_convert is not None:
+        return {"backend": "zhconv", "complete": True}
+    return {"backend": "builtin", "complete": False, "traditional_chars": len(TRADITIONAL_CHARS)}
+
+
+@lru_cache(maxsize=None)
+def fold_char(char: str) -> str:
+    """
+    单个字符的规范化形式：NFKC（全角转半角等）、大小写折叠、繁体转简体，去掉标点、空白和控制字符
+    可能返回空串（被去掉）或多个字符（NFKC展开）
+    """
+    folded = unicodedata.normalize('NFKC', char).casefold()
+    if zhconv_convert is not None:
+        folded = zhconv_convert(folded, 'zh-cn')
+    else:
+        folded = folded.translate(TRADITIONAL_TO_SIMPLIFIED)
+    return ''.join(c for c in folded if unicodedata.category(c)[0] not in 'PZC')
+
+
+def normalize_text(text: str) -> Tuple[str, Optional[array]]:
+    """
+    生成用于搜索的规范化文本
+
+    Returns:
+        (规范化文本, 每个规范化字符对应的原文下标)；与原文逐字对应时下标数组为None
+    """
+    pieces = []
+    offsets = array('I')
+    for i, char in enumerate(text):
+        folded = fold_char(char)
+        pieces.append(folded)
+        offsets.extend([i] * len(folded))
+
+    normalized = ''.join(pieces)
+    if len(normalized) == len(text) and all(offset == i for i, offset in enumerate(offsets)):
+        return normalized, None
+    return normalized, offsets
+
+
+def map_normalized_span(offsets: Optional[array], start: int, end: int) -> Tuple[int, int]:
+    """将规范化文本中的匹配区间[start, end)映射回原文区间"""
+    if offsets is None:
+        return start, end
+    return offsets[start], offsets[end - 1] + 1
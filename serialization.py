@@ -0,0 +1,186 @@
+"""
+serialization.py - JSON序列化与响应压缩
+安装了orjson时使用orjson编码，否则回退到标准库json；中文不转义为\\uXXXX
+字幕行可以在加载时预先编码为JSON片段，响应时直接拼接，不再逐条编码
+导出时NDJSON和CSV都逐行/逐批生成，不在内存中保存完整结果
+"""
+
+import csv
+import gzip
+import io
+import json
+from array import array
+from typing import Any, Iterable, Iterator, List, Optional
+
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_MIMETYPE = "application/json"
+NDJSON_MIMETYPE = "application/x-ndjson"
+CSV_MIMETYPE = "text/csv"
+# 响应体超过该字节数时才压缩，小响应压缩收益不抵开销
+COMPRESSION_MIN_SIZE = 1024
+# 可压缩的响应类型
+COMPRESSIBLE_MIMETYPES = (JSON_MIMETYPE, NDJSON_MIMETYPE, "text/")
+
+
+def default(obj: Any) -> Any:
+    """标准库json无法编码的类型（numpy数值、array等）"""
+    if hasattr(obj, "item"):
+        return obj.item()
+    if isinstance(obj, (array, tuple, set, frozenset)):
+        return list(obj)
+    raise TypeError(f"无法序列化的类型: {type(obj).__name__}")
+
+
+def dumps(obj: Any) -> bytes:
+    """编码为UTF-8 JSON（紧凑格式，按键排序，与jsonify的输出一致）"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default,
+                            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=default, ensure_ascii=False, sort_keys=True,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask的JSON提供者，使jsonify也使用dumps编码"""
+
+    def dumps(self, obj: Any, **kwargs) -> str:
+        return dumps(obj).decode("utf-8")
+
+    def response(self, *args, **kwargs) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
+class FragmentColumn:
+    """
+    预先编码的JSON片段列：所有片段拼接为一个bytes，按偏移数组取出第i条
+    与all_subtitles对齐，用于直接拼接搜索结果
+    """
+
+    def __init__(self, rows: Iterable[Any]):
+        fragments = [dumps(row) for row in rows]
+        self.buffer = b"".join(fragments)
+        self.offsets = array('Q', [0])
+        length = 0
+        for fragment in fragments:
+            length += len(fragment)
+            self.offsets.append(length)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> bytes:
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]]
+
+
+def encode_results(fragments: Iterable[bytes], **fields) -> bytes:
+    """拼接 {"results": [片段...], 其他字段...} 形式的响应体"""
+    parts = [b'{"results":[', b",".join(fragments), b"]"]
+    for key, value in sorted(fields.items()):
+        parts.append(b"," + dumps(key) + b":" + dumps(value))
+    parts.append(b"}")
+    return b"".join(parts)
+
+
+def json_response(body: bytes, status: int = 200) -> Response:
+    """返回已编码的JSON响应"""
+    return Response(body, status=status, mimetype=JSON_MIMETYPE)
+
+
+def ndjson_response(header: dict, fragments: Iterable[bytes]) -> Response:
+    """
+    流式返回NDJSON：第一行为header（总数、游标等），之后每行一条结果
+    逐行生成，客户端收到第一行后即可开始渲染
+    """
+    def generate():
+        yield dumps(header) + b"\n"
+        for fragment in fragments:
+            yield fragment + b"\n"
+
+    return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+
+def iter_ndjson(fragments: Iterable[bytes], batch_size: int = 500) -> Iterator[bytes]:
+    """逐批输出NDJSON，每批batch_size行，减少分块数量"""
+    batch = []
+    for fragment in fragments:
+        batch.append(fragment)
+        if len(batch) == batch_size:
+            batch.append(b"")
+            yield b"\n".join(batch)
+            batch = []
+    if batch:
+        batch.append(b"")
+        yield b"\n".join(batch)
+
+
+def iter_csv(header: List[str], rows: Iterable[List[Any]], batch_size: int = 500) -> Iterator[bytes]:
+    """
+    逐批编码CSV（UTF-8，带BOM便于Excel识别中文），每批batch_size行
+    列表类型的值以"|"连接
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(header)
+    count = 0
+    for row in rows:
+        writer.writerow(['|'.join(value) if isinstance(value, list) else value for value in row])
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """根据Accept-Encoding选择压缩方式，优先brotli"""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress_response(response: Response, accept_encoding: str, min_size: int = COMPRESSION_MIN_SIZE) -> Response:
+    """按大小阈值和客户端支持的编码压缩响应，流式响应和文件响应不压缩"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or "Content-Encoding" in response.headers
+            or not (response.mimetype or "").startswith(COMPRESSIBLE_MIMETYPES)):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+
+    encoding = choose_encoding(accept_encoding or "")
+    if encoding == "br":
+        body = brotli.compress(body, quality=4)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=5)
+    else:
+        return response
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,167 @@
+"""
+serve.py - 多进程部署启动脚本（gunicorn预加载模式）
+主进程执行一次init_data()构建语料和索引，整理为适合共享的布局并冻结GC后再fork工作进程，
+工作进程只读访问主进程中的数据，内存不随工作进程数线性增长
+
+用法:
+    python serve.py --port 8089 --workers 4
+    python serve.py --workers 4 --measure-rss     # 启动服务、发送一批请求后报告每个工作进程的内存
+    python serve.py --workers 4 --measure-rss --no-pack   # 对比不整理语料布局时的内存
+
+也可以直接使用gunicorn命令（必须加--preload，否则每个工作进程各自加载一份语料）:
+    gunicorn --preload -w 4 -b 0.0.0.0:8089 'serve:create_app()'
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+import subtitle_api
+from shared_corpus import freeze_heap, read_memory_stats
+
+# 测量内存时发送的请求（覆盖搜索、随机句子、押韵、相似句子等主要路径）
+BENCHMARK_REQUESTS = [
+    ("/api/search", {"query": "皇上"}),
+    ("/api/search", {"query": "了", "limit": "100"}),
+    ("/api/search", {"query": "huangshang", "mode": "pinyin"}),
+    ("/api/search", {"query": "皇上 臣妾", "mode": "boolean"}),
+    ("/api/search", {"query": "臣妾做不到", "mode": "fuzzy"}),
+    ("/api/search", {"query": "皇上", "rank": "relevance"}),
+    ("/api/random_sentences", {"count": "8"}),
+    ("/api/rhyming_sentences", {"text": "臣妾做不到啊"}),
+    ("/api/similar", {"text": "臣妾做不到"}),
+    ("/api/suggest", {"prefix": "皇"}),
+]
+
+
+def create_app(pack: bool = True):
+    """加载语料并返回Flask应用，在gunicorn主进程中调用一次"""
+    subtitle_api.init_data()
+    if pack:
+        subtitle_api.prepare_shared_corpus()
+    freeze_heap()
+    return subtitle_api.app
+
+
+def run_server(host: str, port: int, workers: int, pack: bool = True):
+    """以预加载模式启动gunicorn"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit("多进程部署需要gunicorn: pip install gunicorn")
+
+    class PreloadedApplication(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "preload_app": True,
+        # 加载大语料时主进程较久才能响应，检索请求也可能较慢
+        "timeout": 120,
+    }
+    PreloadedApplication(create_app(pack), options).run()
+
+
+def child_pids(pid: int):
+    """返回进程的直接子进程（gunicorn工作进程）"""
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # 第4个字段为父进程ID（进程名可能包含空格，从右括号之后解析）
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def measure_rss(port: int, workers: int, pack: bool, rounds: int, startup_timeout: float,
+                merge_threshold: float = None) -> dict:
+    """
+    在子进程中启动服务，等待就绪后发送rounds轮请求（分散到各工作进程），
+    然后读取主进程和每个工作进程的内存统计
+    """
+    command = [sys.executable, os.path.abspath(__file__), "--port", str(port), "--workers", str(workers)]
+    if not pack:
+        command.append("--no-pack")
+    if merge_threshold is not None:
+        command += ["--merge-threshold", str(merge_threshold)]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                urllib.request.urlopen(base_url + "/api/status", timeout=5).read()
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("服务未能启动")
+                time.sleep(0.5)
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for path, params in BENCHMARK_REQUESTS:
+                urllib.request.urlopen(f"{base_url}{path}?{urllib.parse.urlencode(params)}", timeout=120).read()
+        elapsed = time.perf_counter() - started
+
+        master_stats = read_memory_stats(server.pid)
+        worker_stats = {pid: read_memory_stats(pid) for pid in child_pids(server.pid)}
+        return {
+            "workers": workers,
+            "packed": pack,
+            "requests": rounds * len(BENCHMARK_REQUESTS),
+            "seconds": round(elapsed, 3),
+            "master": master_stats,
+            "worker_stats": worker_stats,
+            # 所有进程Pss之和即整个服务实际占用的内存
+            "total_pss": master_stats["pss"] + sum(stats["pss"] for stats in worker_stats.values()),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='以多进程模式启动字幕搜索API服务')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=5000, help='API服务端口号')
+    parser.add_argument('--workers', type=int, default=4, help='工作进程数')
+    parser.add_argument('--merge-threshold', type=float, default=None,
+                        help='合并相邻重复字幕的相似度阈值(0~1)，不指定则不合并')
+    parser.add_argument('--admin-token', default=None, help='管理端点（/api/admin/*）的访问令牌，不指定则管理端点不可用')
+    parser.add_argument('--no-pack', action='store_true', help='不整理语料布局（用于对比内存）')
+    parser.add_argument('--measure-rss', action='store_true', help='启动服务并报告每个工作进程的内存（kB），仅支持Linux')
+    parser.add_argument('--rounds', type=int, default=20, help='测量内存时发送的请求轮数')
+    parser.add_argument('--startup-timeout', type=float, default=600, help='测量内存时等待服务启动的秒数')
+    args = parser.parse_args()
+
+    subtitle_api.SUBTITLE_MERGE_THRESHOLD = args.merge_threshold
+    subtitle_api.ADMIN_TOKEN = args.admin_token
+
+    if args.measure_rss:
+        result = measure_rss(args.port, args.workers, not args.no_pack, args.rounds, args.startup_timeout,
+                             args.merge_threshold)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        run_server(args.host, args.port, args.workers, not args.no_pack)
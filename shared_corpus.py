@@ -0,0 +1,69 @@
+"""
+shared_corpus.py - 多进程部署时共享的只读语料
+主进程加载语料和索引后再fork出工作进程，工作进程与主进程共享这些内存页（写时复制）
+CPython读取对象时会修改对象头部的引用计数，逐条字幕的小对象（字符串、整数）分散在大量内存页上，
+被读取后这些页会被逐渐复制到每个工作进程。这里把它们整理为少量大对象（整列拼接的字符串 + 偏移数组、array），
+读取时只修改对象头部所在的一页，数据所在的页保持共享
+"""
+
+import gc
+import os
+from array import array
+from typing import Dict, Iterable, Iterator
+
+
+class PackedTextColumn:
+    """
+    只读文本列：所有文本拼接为一个字符串，按偏移数组取出第i条
+    只支持非负整数下标、len()和迭代，用于替换text_columns中的文本列表
+    """
+
+    def __init__(self, texts: Iterable[str]):
+        texts = list(texts)
+        self.buffer = ''.join(texts)
+        self.offsets = array('Q', [0])
+        length = 0
+        for text in texts:
+            length += len(text)
+            self.offsets.append(length)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self) -> Iterator[str]:
+        buffer = self.buffer
+        offsets = self.offsets
+        for i in range(len(offsets) - 1):
+            yield buffer[offsets[i]:offsets[i + 1]]
+
+
+def freeze_heap():
+    """
+    fork工作进程之前调用：回收垃圾后把现有对象全部移入永久代
+    之后的垃圾回收不再遍历（也就不再写入）这些对象
+    """
+    gc.collect()
+    gc.freeze()
+
+
+def read_memory_stats(pid: int = None) -> Dict[str, int]:
+    """
+    读取进程的内存统计（kB），来自/proc/<pid>/smaps_rollup，仅支持Linux
+    Pss按共享进程数平摊共享页，多个工作进程的Pss之和即实际占用的内存
+    """
+    path = f"/proc/{pid or os.getpid()}/smaps_rollup"
+    stats = {}
+    with open(path, "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                stats[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        "rss": stats.get("Rss", 0),
+        "pss": stats.get("Pss", 0),
+        "shared": stats.get("Shared_Clean", 0) + stats.get("Shared_Dirty", 0),
+        "private": stats.get("Private_Clean", 0) + stats.get("Private_Dirty", 0),
+    }
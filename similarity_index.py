@@ -0,0 +1,187 @@
+"""
+similarity_index.py - 相似字幕索引
+加载时构建字符n-gram的TF-IDF稀疏矩阵（按列压缩存储），查询时做稀疏矩阵-向量乘法并选出前k条
+语料很大时可选用随机投影（SimHash）LSH预过滤候选，全部离线计算，不需要下载模型
+"""
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 随机投影签名位数，分成若干段做LSH分桶
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 8
+
+
+def iter_ngrams(text: str, ngram_range: Tuple[int, int] = (1, 2)):
+    """产生文本的所有字符n-gram"""
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        for i in range(len(text) - n + 1):
+            yield text[i:i + n]
+
+
+class TfidfIndex:
+    """
+    字符n-gram TF-IDF矩阵
+    行为字幕（按加入顺序编号），列为n-gram；行向量做L2归一化，内积即余弦相似度
+    """
+
+    def __init__(self, texts: List[str], ngram_range: Tuple[int, int] = (1, 2), use_lsh: bool = False,
+                 seed: int = 0):
+        self.ngram_range = ngram_range
+        self.row_count = len(texts)
+        self.vocabulary = {}
+
+        # 逐行统计词频（行主序）
+        row_terms = []
+        row_counts = []
+        row_indptr = [0]
+        for text in texts:
+            counts = {}
+            for gram in iter_ngrams(text, ngram_range):
+                term_id = self.vocabulary.setdefault(gram, len(self.vocabulary))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            row_terms.extend(counts.keys())
+            row_counts.extend(counts.values())
+            row_indptr.append(len(row_terms))
+
+        row_terms = np.array(row_terms, dtype=np.int32)
+        row_indptr = np.array(row_indptr, dtype=np.int64)
+        rows = np.repeat(np.arange(self.row_count, dtype=np.int32), np.diff(row_indptr))
+
+        # 平滑idf，次线性tf
+        document_frequency = np.bincount(row_terms, minlength=len(self.vocabulary))
+        self.idf = (np.log((1 + self.row_count) / (1 + document_frequency)) + 1).astype(np.float32)
+        weights = (1 + np.log(np.array(row_counts, dtype=np.float32))) * self.idf[row_terms]
+
+        # 行向量L2归一化
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=self.row_count))
+        norms[norms == 0] = 1
+        weights = (weights / norms[rows]).astype(np.float32)
+
+        # 转为按列压缩存储，查询时只访问查询中出现的列
+        order = np.argsort(row_terms, kind="stable")
+        self.column_rows = rows[order]
+        self.column_weights = weights[order]
+        self.column_indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(document_frequency, out=self.column_indptr[1:])
+
+        self.lsh_buckets = None
+        if use_lsh:
+            self.row_indptr = row_indptr
+            self.row_terms = row_terms
+            self.row_weights = weights
+            self.build_lsh(seed)
+
+    def query_vector(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """返回查询的(列号数组, 归一化权重数组)，未出现在语料中的n-gram忽略"""
+        counts = {}
+        for gram in iter_ngrams(text, self.ngram_range):
+            term_id = self.vocabulary.get(gram)
+            if term_id is not None:
+                counts[term_id] = counts.get(term_id, 0) + 1
+        term_ids = np.array(list(counts.keys()), dtype=np.int32)
+        weights = (1 + np.log(np.array(list(counts.values()), dtype=np.float32))) * self.idf[term_ids]
+        norm = math.sqrt(float(np.dot(weights, weights))) or 1.0
+        return term_ids, weights / norm
+
+    def scores(self, text: str) -> np.ndarray:
+        """计算查询与所有字幕的余弦相似度（稀疏矩阵-向量乘法）"""
+        term_ids, weights = self.query_vector(text)
+        if len(term_ids) == 0:
+            return np.zeros(self.row_count, dtype=np.float32)
+
+        starts = self.column_indptr[term_ids]
+        ends = self.column_indptr[term_ids + 1]
+        rows = np.concatenate([self.column_rows[start:end] for start, end in zip(starts, ends)])
+        contributions = np.concatenate([self.column_weights[start:end] * weight
+                                        for start, end, weight in zip(starts, ends, weights)])
+        return np.bincount(rows, weights=contributions, minlength=self.row_count)
+
+    def build_lsh(self, seed: int = 0, chunk_rows: int = 50000):
+        """
+        构建随机投影签名并按段分桶
+        分块计算，避免为整个矩阵分配 (非零元素数 × 签名位数) 的临时数组
+        """
+        random_state = np.random.RandomState(seed)
+        self.projection = random_state.standard_normal((len(self.vocabulary), SIMHASH_BITS)).astype(np.float32)
+        band_width = SIMHASH_BITS // SIMHASH_BANDS
+
+        signatures = np.zeros((self.row_count, SIMHASH_BITS), dtype=bool)
+        for chunk_start in range(0, self.row_count, chunk_rows):
+            chunk_end = min(chunk_start + chunk_rows, self.row_count)
+            lo, hi = self.row_indptr[chunk_start], self.row_indptr[chunk_end]
+            rows = np.repeat(np.arange(chunk_end - chunk_start), np.diff(self.row_indptr[chunk_start:chunk_end + 1]))
+            projected = np.zeros((chunk_end - chunk_start, SIMHASH_BITS), dtype=np.float32)
+            np.add.at(projected, rows, self.projection[self.row_terms[lo:hi]] * self.row_weights[lo:hi, None])
+            signatures[chunk_start:chunk_end] = projected > 0
+
+        self.lsh_buckets = []
+        for band in range(SIMHASH_BANDS):
+            keys = np.packbits(signatures[:, band * band_width:(band + 1) * band_width], axis=1)[:, 0]
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            boundaries = np.flatnonzero(np.diff(sorted_keys)) + 1
+            buckets = {}
+            for group in np.split(order, boundaries):
+                if len(group):
+                    buckets[int(keys[group[0]])] = group
+            self.lsh_buckets.append(buckets)
+
+    def lsh_candidates(self, text: str) -> np.ndarray:
+        """返回与查询至少在一段签名上相同的字幕行号"""
+        term_ids, weights = self.query_vector(text)
+        if len(term_ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        signature = (weights @ self.projection[term_ids]) > 0
+        band_width = SIMHASH_BITS // SIMHASH_BANDS
+        groups = []
+        for band, buckets in enumerate(self.lsh_buckets):
+            key = int(np.packbits(signature[band * band_width:(band + 1) * band_width])[0])
+            if key in buckets:
+                groups.append(buckets[key])
+        return np.unique(np.concatenate(groups)) if groups else np.zeros(0, dtype=np.int64)
+
+    def candidate_scores(self, text: str, candidates: np.ndarray) -> np.ndarray:
+        """只计算候选行的余弦相似度（按行访问）"""
+        term_ids, weights = self.query_vector(text)
+        query_weights = dict(zip(term_ids.tolist(), weights.tolist()))
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        for i, row in enumerate(candidates):
+            start, end = self.row_indptr[row], self.row_indptr[row + 1]
+            scores[i] = sum(query_weights.get(term, 0.0) * weight
+                            for term, weight in zip(self.row_terms[start:end].tolist(),
+                                                    self.row_weights[start:end].tolist()))
+        return scores
+
+    def top_k(self, text: str, k: int = 10, row_mask: Optional[np.ndarray] = None,
+              approximate: bool = False) -> List[Tuple[int, float]]:
+        """
+        返回与查询最相似的k条字幕
+
+        Args:
+            row_mask: 布尔数组，只在为True的行中选择
+            approximate: 使用LSH预过滤（需要构建时启用use_lsh）
+
+        Returns:
+            按相似度降序的(行号, 相似度)列表，不包含相似度为0的行
+        """
+        if approximate and self.lsh_buckets is not None:
+            rows = self.lsh_candidates(text)
+            if row_mask is not None:
+                rows = rows[row_mask[rows]]
+            scores = self.candidate_scores(text, rows)
+        else:
+            scores = self.scores(text)
+            if row_mask is not None:
+                scores = np.where(row_mask, scores, 0)
+            rows = np.arange(self.row_count)
+
+        if len(scores) > k:
+            selected = np.argpartition(-scores, k)[:k]
+        else:
+            selected = np.arange(len(scores))
+        selected = selected[np.argsort(-scores[selected], kind="stable")]
+        return [(int(rows[i]), float(scores[i])) for i in selected if scores[i] > 0]
@@ -1,21 +1,42 @@
 import os
 import json
+import math
 import re
 import uuid
 import random
 import subprocess
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
 from data_loader import DataLoader
 from typing import List, Dict, Any, Optional
 import time
 import fnmatch
+import threading
+import heapq
+import itertools
+import hmac
+import numpy as np
+from array import array
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right
 from drama_config import get_drama_config, get_drama_list, DEFAULT_DRAMA, get_video_root
-
-# 拼音处理库
-from pypinyin import pinyin, Style
+from result_cache import ResultCache, make_key
+from similarity_index import TfidfIndex
+from rhyme_table import RhymeTable, RHYME_TABLE_FILE
+from shared_corpus import PackedTextColumn
+from metrics import MetricsRegistry
+from profiler import PROFILE_MODES, DEFAULT_SAMPLE_INTERVAL, RequestProfiler
+from serialization import (CSV_MIMETYPE, NDJSON_MIMETYPE, FastJSONProvider, FragmentColumn, compress_response,
+                           dumps, encode_results, iter_csv, iter_ndjson, json_response, ndjson_response)
+from search_index import (PinyinIndex, QGramIndex, BooleanQueryEvaluator, BM25Scorer, SuggestionIndex,
+                          AhoCorasick, LineBuffer, HANZI_PATTERN, build_pinyin_matcher,
+                          bounded_substring_distance, default_max_distance, intersect_sorted, map_normalized_span,
+                          max_filtered_distance,
+                          normalize_text, parse_boolean_query, positive_terms, script_folding_status)
 
 app = Flask(__name__)
+# 使用orjson（未安装时为标准库json）编码响应
+app.json = FastJSONProvider(app)
 # 明确允许所有域的CORS请求
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
@@ -31,12 +52,105 @@ os.makedirs(MERGED_OUTPUT_DIR, exist_ok=True)
 drama_loaders = {}
 # 缓存所有集数数据，避免重复加载 - 每个剧集一个缓存
 episode_data_cache = {}
-# 存储所有字幕，用于快速搜索 - 每个剧集一个列表
+# 存储所有字幕，用于快速搜索 - 每个剧集一个列表，按(集数, 开始时间)排序
 all_subtitles = {}  
+# 人物 -> 字幕位置倒排表 - 每个剧集一个字典，位置为all_subtitles中的下标（升序）
+speaker_index = {}
+# 每集字幕在all_subtitles中的起始下标、开始时间数组，以及整集拼接文本和每行在其中的偏移
+# - 每个剧集一个字典，用于二分查找上下文和跨行搜索
+episode_index = {}
+# 每条字幕预先编码的JSON片段（与all_subtitles对齐） - 每个剧集一个FragmentColumn，搜索结果直接拼接
+line_fragments = {}
+# 每条字幕所属集数的序号列（与all_subtitles对齐） - 每个剧集一个列表，用于分面计数
+episode_column = {}
+# 供搜索匹配的文本列（与all_subtitles对齐） - 每个剧集一个字典: 列名 -> 文本列表
+# "normalized"为繁转简、全角转半角、去标点后的规范化文本
+text_columns = {}
+# 拼音索引 - 每个剧集一个PinyinIndex
+pinyin_index = {}
+# 字符二元组倒排索引 - 每个剧集一个QGramIndex，用于模糊搜索的候选过滤
+qgram_index = {}
+# 单字倒排索引 - 每个剧集一个QGramIndex(q=1)，用于布尔查询中的单字词
+char_index = {}
+# 相关性排序使用的BM25评分器（全部剧集共享统计信息）
+bm25_scorer = None
+# 相似字幕索引（全部剧集一个TF-IDF矩阵），以及每个剧集在矩阵中的起始行号（按剧集ID排序）
+similarity_index = None
+similarity_row_offsets = []
+# 字幕总数超过该值时为相似字幕索引构建LSH预过滤
+SIMILARITY_LSH_MIN_LINES = 500000
+# 输入提示索引（全部剧集共享）
+suggestion_index = None
+# 合并OCR重复字幕的相似度阈值，None表示不合并（可通过--merge-threshold设置）
+SUBTITLE_MERGE_THRESHOLD = None
+# 去除句末语气词后的字幕长度（升序）及对应的字幕位置 - 每个剧集一个字典，用于随机抽句
+length_pools = {}
+# 随机抽句会话ID -> 已返回的(剧集ID, 位置)集合，用于会话内不放回抽样
+random_sessions = OrderedDict()
+random_sessions_lock = threading.Lock()
+MAX_RANDOM_SESSIONS = 1024
+# 字 -> 韵母查找表，加载时生成或从数据目录读取
+rhyme_table = RhymeTable()
+# 句末韵母 -> 字幕位置（升序） - 每个剧集一个字典，押韵查找和接龙只需遍历同韵母的字幕
+rhyme_groups = {}
+# 押韵接龙的默认束宽和时间预算（秒）
+RHYME_CHAIN_BEAM_WIDTH = 8
+RHYME_CHAIN_TIME_BUDGET = 2.0
+# 押韵接龙每评分这么多条候选检查一次是否超时（一个韵母分组可能很大）
+RHYME_CHAIN_DEADLINE_INTERVAL = 256
+# 从语料中挖掘的真实对话 - 每个剧集一个字典:
+# "replies": 原句文本 -> 紧随其后的回应位置; "turn_pools"/"adjacent_pools": 原句提示类别 -> 回应位置
+# turn_pools只包含人名发生变化的相邻字幕（确认换人说话），adjacent_pools为其他相邻字幕
+dialogue_index = {}
+# 两条字幕间隔不超过该秒数时视为一问一答
+DIALOGUE_PAIR_MAX_GAP = 2.0
+# 句末语气词
+MODAL_PARTICLE_PATTERN = re.compile(r'[啊呢吗吧呀嘛哦哎嗯呐呵呦诶哈哟了]$')
+# 查询结果缓存 - 数据重新加载时版本号递增
+result_cache = ResultCache()
+# 运行指标（Prometheus格式，由/api/metrics导出），每个进程各自统计
+metrics = MetricsRegistry()
+metrics.describe("subtitle_api_requests_total", "counter", "按路由和状态码统计的请求数")
+metrics.describe("subtitle_api_request_duration_seconds", "histogram", "按路由统计的请求耗时（秒）")
+metrics.describe("subtitle_api_requests_in_flight", "gauge", "正在处理的请求数")
+metrics.describe("subtitle_api_ffmpeg_runs_total", "counter", "按类型(clip/merge/transcode/probe)和结果统计的ffmpeg调用次数")
+metrics.describe("subtitle_api_ffmpeg_duration_seconds", "histogram", "按类型统计的ffmpeg调用耗时（秒）",
+                 buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+metrics.describe("subtitle_api_ffmpeg_in_flight", "gauge", "正在运行的ffmpeg进程数")
+metrics.describe("subtitle_api_clip_cache_requests_total", "counter", "视频片段缓存命中(hit)/未命中(miss)次数")
+metrics.describe("subtitle_api_result_cache_requests_total", "counter", "查询结果缓存命中(hit)/未命中(miss)次数")
+metrics.describe("subtitle_api_corpus_subtitles", "gauge", "每个剧集的字幕条数")
+metrics.describe("subtitle_api_corpus_episodes", "gauge", "每个剧集的集数")
+metrics.describe("subtitle_api_span_duration_seconds", "histogram", "押韵、对话等路径中各阶段（候选收集、评分、排序、序列化）的耗时（秒）")
+# 按需开启的请求性能分析（/api/admin/profiler），span耗时同时记入指标
+profiler = RequestProfiler()
+profiler.on_span = lambda name, elapsed: metrics.observe("subtitle_api_span_duration_seconds", elapsed,
+                                                        (("span", name),))
+# 管理端点（/api/admin/*）的访问令牌，None表示管理端点全部拒绝访问（可通过--admin-token设置）
+ADMIN_TOKEN = None
+
+# 支持的搜索模式
+SEARCH_MODES = ("text", "pinyin", "fuzzy", "boolean", "cross_line")
+# 整列拼接文本 - (剧集ID, 列名) -> LineBuffer，批量搜索时按需构建
+line_buffers = {}
+# 规范化文本上的倒排索引 - 剧集ID -> (单字QGramIndex, 二元组QGramIndex)，布尔查询第一次使用时构建
+normalized_indexes = {}
+# 批量搜索中同一列的字面量模式达到该数量时用Aho-Corasick自动机扫描一遍，否则逐个模式在拼接文本上查找
+AHO_CORASICK_MIN_PATTERNS = 100
+# 批量搜索一次最多的查询数
+MAX_BATCH_QUERIES = 1000
+# 导出支持的搜索模式和列
+EXPORT_MODES = ("text", "pinyin", "boolean")
+EXPORT_COLUMNS = ("drama_id", "episode", "start_time", "end_time", "start_seconds", "end_seconds", "text", "speakers")
+# 跨行搜索默认允许的相邻字幕间隔（秒）
+DEFAULT_MAX_LINE_GAP = 1.5
 
 def init_data():
     """初始化加载所有数据"""
-    global drama_loaders, episode_data_cache, all_subtitles
+    global drama_loaders, episode_data_cache, all_subtitles, speaker_index, episode_index, episode_column
+    global text_columns, pinyin_index, qgram_index, char_index, bm25_scorer
+    global similarity_index, similarity_row_offsets, suggestion_index, length_pools, rhyme_groups, dialogue_index
+    global line_fragments
     
     # 获取所有剧集列表
     dramas = get_drama_list()
@@ -46,12 +160,15 @@ def init_data():
         print(f"正在加载剧集 {drama['name']} ({drama_id}) 的数据...")
         
         # 为每个剧集初始化加载器
-        loader = DataLoader(drama_id=drama_id)
+        loader = DataLoader(drama_id=drama_id, merge_threshold=SUBTITLE_MERGE_THRESHOLD)
         drama_loaders[drama_id] = loader
         
         # 初始化剧集的缓存
         episode_data_cache[drama_id] = {}
         all_subtitles[drama_id] = []
+        speaker_index[drama_id] = {}
+        episode_index[drama_id] = {}
+        episode_column[drama_id] = []
         
         # 加载剧集的所有集数
         episodes = loader.load_episode_list()
@@ -61,8 +178,11 @@ def init_data():
             episode_data = loader.load_episode_data(episode)
             episode_data_cache[drama_id][episode] = episode_data
             
+            # 将人名区间与字幕关联（扫描线）
+            episode_speakers = loader.attribute_speakers(episode_data["subtitles"], episode_data["names"])
+            
             # 收集字幕
-            for subtitle in episode_data["subtitles"]:
+            for subtitle, speakers in zip(episode_data["subtitles"], episode_speakers):
                 all_subtitles[drama_id].append({
                     "drama_id": drama_id, 
                     "episode": episode,
@@ -70,17 +190,454 @@ def init_data():
                     "end_time": subtitle["end_time"],
                     "text": subtitle["text"],
                     "start_seconds": loader.timestamp_to_seconds(subtitle["start_time"]),
-                    "end_seconds": loader.timestamp_to_seconds(subtitle["end_time"])
+                    "end_seconds": loader.timestamp_to_seconds(subtitle["end_time"]),
+                    "speakers": speakers
                 })
         
+        # 按集数和时间排序，使字幕下标顺序与搜索结果顺序一致
+        all_subtitles[drama_id].sort(key=lambda x: (x["episode"], x["start_seconds"]))
+        
+        # 预先编码每条字幕的JSON
+        line_fragments[drama_id] = FragmentColumn(all_subtitles[drama_id])
+        
+        # 构建人物倒排表和每集位置数组
+        for position, subtitle in enumerate(all_subtitles[drama_id]):
+            for speaker in subtitle["speakers"]:
+                speaker_index[drama_id].setdefault(speaker, []).append(position)
+            
+            episode_positions = episode_index[drama_id].setdefault(subtitle["episode"], {"offset": position, "starts": []})
+            episode_positions["starts"].append(subtitle["start_seconds"])
+            episode_column[drama_id].append(len(episode_index[drama_id]) - 1)
+        episode_column[drama_id] = array('I', episode_column[drama_id])
+        
+        # 每集拼接文本，用于匹配被OCR拆成多行的句子
+        for episode_positions in episode_index[drama_id].values():
+            offset = episode_positions["offset"]
+            texts = [subtitle["text"] for subtitle in all_subtitles[drama_id][offset:offset + len(episode_positions["starts"])]]
+            episode_positions["buffer"], episode_positions["line_offsets"] = join_episode_lines(texts)
+        
+        # 预先计算拼音和二元组倒排索引，查询时不再转换
+        pinyin_index[drama_id] = PinyinIndex()
+        qgram_index[drama_id] = QGramIndex()
+        char_index[drama_id] = QGramIndex(q=1)
+        for position, subtitle in enumerate(all_subtitles[drama_id]):
+            pinyin_index[drama_id].add(subtitle["text"])
+            qgram_index[drama_id].add(position, subtitle["text"])
+            char_index[drama_id].add(position, subtitle["text"])
+        
+        text_columns[drama_id] = {
+            "text": [subtitle["text"] for subtitle in all_subtitles[drama_id]],
+            "normalized": [normalize_text(subtitle["text"])[0] for subtitle in all_subtitles[drama_id]],
+            "pinyin": pinyin_index[drama_id].syllable_texts,
+            "initials": pinyin_index[drama_id].initials_texts
+        }
+        
+        # 每集规范化文本的拼接，跨行搜索默认在规范化文本上匹配（与普通搜索一致）
+        for episode_positions in episode_index[drama_id].values():
+            offset = episode_positions["offset"]
+            texts = text_columns[drama_id]["normalized"][offset:offset + len(episode_positions["starts"])]
+            episode_positions["normalized_buffer"], episode_positions["normalized_line_offsets"] = join_episode_lines(texts)
+        
+        # 去除语气词后的长度，按长度排序后随机抽句只需二分查找区间
+        clean_lengths = [len(MODAL_PARTICLE_PATTERN.sub('', text)) for text in text_columns[drama_id]["text"]]
+        order = sorted(range(len(clean_lengths)), key=clean_lengths.__getitem__)
+        length_pools[drama_id] = {
+            "lengths": array('I', [clean_lengths[position] for position in order]),
+            "positions": array('I', order)
+        }
+        
+        # 挖掘相邻字幕组成的对话
+        dialogue_index[drama_id] = build_dialogue_index(all_subtitles[drama_id])
+        
         print(f"剧集 {drama['name']} 数据加载完成，共 {len(episodes)} 集，{len(all_subtitles[drama_id])} 条字幕")
+        
+        if loader.merge_threshold is not None and loader.compaction_stats["input"]:
+            before = loader.compaction_stats["input"]
+            after = loader.compaction_stats["output"]
+            print(f"重复字幕合并: {before} -> {after} 条，减少 {(before - after) / before:.1%}")
     
     # 计算加载的总数据
     total_episodes = sum(len(episodes) for episodes in episode_data_cache.values())
     total_subtitles = sum(len(subtitles) for subtitles in all_subtitles.values())
     print(f"所有数据加载完成，共 {len(drama_loaders)} 个剧集，{total_episodes} 集，{total_subtitles} 条字幕")
+    
+    script_folding = script_folding_status()
+    if not script_folding["complete"]:
+        print(f"警告: 未安装zhconv，繁简转换只使用内置的 {script_folding['traditional_chars']} 个常用繁体字，"
+              f"其他繁体字不会与简体匹配（pip install zhconv）")
+    
+    bm25_scorer = BM25Scorer(text_columns)
+    
+    # 构建相似字幕索引
+    similarity_row_offsets = []
+    similarity_texts = []
+    for drama_id in sorted(all_subtitles):
+        similarity_row_offsets.append((len(similarity_texts), drama_id))
+        similarity_texts.extend(text_columns[drama_id]["text"])
+    similarity_index = TfidfIndex(similarity_texts, use_lsh=len(similarity_texts) >= SIMILARITY_LSH_MIN_LINES)
+    
+    # 构建输入提示索引
+    suggestion_index = SuggestionIndex(similarity_texts)
+    
+    # 韵母表：每个数据目录保存该目录下剧集用到的字
+    rhyme_chars = {}
+    for drama_id, loader in drama_loaders.items():
+        chars = rhyme_chars.setdefault(loader.base_path / RHYME_TABLE_FILE, set())
+        for text in text_columns[drama_id]["text"]:
+            chars.update(text)
+    for path, chars in rhyme_chars.items():
+        saved = RhymeTable()
+        saved.load(path)
+        rhyme_table.finals.update(saved.finals)
+        added = rhyme_table.ensure(chars)
+        if saved.finals.keys() != chars:
+            try:
+                rhyme_table.save(path, chars)
+            except OSError as e:
+                print(f"保存韵母表出错 {path}: {e}")
+        print(f"韵母表 {path}: {len(chars)} 个字，新生成 {added} 个")
+    
+    # 按句末韵母分组
+    for drama_id in drama_loaders:
+        rhyme_groups[drama_id] = {}
+        for position, text in enumerate(text_columns[drama_id]["text"]):
+            rhyme = get_last_char_rhyme(text)
+            if rhyme:
+                rhyme_groups[drama_id].setdefault(rhyme, array('I')).append(position)
+    
+    # 语料已变化，使旧的查询结果失效
+    line_buffers.clear()
+    normalized_indexes.clear()
+    result_cache.bump_version()
+    with random_sessions_lock:
+        random_sessions.clear()
+
+def join_episode_lines(texts: List[str]) -> tuple:
+    """拼接一集的字幕文本，返回(拼接文本, 每行在其中的起始偏移)"""
+    line_offsets = []
+    length = 0
+    for text in texts:
+        line_offsets.append(length)
+        length += len(text)
+    return ''.join(texts), line_offsets
 
-def search_subtitles(query: str, drama_ids: List[str] = None, case_sensitive: bool = False, use_regex: bool = False) -> List[Dict]:
+def prepare_shared_corpus():
+    """
+    多进程部署时在主进程中调用（init_data之后、fork之前）
+    把文本列、人物/集数倒排表和输入提示索引中的字符串和整数列表换成少量大对象，
+    工作进程读取时不会因引用计数把共享内存页复制一份；同时释放只用于统计集数的逐集解析结果
+    
+    all_subtitles中逐条字幕的dict，以及押韵分组、对话挖掘、人物倒排表等以文本或人名为键的dict仍是逐条的Python对象：
+    押韵、对话、上下文等接口读取字幕dict，被读到的字幕所在的内存页在该工作进程中会被复制。
+    这些dict的值已经是array，按键查找不会修改键的引用计数，只有遍历时才会
+    """
+    for drama_id in all_subtitles:
+        columns = text_columns[drama_id]
+        for name in list(columns):
+            columns[name] = PackedTextColumn(columns[name])
+        pinyin_index[drama_id].syllable_texts = columns["pinyin"]
+        pinyin_index[drama_id].initials_texts = columns["initials"]
+        
+        for speaker, positions in speaker_index[drama_id].items():
+            speaker_index[drama_id][speaker] = array('I', positions)
+        for episode_positions in episode_index[drama_id].values():
+            episode_positions["starts"] = array('d', episode_positions["starts"])
+            episode_positions["line_offsets"] = array('I', episode_positions["line_offsets"])
+            episode_positions["normalized_line_offsets"] = array('I', episode_positions["normalized_line_offsets"])
+        
+        # 只保留集数列表（/api/status使用）
+        episode_data_cache[drama_id] = dict.fromkeys(episode_data_cache[drama_id])
+    
+    if suggestion_index is not None:
+        suggestion_index.phrases = PackedTextColumn(suggestion_index.phrases)
+        suggestion_index.counts = array('I', suggestion_index.counts)
+        for prefix, indexes in suggestion_index.top_by_prefix.items():
+            suggestion_index.top_by_prefix[prefix] = array('I', indexes)
+    
+    # 批量搜索使用的拼接文本和布尔查询使用的规范化文本倒排索引在主进程中构建，工作进程共享
+    for drama_id in all_subtitles:
+        for column in ("text", "normalized"):
+            get_line_buffer(drama_id, column)
+        get_posting_indexes(drama_id, "normalized")
+
+def get_target_dramas(drama_ids: List[str] = None) -> List[str]:
+    """确定要处理的剧集列表（按剧集ID排序，与搜索结果顺序一致）"""
+    if drama_ids is None or len(drama_ids) == 0:
+        return sorted(all_subtitles.keys())
+    return sorted(set(drama_id for drama_id in drama_ids if drama_id in all_subtitles))
+
+def get_candidate_positions(drama_id: str, speaker: str = None):
+    """
+    获取剧集中待匹配的字幕位置（升序）
+    指定人物时直接取人物倒排表，不再扫描整部剧集
+    """
+    if not speaker:
+        return range(len(all_subtitles.get(drama_id, [])))
+    return speaker_index.get(drama_id, {}).get(speaker, [])
+
+def build_text_matcher(query: str, case_sensitive: bool = False, use_regex: bool = False):
+    """构建字幕文本匹配函数，正则表达式无效时回退到普通搜索"""
+    if use_regex:
+        try:
+            flags = 0 if case_sensitive else re.IGNORECASE
+            return re.compile(query, flags).search
+        except re.error:
+            print(f"正则表达式错误: {query}，回退到普通搜索")
+    
+    if case_sensitive:
+        return lambda text: query in text
+    return re.compile(re.escape(query), re.IGNORECASE).search
+
+def use_normalized_text(query: str, case_sensitive: bool = False, use_regex: bool = False,
+                        exact: bool = False) -> bool:
+    """普通文本搜索默认在规范化文本上匹配；区分大小写、正则、精确匹配或查询只有标点时使用原文"""
+    return not (exact or case_sensitive or use_regex) and bool(normalize_text(query)[0])
+
+def locate_match(text: str, query: str, case_sensitive: bool = False, use_regex: bool = False,
+                 exact: bool = False) -> Optional[tuple]:
+    """返回查询在原文中的匹配区间(start, end)，规范化匹配时映射回原文下标"""
+    if use_normalized_text(query, case_sensitive, use_regex, exact):
+        normalized, offsets = normalize_text(text)
+        normalized_query = normalize_text(query)[0]
+        start = normalized.find(normalized_query)
+        if start < 0:
+            return None
+        return map_normalized_span(offsets, start, start + len(normalized_query))
+    
+    flags = 0 if case_sensitive else re.IGNORECASE
+    try:
+        pattern = re.compile(query if use_regex else re.escape(query), flags)
+    except re.error:
+        pattern = re.compile(re.escape(query), flags)
+    match = pattern.search(text)
+    return match.span() if match else None
+
+def with_match_offsets(results: List[Dict], query: str, case_sensitive: bool = False, use_regex: bool = False,
+                       exact: bool = False) -> List[Dict]:
+    """为结果添加匹配区间match_start/match_end（返回新的字典，不修改共享的字幕数据）"""
+    located = []
+    for subtitle in results:
+        span = locate_match(subtitle["text"], query, case_sensitive, use_regex, exact)
+        located.append(dict(subtitle, match_start=span[0] if span else None, match_end=span[1] if span else None))
+    return located
+
+def build_search_matcher(query: str, case_sensitive: bool = False, use_regex: bool = False, mode: str = "text",
+                         exact: bool = False) -> List[tuple]:
+    """
+    返回[(要匹配的文本列名, 匹配函数), ...]，用于逐条扫描的搜索模式（text、pinyin）
+    拼音查询可能有全拼和首字母两种读法，任一读法匹配即命中
+    """
+    if mode == "pinyin":
+        return build_pinyin_matcher(query, pinyin_index)
+    if use_normalized_text(query, case_sensitive, use_regex, exact):
+        normalized_query = normalize_text(query)[0]
+        return [("normalized", lambda text: normalized_query in text)]
+    return [("text", build_text_matcher(query, case_sensitive, use_regex))]
+
+def iter_matching_positions(drama_id: str, readings: List[tuple], candidates):
+    """产生候选位置中任一读法匹配的位置（多数查询只有一种读法，直接匹配该列）"""
+    if len(readings) == 1:
+        column, matcher = readings[0]
+        texts = text_columns[drama_id][column]
+        return (position for position in candidates if matcher(texts[position]))
+    columns = [(text_columns[drama_id][column], matcher) for column, matcher in readings]
+    return (position for position in candidates if any(matcher(texts[position]) for texts, matcher in columns))
+
+def get_posting_indexes(drama_id: str, column: str = "text") -> tuple:
+    """
+    获取剧集某一文本列的(单字倒排索引, 二元组倒排索引)
+    原文的索引在加载时构建，规范化文本的索引第一次使用时构建
+    """
+    if column == "text":
+        return char_index[drama_id], qgram_index[drama_id]
+    indexes = normalized_indexes.get(drama_id)
+    if indexes is None:
+        chars, qgrams = QGramIndex(q=1), QGramIndex()
+        for position, text in enumerate(text_columns[drama_id][column]):
+            chars.add(position, text)
+            qgrams.add(position, text)
+        indexes = normalized_indexes[drama_id] = (chars, qgrams)
+    return indexes
+
+def normalize_boolean_terms(node: tuple) -> tuple:
+    """规范化布尔查询语法树中的每个词，词只有标点时抛出ValueError"""
+    kind = node[0]
+    if kind == "term":
+        term = normalize_text(node[1])[0]
+        if not term:
+            raise ValueError(f"查询词只有标点: {node[1]}")
+        return ("term", term)
+    if kind == "not":
+        return ("not", normalize_boolean_terms(node[1]))
+    return (kind, [normalize_boolean_terms(child) for child in node[1]])
+
+def parse_search_boolean_query(query: str, case_sensitive: bool = False, use_regex: bool = False,
+                               exact: bool = False) -> tuple:
+    """
+    解析布尔查询，返回(要匹配的文本列名, 语法树)
+    与普通搜索一样默认在规范化文本上匹配（词也规范化），区分大小写时在原文上匹配；
+    倒排表无法支持正则和不区分大小写的原文匹配，格式错误或选项无法满足时抛出ValueError
+    """
+    if use_regex:
+        raise ValueError("布尔查询不支持正则表达式")
+    node = parse_boolean_query(query)
+    if case_sensitive:
+        return "text", node
+    if exact:
+        raise ValueError("按原文匹配（exact=true）时需要同时指定case_sensitive=true")
+    return "normalized", normalize_boolean_terms(node)
+
+def evaluate_boolean_query(drama_id: str, column: str, node: tuple, speaker: str = None) -> List[int]:
+    """在剧集的某一文本列上计算布尔查询，返回升序位置列表"""
+    evaluator = BooleanQueryEvaluator(*get_posting_indexes(drama_id, column), text_columns[drama_id][column])
+    positions = evaluator.evaluate(node)
+    if speaker:
+        positions = intersect_sorted(positions, get_candidate_positions(drama_id, speaker))
+    return positions
+
+def get_search_matches(query: str, drama_ids: List[str] = None, case_sensitive: bool = False,
+                       use_regex: bool = False, speaker: str = None, mode: str = "text",
+                       exact: bool = False) -> List[tuple]:
+    """
+    获取匹配字幕的位置，结果按查询参数缓存
+    
+    Args:
+        mode: 搜索模式，"text"匹配原文，"pinyin"匹配预先计算的拼音或首字母，
+              "boolean"按布尔查询（AND/OR/NOT/引号短语）在倒排表上求交并集
+        exact: 普通文本搜索时按原文匹配，不使用规范化文本
+    
+    Returns:
+        按剧集ID排序的(drama_id, positions)列表，positions为all_subtitles[drama_id]中的升序下标数组
+    """
+    def compute():
+        if mode == "boolean":
+            return compute_boolean()
+        
+        readings = build_search_matcher(query, case_sensitive, use_regex, mode, exact)
+        
+        matches = []
+        for drama_id in get_target_dramas(drama_ids):
+            positions = array('I', iter_matching_positions(drama_id, readings,
+                                                           get_candidate_positions(drama_id, speaker)))
+            if positions:
+                matches.append((drama_id, positions))
+        return matches
+    
+    def compute_boolean():
+        column, node = parse_search_boolean_query(query, case_sensitive, use_regex, exact)
+        matches = []
+        for drama_id in get_target_dramas(drama_ids):
+            positions = evaluate_boolean_query(drama_id, column, node, speaker)
+            if positions:
+                matches.append((drama_id, array('I', positions)))
+        return matches
+    
+    key = make_key(query, drama_ids, case_sensitive, use_regex, speaker, mode, exact)
+    return result_cache.get_or_compute("search", key, compute)
+
+def iter_search_positions(query: str, drama_ids: List[str] = None, case_sensitive: bool = False,
+                          use_regex: bool = False, speaker: str = None, mode: str = "text", exact: bool = False):
+    """
+    逐条产生匹配字幕的(drama_id, position)，顺序与搜索结果一致
+    边扫描边产生，不缓存也不保存完整的匹配列表，用于导出大量结果；query为空时产生全部字幕
+    布尔查询需要在倒排表上求交并集，每次保存一个剧集的匹配位置
+    """
+    if mode == "boolean":
+        column, node = parse_search_boolean_query(query, case_sensitive, use_regex, exact)
+        for drama_id in get_target_dramas(drama_ids):
+            for position in evaluate_boolean_query(drama_id, column, node, speaker):
+                yield drama_id, position
+        return
+    
+    readings = build_search_matcher(query, case_sensitive, use_regex, mode, exact) if query else None
+    for drama_id in get_target_dramas(drama_ids):
+        candidates = get_candidate_positions(drama_id, speaker)
+        positions = iter_matching_positions(drama_id, readings, candidates) if readings else candidates
+        for position in positions:
+            yield drama_id, position
+
+def get_line_buffer(drama_id: str, column: str) -> LineBuffer:
+    """获取剧集某一文本列的拼接文本，第一次使用时构建"""
+    line_buffer = line_buffers.get((drama_id, column))
+    if line_buffer is None:
+        line_buffer = line_buffers[(drama_id, column)] = LineBuffer(text_columns[drama_id][column])
+    return line_buffer
+
+def get_literal_pattern(query: str, case_sensitive: bool = False, use_regex: bool = False, mode: str = "text",
+                        exact: bool = False) -> Optional[tuple]:
+    """
+    可以在拼接文本上直接查找的字面量查询返回(列名, 模式)，否则返回None
+    不区分大小写的原文匹配按正则规则比较，仍然逐条匹配
+    """
+    if mode != "text" or use_regex or LineBuffer.SEPARATOR in query:
+        return None
+    if use_normalized_text(query, case_sensitive, use_regex, exact):
+        return "normalized", normalize_text(query)[0]
+    if case_sensitive:
+        return "text", query
+    return None
+
+def search_batch(queries: List[tuple]) -> List[List[tuple]]:
+    """
+    批量搜索，共享各查询的扫描
+    已缓存的查询直接使用缓存；字面量查询按剧集和文本列分组，每列只扫描拼接文本，
+    同一列的模式较多时用Aho-Corasick自动机一遍找出所有模式；其他查询逐个搜索
+    
+    Args:
+        queries: 查询参数元组列表，每项为get_search_matches的参数
+                 (query, drama_ids, case_sensitive, use_regex, speaker, mode, exact)
+        
+    Returns:
+        与queries对齐的匹配位置列表，格式同get_search_matches
+    """
+    results = [None] * len(queries)
+    # (剧集ID, 列名) -> 模式 -> 查询下标列表
+    groups = {}
+    pending = {}
+    for index, args in enumerate(queries):
+        query, drama_ids, case_sensitive, use_regex, speaker, mode, exact = args
+        key = make_key(*args)
+        cached = result_cache.get("search", key)
+        if cached is not None:
+            results[index] = cached
+            continue
+        
+        literal = get_literal_pattern(query, case_sensitive, use_regex, mode, exact)
+        if literal is None:
+            results[index] = get_search_matches(*args)
+            continue
+        
+        column, pattern = literal
+        for drama_id in get_target_dramas(drama_ids):
+            groups.setdefault((drama_id, column), {}).setdefault(pattern, []).append(index)
+        pending[index] = key
+    
+    # 每个剧集的每一列只扫描一次（按剧集ID顺序，结果与get_search_matches一致）
+    found = {}
+    for (drama_id, column), pattern_queries in sorted(groups.items()):
+        line_buffer = get_line_buffer(drama_id, column)
+        patterns = list(pattern_queries)
+        if len(patterns) >= AHO_CORASICK_MIN_PATTERNS:
+            pattern_lines = AhoCorasick(patterns).line_matches(line_buffer)
+        else:
+            pattern_lines = [line_buffer.find_lines(pattern) for pattern in patterns]
+        
+        for pattern, lines in zip(patterns, pattern_lines):
+            for index in pattern_queries[pattern]:
+                speaker = queries[index][4]
+                positions = lines
+                if speaker:
+                    positions = array('I', intersect_sorted(lines, get_candidate_positions(drama_id, speaker)))
+                if positions:
+                    found.setdefault(index, []).append((drama_id, positions))
+    
+    for index, key in pending.items():
+        matches = found.get(index, [])
+        results[index] = result_cache.get_or_compute("search", key, lambda matches=matches: matches)
+    return results
+
+def search_subtitles(query: str, drama_ids: List[str] = None, case_sensitive: bool = False, use_regex: bool = False,
+                     speaker: str = None, mode: str = "text", exact: bool = False) -> List[Dict]:
     """
     搜索包含指定文本的字幕
     
@@ -89,110 +646,479 @@ def search_subtitles(query: str, drama_ids: List[str] = None, case_sensitive: bo
         drama_ids: 要搜索的剧集ID列表，None表示所有剧集
         case_sensitive: 是否区分大小写
         use_regex: 是否使用正则表达式
+        speaker: 人物名称，只搜索该人物出现时的字幕
+        mode: 搜索模式，见SEARCH_MODES
+        exact: 按原文精确匹配，不忽略繁简、全半角和标点差异
         
     Returns:
-        匹配的字幕列表
+        匹配的字幕列表，按剧集、集数和时间排序
     """
-    results = []
+    matches = get_search_matches(query, drama_ids, case_sensitive, use_regex, speaker, mode, exact)
     
-    # 确定要搜索的剧集列表
-    if drama_ids is None or len(drama_ids) == 0:
-        # 搜索所有剧集
-        target_dramas = list(all_subtitles.keys())
-    else:
-        # 搜索指定剧集
-        target_dramas = drama_ids
+    return [all_subtitles[drama_id][position] for drama_id, positions in matches for position in positions]
+
+def parse_search_cursor(cursor: str):
+    """解析分页游标 "drama_id:position"，格式错误时抛出ValueError"""
+    drama_id, _, position = cursor.rpartition(':')
+    if not drama_id:
+        raise ValueError(f"无效的游标: {cursor}")
+    return drama_id, int(position)
+
+def search_subtitles_page(query: str, drama_ids: List[str] = None, case_sensitive: bool = False,
+                          use_regex: bool = False, speaker: str = None, limit: int = None,
+                          cursor: str = None, count_only: bool = False, facets: bool = False,
+                          mode: str = "text", exact: bool = False) -> Dict:
+    """
+    分页搜索字幕
+    只为当前页构建结果，其余匹配项只计数
     
-    # 合并所有目标剧集的字幕到一个列表中
-    merged_subtitles = []
-    for drama_id in target_dramas:
-        merged_subtitles.extend(all_subtitles[drama_id])
+    Args:
+        limit: 每页数量，None表示不限制
+        cursor: 上一页返回的next_cursor，None表示第一页
+        count_only: 只返回匹配总数
+        facets: 是否按剧集和集数统计匹配数量
+        mode: 搜索模式，见SEARCH_MODES
+        exact: 按原文精确匹配
+        
+    Returns:
+        包含results、keys（结果的(剧集ID, 位置)）、count（匹配总数）和next_cursor的字典，facets为True时包含facets
+    """
+    start = parse_search_cursor(cursor) if cursor else None
+    matches = get_search_matches(query, drama_ids, case_sensitive, use_regex, speaker, mode, exact)
+    
+    keys = []
+    next_cursor = None
+    
+    if not count_only:
+        for drama_id, positions in matches:
+            if start and drama_id < start[0]:
+                continue
+            begin = bisect_left(positions, start[1]) if start and drama_id == start[0] else 0
+            for index in range(begin, len(positions)):
+                if limit is not None and len(keys) >= limit:
+                    # 当前页已满，记录下一页起点
+                    next_cursor = f"{drama_id}:{positions[index]}"
+                    break
+                keys.append((drama_id, positions[index]))
+            if next_cursor:
+                break
+    
+    page = {
+        "results": [all_subtitles[drama_id][position] for drama_id, position in keys],
+        "keys": keys,
+        "count": sum(len(positions) for _, positions in matches),
+        "next_cursor": next_cursor
+    }
+    
+    if facets:
+        # 每个剧集按集数序号计数（episode_column和positions都是array，numpy直接读取其缓冲区）
+        episode_counts = {}
+        for drama_id, positions in matches:
+            column = np.asarray(episode_column[drama_id])
+            episode_counts[drama_id] = np.bincount(column[np.asarray(positions, dtype=np.intp)],
+                                                   minlength=len(episode_index[drama_id]))
+        
+        page["facets"] = {
+            "dramas": {drama_id: int(len(positions)) for drama_id, positions in matches},
+            "episodes": {
+                drama_id: {episode: int(count) for episode, count in zip(episode_index[drama_id], counts) if count}
+                for drama_id, counts in episode_counts.items()
+            }
+        }
     
+    return page
+
+def relevance_terms(query: str, case_sensitive: bool = False, use_regex: bool = False, mode: str = "text",
+                    exact: bool = False) -> tuple:
+    """
+    相关性评分使用的(文本列名, 查询词列表)，与匹配时使用的文本一致：
+    规范化匹配时为规范化查询和规范化文本列，布尔查询为不在NOT之下的词，含汉字的拼音查询按规范化后的汉字评分
+    无法评分的查询（正则、不含汉字的拼音查询）抛出ValueError
+    """
     if use_regex:
-        # 使用正则表达式搜索
-        try:
-            flags = 0 if case_sensitive else re.IGNORECASE
-            pattern = re.compile(query, flags)
-            
-            for subtitle in merged_subtitles:
-                if pattern.search(subtitle["text"]):
-                    results.append(subtitle)
-        except re.error:
-            # 正则表达式错误，回退到普通搜索
-            print(f"正则表达式错误: {query}，回退到普通搜索")
-            return search_subtitles(query, drama_ids, case_sensitive, False)
+        raise ValueError("正则搜索不支持按相关性排序")
+    if mode == "boolean":
+        column, node = parse_search_boolean_query(query, case_sensitive, use_regex, exact)
+        return column, positive_terms(node)
+    if mode == "pinyin":
+        if not HANZI_PATTERN.search(query):
+            raise ValueError("不含汉字的拼音查询不支持按相关性排序")
+        return "normalized", [normalize_text(query)[0]]
+    if mode != "text":
+        raise ValueError(f"{mode}模式不支持按相关性排序")
+    if use_normalized_text(query, case_sensitive, use_regex, exact):
+        return "normalized", [normalize_text(query)[0]]
+    return "text", [query]
+
+def rank_search_results(query: str, drama_ids: List[str] = None, case_sensitive: bool = False,
+                        use_regex: bool = False, speaker: str = None, mode: str = "text", limit: int = 50,
+                        exact: bool = False) -> tuple:
+    """
+    按BM25相关性排序搜索结果
+    只用堆选出前limit条，不对整个匹配集排序；查询无法评分时抛出ValueError（见relevance_terms）
+    
+    Returns:
+        (按得分降序排列的(字幕, 得分)列表, 匹配总数)，得分相同时按剧集、集数和时间排序
+    """
+    column, words = relevance_terms(query, case_sensitive, use_regex, mode, exact)
+    
+    def compute():
+        matches = get_search_matches(query, drama_ids, case_sensitive, use_regex, speaker, mode, exact)
+        # 文档频率统计全部剧集
+        indexes = [get_posting_indexes(drama_id, column) for drama_id in sorted(all_subtitles)]
+        terms = bm25_scorer.query_terms(words, indexes)
+        scored = ((bm25_scorer.score(text_columns[drama_id][column][position], terms, column), drama_id, position)
+                  for drama_id, positions in matches for position in positions)
+        # nlargest与按得分稳定排序后取前limit条相同，得分相同时保持匹配顺序
+        best = heapq.nlargest(limit, scored, key=lambda item: item[0])
+        ranked = [(all_subtitles[drama_id][position], round(score, 4)) for score, drama_id, position in best]
+        return ranked, sum(len(positions) for _, positions in matches)
+    
+    key = make_key(query, drama_ids, case_sensitive, use_regex, speaker, mode, limit, exact, "relevance")
+    return result_cache.get_or_compute("search", key, compute)
+
+def fuzzy_distance_limit(query: str) -> int:
+    """模糊搜索允许的最大编辑距离：不超过按长度确定的默认值，且二元组计数过滤仍能剪枝"""
+    return max(0, min(default_max_distance(len(query)), max_filtered_distance(query)))
+
+def fuzzy_search_subtitles(query: str, drama_ids: List[str] = None, max_distance: int = None, limit: int = 50,
+                           speaker: str = None) -> List[tuple]:
+    """
+    模糊搜索字幕，容忍OCR识别错误
+    先用二元组计数过滤候选，只对少量候选计算编辑距离
+    
+    Args:
+        query: 搜索文本
+        drama_ids: 要搜索的剧集ID列表，None表示所有剧集
+        max_distance: 允许的最大编辑距离，None表示使用fuzzy_distance_limit（也不能超过该值）
+        limit: 返回结果数量限制
+        speaker: 人物名称，只搜索该人物出现时的字幕
+        
+    Returns:
+        按得分降序排列的(字幕, 得分)列表，得分 = 1 - 编辑距离 / 查询长度
+    """
+    if max_distance is None:
+        max_distance = fuzzy_distance_limit(query)
     else:
-        # 普通文本搜索
-        if not case_sensitive:
-            pattern = re.compile(query, re.IGNORECASE)
+        max_distance = min(max_distance, fuzzy_distance_limit(query))
+    
+    def compute():
+        scored = []
+        for drama_id in get_target_dramas(drama_ids):
+            texts = text_columns[drama_id]["text"]
+            positions = qgram_index[drama_id].candidates(query, max_distance)
+            if positions is None:
+                # 查询太短，计数过滤无效；此时距离只能为0，直接做子串查找
+                for position in get_candidate_positions(drama_id, speaker):
+                    if query in texts[position]:
+                        scored.append((0, drama_id, position))
+                continue
+            elif speaker:
+                allowed = set(get_candidate_positions(drama_id, speaker))
+                positions = [position for position in positions if position in allowed]
             
-            for subtitle in merged_subtitles:
-                if pattern.search(subtitle["text"]):
-                    results.append(subtitle)
-        else:
-            for subtitle in merged_subtitles:
-                if query in subtitle["text"]:
-                    results.append(subtitle)
+            for position in positions:
+                distance = bounded_substring_distance(query, texts[position], max_distance)
+                if distance is not None:
+                    scored.append((distance, drama_id, position))
+        
+        # 距离相同时按剧集、集数和时间排序
+        best = heapq.nsmallest(limit, scored)
+        return [(all_subtitles[drama_id][position], round(1 - distance / len(query), 4))
+                for distance, drama_id, position in best]
     
-    # 按剧集、集数和时间排序
-    results.sort(key=lambda x: (x["drama_id"], x["episode"], x["start_seconds"]))
+    key = make_key(query, drama_ids, max_distance, limit, speaker, "fuzzy")
+    return result_cache.get_or_compute("search", key, compute)
+
+def search_across_lines(query: str, drama_ids: List[str] = None, max_gap: float = DEFAULT_MAX_LINE_GAP,
+                        case_sensitive: bool = False, exact: bool = False, speaker: str = None) -> List[Dict]:
+    """
+    跨行搜索：在每集拼接文本上查找，允许匹配跨越同一集中相邻的多条字幕
+    与普通搜索一样默认在规范化文本上匹配（忽略繁简体、全角/半角、标点和大小写），
+    区分大小写或exact=True时在原文上匹配
     
-    return results
+    Args:
+        query: 搜索文本
+        drama_ids: 要搜索的剧集ID列表，None表示所有剧集
+        max_gap: 相邻字幕之间允许的最大间隔（秒），超过时不视为同一句
+        case_sensitive: 是否区分大小写
+        exact: 是否按原文精确匹配
+        speaker: 人物名称，只返回覆盖的字幕中至少一条属于该人物的命中
+        
+    Returns:
+        命中列表，每个命中包含覆盖的所有字幕及合并后的开始/结束时间，按剧集、集数和时间排序
+        match_offset为匹配在第一条字幕原文中的位置
+    """
+    normalized = use_normalized_text(query, case_sensitive, False, exact)
+    if normalized:
+        query = normalize_text(query)[0]
+        buffer_key, offsets_key = "normalized_buffer", "normalized_line_offsets"
+    else:
+        buffer_key, offsets_key = "buffer", "line_offsets"
+    pattern = None if normalized or case_sensitive else re.compile(re.escape(query), re.IGNORECASE)
+    
+    def compute():
+        hits = []
+        for drama_id in get_target_dramas(drama_ids):
+            subtitles = all_subtitles[drama_id]
+            speaker_positions = get_candidate_positions(drama_id, speaker) if speaker else None
+            for episode, episode_positions in episode_index[drama_id].items():
+                buffer = episode_positions[buffer_key]
+                line_offsets = episode_positions[offsets_key]
+                base = episode_positions["offset"]
+                seen_spans = set()
+                
+                def find(start):
+                    if pattern is None:
+                        return buffer.find(query, start)
+                    match = pattern.search(buffer, start)
+                    return match.start() if match else -1
+                
+                start = find(0)
+                while start != -1:
+                    # 由偏移映射回字幕行（规范化后为空的行不会被选为首尾行）
+                    first = bisect_right(line_offsets, start) - 1
+                    last = bisect_right(line_offsets, start + len(query) - 1) - 1
+                    lines = subtitles[base + first:base + last + 1]
+                    
+                    if speaker_positions is not None:
+                        # 覆盖的字幕位置区间与人物倒排表求交
+                        index = bisect_left(speaker_positions, base + first)
+                        if index == len(speaker_positions) or speaker_positions[index] > base + last:
+                            start = find(start + 1)
+                            continue
+                    
+                    if (first, last) not in seen_spans and all(
+                            lines[i + 1]["start_seconds"] - lines[i]["end_seconds"] <= max_gap
+                            for i in range(len(lines) - 1)):
+                        seen_spans.add((first, last))
+                        match_offset = start - line_offsets[first]
+                        if normalized:
+                            match_offset = map_normalized_span(normalize_text(lines[0]["text"])[1],
+                                                               match_offset, match_offset + 1)[0]
+                        hits.append({
+                            "drama_id": drama_id,
+                            "episode": episode,
+                            "text": ''.join(line["text"] for line in lines),
+                            "match_offset": match_offset,
+                            "start_time": lines[0]["start_time"],
+                            "end_time": lines[-1]["end_time"],
+                            "start_seconds": lines[0]["start_seconds"],
+                            "end_seconds": max(line["end_seconds"] for line in lines),
+                            "lines": lines
+                        })
+                    start = find(start + 1)
+        return hits
+    
+    key = make_key(query, drama_ids, max_gap, normalized, case_sensitive, speaker, "cross_line")
+    return result_cache.get_or_compute("search", key, compute)
 
-def get_filtered_subtitles(drama_ids: List[str] = None, min_length: int = 3, max_length: int = 8) -> List[Dict]:
+def find_similar_subtitles(text: str, drama_ids: List[str] = None, limit: int = 10,
+                           approximate: bool = False) -> List[tuple]:
     """
-    获取过滤后的字幕列表（适合接龙游戏）
+    查找与给定文本相似的字幕（字符n-gram TF-IDF余弦相似度）
     
     Args:
-        drama_ids: 要获取的剧集ID列表，None表示所有剧集
-        min_length: 最小字幕长度
-        max_length: 最大字幕长度
+        text: 源文本
+        drama_ids: 要搜索的剧集ID列表，None表示所有剧集
+        limit: 返回结果数量限制
+        approximate: 使用LSH预过滤候选（仅在语料足够大、已构建LSH时生效）
+        
+    Returns:
+        按相似度降序排列的(字幕, 相似度)列表，不包含与源文本完全相同的字幕
+    """
+    def compute():
+        row_mask = None
+        if drama_ids:
+            row_mask = np.zeros(similarity_index.row_count, dtype=bool)
+            for start_row, drama_id in similarity_row_offsets:
+                if drama_id in drama_ids:
+                    row_mask[start_row:start_row + len(all_subtitles[drama_id])] = True
+        
+        # 多取一些，去掉与源文本相同的字幕后仍有limit条
+        hits = similarity_index.top_k(text, limit + 10, row_mask, approximate)
+        
+        results = []
+        for row, score in hits:
+            start_row, drama_id = similarity_row_offsets[bisect_right(similarity_row_offsets, (row, '\uffff')) - 1]
+            subtitle = all_subtitles[drama_id][row - start_row]
+            if subtitle["text"] == text:
+                continue
+            results.append((subtitle, round(score, 4)))
+            if len(results) >= limit:
+                break
+        return results
+    
+    key = make_key(text, drama_ids, limit, approximate)
+    return result_cache.get_or_compute("similar", key, compute)
+
+def get_subtitle_context(drama_id: str, episode: str, start_seconds: float, count: int = 3,
+                         window: float = None) -> Optional[Dict]:
+    """
+    获取某条字幕前后的相邻字幕
+    
+    Args:
+        drama_id: 剧集ID
+        episode: 集数名称
+        start_seconds: 字幕开始时间（秒），取该集中开始时间最接近的字幕
+        count: 前后各取的字幕条数
+        window: 时间窗口（秒），指定时返回开始时间在±window内的所有字幕，忽略count
         
     Returns:
-        过滤后的字幕列表
+        包含上下文字幕、当前字幕位置和建议片段范围的字典，找不到集数或窗口内没有字幕时返回None
     """
-    filtered_subtitles = []
+    episode_positions = episode_index.get(drama_id, {}).get(episode)
+    if not episode_positions:
+        return None
     
-    # 确定要处理的剧集列表
-    if drama_ids is None or len(drama_ids) == 0:
-        target_dramas = list(all_subtitles.keys())
+    offset = episode_positions["offset"]
+    starts = episode_positions["starts"]
+    
+    # 二分查找开始时间最接近的字幕
+    index = bisect_left(starts, start_seconds)
+    if index == len(starts) or (index > 0 and start_seconds - starts[index - 1] <= starts[index] - start_seconds):
+        index -= 1
+    
+    if window is not None:
+        anchor_start = starts[index]
+        lo = bisect_left(starts, anchor_start - window)
+        hi = bisect_right(starts, anchor_start + window)
     else:
-        target_dramas = drama_ids
+        lo = max(0, index - count)
+        hi = min(len(starts), index + count + 1)
     
-    # 合并所有目标剧集的字幕到一个列表中
-    merged_subtitles = []
-    for drama_id in target_dramas:
-        merged_subtitles.extend(all_subtitles[drama_id])
+    lines = all_subtitles[drama_id][offset + lo:offset + hi]
+    if not lines:
+        return None
     
-    # 移除语气词结尾
-    for subtitle in merged_subtitles:
-        # 去除语气词
-        clean_text = re.sub(r'[啊呢吗吧呀嘛哦哎嗯呐呵呦诶哈哟了]$', '', subtitle["text"])
+    return {
+        "lines": lines,
+        "index": index - lo,
+        # 覆盖整个窗口的片段范围，可直接用于generate_video_clip
+        "clip": {
+            "drama_id": drama_id,
+            "episode": episode,
+            "start_time": min(line["start_seconds"] for line in lines),
+            "end_time": max(line["end_seconds"] for line in lines)
+        }
+    }
+
+def get_length_pool_ranges(drama_ids: List[str] = None, min_length: int = 3, max_length: int = 8) -> List[tuple]:
+    """
+    获取去除语气词后长度在[min_length, max_length]内的字幕（适合接龙游戏）
+    
+    Args:
+        drama_ids: 要获取的剧集ID列表，None表示所有剧集
+        min_length: 最小字幕长度
+        max_length: 最大字幕长度
         
-        # 检查长度
-        if len(clean_text) >= min_length and len(clean_text) <= max_length:
-            filtered_subtitles.append(subtitle)
+    Returns:
+        (剧集ID, 起始下标, 结束下标)列表，下标为length_pools中按长度排序的位置数组的区间
+    """
+    ranges = []
+    for drama_id in get_target_dramas(drama_ids):
+        pool = length_pools[drama_id]
+        lo = bisect_left(pool["lengths"], min_length)
+        hi = bisect_right(pool["lengths"], max_length)
+        if hi > lo:
+            ranges.append((drama_id, lo, hi))
+    return ranges
+
+def sample_length_pool(ranges: List[tuple], count: int, exclude: set = None) -> List[tuple]:
+    """
+    从长度区间中不重复地随机抽取字幕，不构建候选列表
     
-    return filtered_subtitles
+    Args:
+        ranges: get_length_pool_ranges返回的区间列表
+        count: 抽取数量
+        exclude: 需要跳过的(剧集ID, 位置)集合
+        
+    Returns:
+        (剧集ID, 位置)列表
+    """
+    # 各区间的累计大小，用于把全局序号映射回剧集和位置
+    boundaries = []
+    total = 0
+    for _, lo, hi in ranges:
+        total += hi - lo
+        boundaries.append(total)
+    
+    def resolve(index):
+        i = bisect_right(boundaries, index)
+        drama_id, lo, _ = ranges[i]
+        start = boundaries[i - 1] if i else 0
+        return drama_id, length_pools[drama_id]["positions"][lo + index - start]
+    
+    if not exclude:
+        return [resolve(index) for index in random.sample(range(total), min(count, total))]
+    
+    # 已抽过的较多时直接列出剩余候选，否则拒绝采样（每次接受概率不低于一半）
+    if (len(exclude) + count) * 2 >= total:
+        remaining = [key for key in map(resolve, range(total)) if key not in exclude]
+        return random.sample(remaining, min(count, len(remaining)))
+    
+    chosen = {}
+    while len(chosen) < count:
+        index = random.randrange(total)
+        if index not in chosen:
+            key = resolve(index)
+            if key not in exclude:
+                chosen[index] = key
+    return list(chosen.values())
 
-def get_random_sentences(drama_ids: List[str] = None, count: int = 8) -> List[Dict]:
+def get_random_sentences(drama_ids: List[str] = None, count: int = 8, min_length: int = 3, max_length: int = 8,
+                         session_id: str = None) -> List[Dict]:
     """
     获取随机字幕句子（适合接龙游戏的开始提示）
     
     Args:
         drama_ids: 要获取的剧集ID列表，None表示所有剧集
         count: 返回的句子数量
+        min_length: 去除语气词后的最小长度
+        max_length: 去除语气词后的最大长度
+        session_id: 会话ID，同一会话内不重复返回，候选抽完后重新开始
         
     Returns:
         随机字幕列表
     """
-    filtered_subtitles = get_filtered_subtitles(drama_ids, 3, 8)
+    ranges = get_length_pool_ranges(drama_ids, min_length, max_length)
     
-    if len(filtered_subtitles) <= count:
-        return filtered_subtitles
-    
-    # 随机选择指定数量的字幕
-    return random.sample(filtered_subtitles, count)
+    if session_id is None:
+        keys = sample_length_pool(ranges, count)
+    else:
+        with random_sessions_lock:
+            seen = random_sessions.pop(session_id, None) or set()
+            random_sessions[session_id] = seen
+            while len(random_sessions) > MAX_RANDOM_SESSIONS:
+                random_sessions.popitem(last=False)
+            
+            keys = sample_length_pool(ranges, count, seen)
+            if len(keys) < count:
+                # 本会话已抽完全部候选，开始新的一轮
+                seen.clear()
+                seen.update(keys)
+                keys += sample_length_pool(ranges, count - len(keys), seen)
+            seen.update(keys)
+    
+    return [all_subtitles[drama_id][position] for drama_id, position in keys]
+
+def run_ffmpeg(cmd: List[str], kind: str, **kwargs) -> subprocess.CompletedProcess:
+    """执行ffmpeg命令并记录调用次数、耗时和正在运行的进程数，kind为clip、merge、transcode或probe"""
+    labels = (("kind", kind),)
+    metrics.inc("subtitle_api_ffmpeg_in_flight", labels)
+    started = time.perf_counter()
+    result = "error"
+    try:
+        completed = subprocess.run(cmd, **kwargs)
+        result = "ok" if completed.returncode == 0 else "failed"
+        return completed
+    except subprocess.CalledProcessError:
+        result = "failed"
+        raise
+    finally:
+        metrics.inc("subtitle_api_ffmpeg_in_flight", labels, -1)
+        metrics.inc("subtitle_api_ffmpeg_runs_total", labels + (("result", result),))
+        metrics.observe("subtitle_api_ffmpeg_duration_seconds", time.perf_counter() - started, labels)
 
 def generate_video_clip(drama_id: str, episode: str, start_time: float, end_time: float, 
                        context_seconds: int = 2) -> str:
@@ -254,10 +1180,12 @@ def generate_video_clip(drama_id: str, episode: str, start_time: float, end_time
     
     if existing_clips:
         # 使用已有的缓存片段
+        metrics.inc("subtitle_api_clip_cache_requests_total", (("result", "hit"),))
         print(f"使用缓存的视频片段: {existing_clips[0]}")
         return existing_clips[0]
     
     # 没有缓存，生成新片段
+    metrics.inc("subtitle_api_clip_cache_requests_total", (("result", "miss"),))
     clip_id = str(uuid.uuid4())[:8]
     output_file = os.path.join(cache_dir, f"{drama_id}_{episode_num}_{int(adjusted_start)}_{int(adjusted_end)}_{clip_id}.mp4")
     
@@ -294,7 +1222,7 @@ def generate_video_clip(drama_id: str, episode: str, start_time: float, end_time
     hardware_accel = ""
     try:
         # 检查Mac平台的VideoToolbox硬件加速是否可用
-        hw_check = subprocess.run(["ffmpeg", "-hwaccels"], capture_output=True, text=True, check=False)
+        hw_check = run_ffmpeg(["ffmpeg", "-hwaccels"], "probe", capture_output=True, text=True, check=False)
         if "videotoolbox" in hw_check.stdout.lower():
             hardware_accel = "videotoolbox"
             print("使用VideoToolbox硬件加速")
@@ -335,7 +1263,7 @@ def generate_video_clip(drama_id: str, episode: str, start_time: float, end_time
     
     # 执行命令
     try:
-        subprocess.run(cmd, check=True)
+        run_ffmpeg(cmd, "clip", check=True)
         print(f"视频片段生成成功: {output_file}")
         return output_file
     except subprocess.CalledProcessError as e:
@@ -410,7 +1338,7 @@ def merge_video_clips(clip_urls: List[str]) -> str:
     print(f"执行ffmpeg合并命令: {' '.join(cmd)}")
     
     try:
-        subprocess.run(cmd, check=True)
+        run_ffmpeg(cmd, "merge", check=True)
         print(f"视频合并成功: {output_file}")
         
         # 删除临时文件列表
@@ -457,7 +1385,7 @@ def merge_clips_with_transcode(clip_files: List[str]) -> str:
             ]
             
             print(f"转码 {clip} -> {temp_file}")
-            subprocess.run(cmd, check=True)
+            run_ffmpeg(cmd, "transcode", check=True)
         
         # 创建合并文件列表
         temp_file_list = os.path.join(MERGED_OUTPUT_DIR, f"templist_{uuid.uuid4()}.txt")
@@ -478,7 +1406,7 @@ def merge_clips_with_transcode(clip_files: List[str]) -> str:
         ]
         
         print(f"合并临时文件: {' '.join(cmd)}")
-        subprocess.run(cmd, check=True)
+        run_ffmpeg(cmd, "transcode", check=True)
         
         print(f"备选方案视频合并成功: {output_file}")
         return output_file
@@ -517,28 +1445,31 @@ def get_last_char_rhyme(text):
         return None
     
     # 清理语气词
-    clean_text = re.sub(r'[啊呢吗吧呀嘛哦哎嗯呐呵呦诶哈哟了]$', '', text)
+    clean_text = MODAL_PARTICLE_PATTERN.sub('', text)
     if not clean_text:
         return None
     
     # 获取最后一个字
     last_char = clean_text[-1]
     
-    # 获取拼音（带声调）和韵母
+    # 从韵母表查找韵母（不带声调）
     try:
-        char_pinyin = pinyin(last_char, style=Style.FINALS)[0][0]
-        
         # 如果是空字符串，说明可能是标点符号，返回None
-        if not char_pinyin:
-            return None
-            
-        # 返回韵母（去掉声调）
-        return ''.join([c for c in char_pinyin if not c.isdigit()])
+        return rhyme_table.final(last_char) or None
     except Exception as e:
         print(f"获取韵母出错 '{last_char}': {e}")
         return None
 
 def find_rhyming_sentences_with_scores(text, drama_ids=None, min_length=3, max_length=8, limit=20):
+    """
+    查找与给定文本押韵的句子，并带有相似度评分（结果缓存）
+    参数和返回值同compute_rhyming_sentences_with_scores
+    """
+    key = make_key(text, drama_ids, min_length, max_length, limit)
+    return result_cache.get_or_compute(
+        "rhyme", key, lambda: compute_rhyming_sentences_with_scores(text, drama_ids, min_length, max_length, limit))
+
+def compute_rhyming_sentences_with_scores(text, drama_ids=None, min_length=3, max_length=8, limit=20):
     """
     查找与给定文本押韵的句子，并带有相似度评分
     
@@ -563,37 +1494,95 @@ def find_rhyming_sentences_with_scores(text, drama_ids=None, min_length=3, max_l
     else:
         target_dramas = drama_ids
     
-    # 合并所有目标剧集的字幕到一个列表中
-    merged_subtitles = []
-    for drama_id in target_dramas:
-        merged_subtitles.extend(all_subtitles[drama_id])
-    
-    candidates = []
-    
-    # 遍历合并后的字幕列表
-    for subtitle in merged_subtitles:
-        subtitle_text = subtitle["text"]
-        
-        # 过滤长度
-        if len(subtitle_text) < min_length or len(subtitle_text) > max_length:
-            continue
-        
-        # 首先检查最后一个字是否押韵
-        target_rhyme = get_last_char_rhyme(subtitle_text)
-        if not target_rhyme or source_rhyme != target_rhyme:
-            continue
-            
-        # 计算押韵分数，传递完整的文本
-        score = calculate_rhyme_score(text, subtitle_text)
-        if score > 0:
-            candidates.append((subtitle, score))
+    # 只收集最后一个字押韵、长度符合的字幕
+    with profiler.span("rhyme.gather"):
+        subtitles = []
+        for drama_id in target_dramas:
+            drama_subtitles = all_subtitles[drama_id]
+            for position in rhyme_groups[drama_id].get(source_rhyme, ()):
+                subtitle = drama_subtitles[position]
+                if min_length <= len(subtitle["text"]) <= max_length:
+                    subtitles.append(subtitle)
+    
+    # 计算押韵分数，传递完整的文本
+    with profiler.span("rhyme.score"):
+        candidates = []
+        for subtitle in subtitles:
+            score = calculate_rhyme_score(text, subtitle["text"])
+            if score > 0:
+                candidates.append((subtitle, score))
     
     # 按分数排序
-    sorted_candidates = sorted(candidates, key=lambda x: x[1], reverse=True)
+    with profiler.span("rhyme.sort"):
+        sorted_candidates = sorted(candidates, key=lambda x: x[1], reverse=True)
     
     # 限制返回数量
     return sorted_candidates[:limit]
 
+def build_rhyme_chain(text, steps, drama_ids=None, min_length=3, max_length=8,
+                      beam_width=RHYME_CHAIN_BEAM_WIDTH, time_budget=RHYME_CHAIN_TIME_BUDGET):
+    """
+    在服务端生成押韵接龙序列（束搜索）
+    每一步接在上一句后面，按calculate_rhyme_score累计得分，保留得分最高的beam_width条序列；
+    同一序列中不重复使用相同的字幕文本
+    
+    Args:
+        text: 起始文本
+        steps: 接龙步数
+        drama_ids: 要搜索的剧集ID列表，None表示所有剧集
+        min_length: 最小字符长度
+        max_length: 最大字符长度
+        beam_width: 束宽
+        time_budget: 时间预算（秒），超时返回当前得分最高的序列（评分候选时每RHYME_CHAIN_DEADLINE_INTERVAL条检查一次）
+        
+    Returns:
+        ((句子, 分数)列表, 是否超时)；候选不足时序列可能短于steps
+    """
+    source_rhyme = get_last_char_rhyme(text)
+    if not source_rhyme:
+        return [], False
+    deadline = time.monotonic() + time_budget
+    
+    # 押韵只比较最后一个字的韵母，整条序列都在同一个韵母分组中
+    candidates = []
+    for drama_id in get_target_dramas(drama_ids):
+        for position in rhyme_groups[drama_id].get(source_rhyme, ()):
+            subtitle = all_subtitles[drama_id][position]
+            if min_length <= len(subtitle["text"]) <= max_length:
+                candidates.append(subtitle)
+    
+    # 每条序列: (累计得分, ((句子, 分数), ...), 已使用的文本)
+    beams = [(0.0, (), frozenset([text]))]
+    timed_out = False
+    for _ in range(steps):
+        expanded = []
+        for total, chain, used in beams:
+            previous_text = chain[-1][0]["text"] if chain else text
+            scored = []
+            for index, subtitle in enumerate(candidates):
+                # 超时时只用已评分的候选扩展当前序列
+                if index % RHYME_CHAIN_DEADLINE_INTERVAL == 0 and index and time.monotonic() > deadline:
+                    timed_out = True
+                    break
+                if subtitle["text"] in used:
+                    continue
+                score = calculate_rhyme_score(previous_text, subtitle["text"])
+                if score > 0:
+                    scored.append((score, subtitle))
+            for score, subtitle in heapq.nlargest(beam_width, scored, key=lambda item: item[0]):
+                expanded.append((total + score, chain + ((subtitle, score),), used | {subtitle["text"]}))
+            if timed_out or time.monotonic() > deadline:
+                timed_out = True
+                break
+        
+        if not expanded:
+            break
+        beams = heapq.nlargest(beam_width, expanded, key=lambda beam: beam[0])
+        if timed_out:
+            break
+    
+    return list(beams[0][1]), timed_out
+
 def find_rhyming_sentences(text, min_length=3, max_length=8, limit=20):
     """查找与给定文本押韵的句子（仅返回句子，不含分数）"""
     # 获取带分数的结果
@@ -609,8 +1598,8 @@ def calculate_rhyme_score(source_text, target_text):
     score = 10.0  # 基础分
     
     # 1. 获取干净文本（去除语气词）
-    source_clean = re.sub(r'[啊呢吗吧呀嘛哦哎嗯呐呵呦诶哈哟了]$', '', source_text)
-    target_clean = re.sub(r'[啊呢吗吧呀嘛哦哎嗯呐呵呦诶哈哟了]$', '', target_text)
+    source_clean = MODAL_PARTICLE_PATTERN.sub('', source_text)
+    target_clean = MODAL_PARTICLE_PATTERN.sub('', target_text)
     
     # 2. 长度适中加分
     if 4 <= len(target_clean) <= 6:
@@ -624,12 +1613,8 @@ def calculate_rhyme_score(source_text, target_text):
             source_second_last = source_clean[-2]
             target_second_last = target_clean[-2]
             
-            source_second_rhyme = pinyin(source_second_last, style=Style.FINALS)[0][0]
-            target_second_rhyme = pinyin(target_second_last, style=Style.FINALS)[0][0]
-            
-            # 去掉声调
-            source_second_rhyme = ''.join([c for c in source_second_rhyme if not c.isdigit()])
-            target_second_rhyme = ''.join([c for c in target_second_rhyme if not c.isdigit()])
+            source_second_rhyme = rhyme_table.final(source_second_last)
+            target_second_rhyme = rhyme_table.final(target_second_last)
             
             if source_second_rhyme and target_second_rhyme and source_second_rhyme == target_second_rhyme:
                 score += 3.0  # 倒数第二个字也押韵，更好
@@ -651,10 +1636,116 @@ def calculate_rhyme_score(source_text, target_text):
     
     return score
 
+# 对话提示词
+POSITIVE_WORDS = ["好", "愿意", "可以", "是", "对", "喜欢", "爱", "高兴"]
+NEGATIVE_WORDS = ["不", "没", "别", "莫", "拒绝", "难过", "恨", "讨厌"]
+COMMAND_WORDS = ["去", "来", "给我", "快", "立刻", "马上", "传"]
+SURPRISE_WORDS = ["啊", "哎呀", "天哪", "竟然", "居然", "怎么会"]
+
+def is_question_text(text):
+    """判断是否为问句"""
+    return '?' in text or '？' in text or '吗' in text or '呢' in text
+
+def dialogue_cue_class(text):
+    """
+    获取句子的提示类别，用于按类别查找真实的回应
+    按问句、命令、惊讶、否定、肯定的优先级归类，都不符合时为陈述
+    """
+    if is_question_text(text):
+        return "question"
+    if any(word in text for word in COMMAND_WORDS):
+        return "command"
+    if any(word in text for word in SURPRISE_WORDS):
+        return "surprise"
+    if any(word in text for word in NEGATIVE_WORDS):
+        return "negative"
+    if any(word in text for word in POSITIVE_WORDS):
+        return "positive"
+    return "statement"
+
+def build_dialogue_index(subtitles, max_gap=DIALOGUE_PAIR_MAX_GAP):
+    """
+    挖掘同一集中相邻且间隔不超过max_gap秒的字幕对，后一条作为前一条的回应
+    
+    Args:
+        subtitles: 一个剧集的字幕列表（按集数和时间排序）
+        max_gap: 允许的最大间隔（秒）
+        
+    Returns:
+        {"replies", "turn_pools", "adjacent_pools"}，位置为subtitles中的下标（升序）
+    """
+    replies = {}
+    turn_pools = {}
+    adjacent_pools = {}
+    for position in range(len(subtitles) - 1):
+        line = subtitles[position]
+        reply = subtitles[position + 1]
+        if line["episode"] != reply["episode"] or reply["start_seconds"] - line["end_seconds"] > max_gap:
+            continue
+        if reply["text"] == line["text"]:
+            continue
+        
+        replies.setdefault(line["text"], array('I')).append(position + 1)
+        # 两条字幕都有人名且人名不同，说明换了人说话
+        is_turn = bool(line["speakers"]) and bool(reply["speakers"]) and set(line["speakers"]) != set(reply["speakers"])
+        pools = turn_pools if is_turn else adjacent_pools
+        pools.setdefault(dialogue_cue_class(line["text"]), array('I')).append(position + 1)
+    
+    return {"replies": replies, "turn_pools": turn_pools, "adjacent_pools": adjacent_pools}
+
+def find_mined_dialogue_responses(text, current_drama_id, current_episode, target_dramas, count=8):
+    """
+    从挖掘的真实对话中查找回应
+    先取语料中同一句话之后的真实回应，再按提示类别从换人说话、普通相邻的回应中随机抽取，都跳过当前集
+    
+    Returns:
+        回应句子列表（最多count条，不包含与源句子相同的文本）
+    """
+    result = []
+    seen_texts = {text}
+    
+    def take(drama_id, position):
+        subtitle = all_subtitles[drama_id][position]
+        if subtitle["text"] not in seen_texts:
+            seen_texts.add(subtitle["text"])
+            result.append(subtitle)
+    
+    # 1. 同一句话在语料中的真实回应，跳过当前集（否则返回的就是用户正在看的下一句）
+    for drama_id in target_dramas:
+        for position in dialogue_index[drama_id]["replies"].get(text, ()):
+            if len(result) >= count:
+                return result
+            if drama_id == current_drama_id and all_subtitles[drama_id][position]["episode"] == current_episode:
+                continue
+            take(drama_id, position)
+    
+    # 2. 同类提示的回应，跳过当前集
+    cue = dialogue_cue_class(text)
+    for pool_name in ("turn_pools", "adjacent_pools"):
+        pools = [(drama_id, dialogue_index[drama_id][pool_name].get(cue, ())) for drama_id in target_dramas]
+        boundaries = []
+        total = 0
+        for _, pool in pools:
+            total += len(pool)
+            boundaries.append(total)
+        
+        # 多抽一些，留出被跳过的余量
+        for index in random.sample(range(total), min(total, 2 * (count - len(result)) + 8)):
+            if len(result) >= count:
+                return result
+            i = bisect_right(boundaries, index)
+            drama_id, pool = pools[i]
+            position = pool[index - (boundaries[i - 1] if i else 0)]
+            if drama_id == current_drama_id and all_subtitles[drama_id][position]["episode"] == current_episode:
+                continue
+            take(drama_id, position)
+    
+    return result
+
 # 按剧集ID组织的对话回应
 def find_dialogue_responses(text, current_drama_id, current_episode, drama_ids=None):
     """
-    基于规则的对话回应查找
+    对话回应查找：优先使用语料中挖掘的真实对话，不足时用基于规则的评分补充
     
     Args:
         text: 源句子文本
@@ -675,21 +1766,78 @@ def find_dialogue_responses(text, current_drama_id, current_episode, drama_ids=N
     else:
         target_dramas = [drama_id for drama_id in drama_ids if drama_id in all_subtitles]
     
-    # 合并所有目标剧集的字幕到一个列表中
-    merged_subtitles = []
-    for drama_id in target_dramas:
-        merged_subtitles.extend(all_subtitles[drama_id])
+    # 真实对话足够时不需要规则评分
+    with profiler.span("dialogue.gather"):
+        mined = find_mined_dialogue_responses(text, current_drama_id, current_episode, target_dramas)
+        if len(mined) >= 8:
+            return mined
         
+    # 候选评分是确定的，可以缓存（只会用到前8个）；随机补充和打乱每次重新进行
+    # 只在未命中缓存时遍历所有目标剧集的字幕
+    key = make_key(text, current_drama_id, current_episode, target_dramas)
+    sorted_candidates = result_cache.get_or_compute(
+        "dialogue", key, lambda: rank_dialogue_candidates(
+            text, current_drama_id, current_episode,
+            itertools.chain.from_iterable(all_subtitles[drama_id] for drama_id in target_dramas))[:8])
+    
+    # 选择最佳回应（排在真实对话之后）
+    result = list(mined)
+    mined_texts = {subtitle["text"] for subtitle in mined}
+    result.extend(c[0] for c in sorted_candidates if c[0]["text"] not in mined_texts)
+    
+    # 如果候选数量不足，从目标剧集的字幕中随机选择一些补充（跳过当前集和已选的字幕）
+    if len(result) < 8:
+        needed = 8 - len(result)
+        ranges = [(drama_id, 0, len(all_subtitles[drama_id])) for drama_id in target_dramas if all_subtitles[drama_id]]
+        exclude = set()
+        current = episode_index.get(current_drama_id, {}).get(current_episode)
+        if current and current_drama_id in target_dramas:
+            exclude.update((current_drama_id, current["offset"] + i) for i in range(len(current["starts"])))
+        # 多抽len(result)条，已选的字幕最多占去这么多
+        chosen = {id(subtitle) for subtitle in result}
+        for drama_id, position in sample_length_pool(ranges, needed + len(result), exclude):
+            subtitle = all_subtitles[drama_id][position]
+            if id(subtitle) not in chosen and needed > 0:
+                result.append(subtitle)
+                needed -= 1
+    
+    # 限制返回8个结果
+    if len(result) > 8:
+        result = result[:8]
+    
+    # 为了保持一些惊喜性，添加适度的随机性但保持高分回应排在前面
+    # 前3个保持不变（最高分），后5个略微打乱
+    if len(result) > 3:
+        high_ranked = result[:3]
+        remaining = result[3:]
+        random.shuffle(remaining)
+        result = high_ranked + remaining
+    
+    return result
+
+def rank_dialogue_candidates(text, current_drama_id, current_episode, merged_subtitles):
+    """
+    按规则为候选回应评分
+    
+    Args:
+        text: 源句子文本
+        current_drama_id: 当前剧集ID
+        current_episode: 源句子所在集数
+        merged_subtitles: 候选字幕（可迭代对象，只遍历一次）
+        
+    Returns:
+        按得分降序排列的(字幕, 得分)列表
+    """
     # 对源句子进行分析
     # 1. 问答规则: 识别问句并匹配非问句回应
-    is_question = '?' in text or '？' in text or '吗' in text or '呢' in text
+    is_question = is_question_text(text)
     
     # 2. 长度分析
     is_long = len(text) > 12
     
     # 3. 情感分析
-    positive_words = ["好", "愿意", "可以", "是", "对", "喜欢", "爱", "高兴"]
-    negative_words = ["不", "没", "别", "莫", "拒绝", "难过", "恨", "讨厌"]
+    positive_words = POSITIVE_WORDS
+    negative_words = NEGATIVE_WORDS
     has_positive = any(word in text for word in positive_words)
     has_negative = any(word in text for word in negative_words)
     
@@ -698,11 +1846,10 @@ def find_dialogue_responses(text, current_drama_id, current_episode, drama_ids=N
     has_transition = any(word in text for word in transition_words)
     
     # 6. 命令句检测
-    command_words = ["去", "来", "给我", "快", "立刻", "马上", "传"]
-    is_command = any(word in text for word in command_words)
+    is_command = any(word in text for word in COMMAND_WORDS)
     
     # 7. 惊讶感叹检测
-    surprise_words = ["啊", "哎呀", "天哪", "竟然", "居然", "怎么会"]
+    surprise_words = SURPRISE_WORDS
     is_surprised = any(word in text for word in surprise_words)
     
     # 评分函数
@@ -714,7 +1861,7 @@ def find_dialogue_responses(text, current_drama_id, current_episode, drama_ids=N
             return -1
         
         # 问答配对
-        if is_question and not ('?' in candidate_text or '？' in candidate_text or '吗' in candidate_text or '呢' in candidate_text):
+        if is_question and not is_question_text(candidate_text):
             score += 1.5
         
         # 长度平衡
@@ -747,55 +1894,22 @@ def find_dialogue_responses(text, current_drama_id, current_episode, drama_ids=N
         return score
     
     # 筛选和评分候选项 - 从合并的字幕列表中选择
-    candidates = []
-    for subtitle in merged_subtitles:
-        # 跳过同一集的候选
-        if subtitle['drama_id'] == current_drama_id and subtitle['episode'] == current_episode:
-            continue
-            
-        score = score_candidate(subtitle['text'], subtitle['drama_id'], subtitle['episode'])
-        if score > 0:
-            candidates.append((subtitle, score))
+    with profiler.span("dialogue.score"):
+        candidates = []
+        for subtitle in merged_subtitles:
+            # 跳过同一集的候选
+            if subtitle['drama_id'] == current_drama_id and subtitle['episode'] == current_episode:
+                continue
+                
+            score = score_candidate(subtitle['text'], subtitle['drama_id'], subtitle['episode'])
+            if score > 0:
+                candidates.append((subtitle, score))
     
     # 排序候选项
-    sorted_candidates = sorted(candidates, key=lambda x: x[1], reverse=True)
+    with profiler.span("dialogue.sort"):
+        sorted_candidates = sorted(candidates, key=lambda x: x[1], reverse=True)
     
-    # 选择最佳回应
-    result = []
-    
-    # 确保有足够的高质量回应
-    if len(sorted_candidates) >= 8:
-        # 直接选择排名前8的回应
-        result = [c[0] for c in sorted_candidates[:8]]
-    else:
-        # 使用所有可用的高质量回应
-        result = [c[0] for c in sorted_candidates]
-        
-        # 如果候选数量不足，从所有字幕中随机选择一些补充
-        if len(result) < 8:
-            random_pool = []
-            for subtitle in merged_subtitles:
-                if (subtitle['drama_id'] != current_drama_id or subtitle['episode'] != current_episode) and subtitle not in result:
-                    random_pool.append(subtitle)
-                    
-            if len(random_pool) > 0:
-                needed = 8 - len(result)
-                random_picks = random.sample(random_pool, min(needed, len(random_pool)))
-                result.extend(random_picks)
-    
-    # 限制返回8个结果
-    if len(result) > 8:
-        result = result[:8]
-    
-    # 为了保持一些惊喜性，添加适度的随机性但保持高分回应排在前面
-    # 前3个保持不变（最高分），后5个略微打乱
-    if len(result) > 3:
-        high_ranked = result[:3]
-        remaining = result[3:]
-        random.shuffle(remaining)
-        result = high_ranked + remaining
-    
-    return result
+    return sorted_candidates
 
 # 更新对话回应API
 @app.route('/api/dialogue_responses', methods=['POST'])
@@ -823,10 +1937,63 @@ def dialogue_responses():
     # 查找合适的对话回应，按得分排序后返回
     responses = find_dialogue_responses(sentence_text, drama_id, episode, drama_ids)
     
-    return jsonify({
-        'results': responses,
-        'count': len(responses)
-    })
+    with profiler.span("dialogue.serialize"):
+        return jsonify({
+            'results': responses,
+            'count': len(responses)
+        })
+
+def search_response(fields: Dict, rows, stream: bool = False):
+    """
+    返回搜索结果响应
+    
+    Args:
+        fields: results以外的字段（总数、查询等）
+        rows: 已编码为JSON的结果片段
+        stream: 为True时以NDJSON流式返回，fields作为第一行
+    """
+    if stream:
+        return ndjson_response(fields, rows)
+    return json_response(encode_results(rows, **fields))
+
+# 请求指标：开始时记录时间并计入正在处理的请求，结束时按路由记录次数和耗时（包括压缩）
+# 出错的请求也会经过after_request（500响应），不需要再注册teardown_request
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    metrics.inc("subtitle_api_requests_in_flight")
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        metrics.inc("subtitle_api_requests_in_flight", value=-1)
+        rule = request.url_rule
+        route = rule.rule if rule is not None else "unmatched"
+        metrics.inc("subtitle_api_requests_total",
+                    (("method", request.method), ("route", route), ("status", str(response.status_code))))
+        metrics.observe("subtitle_api_request_duration_seconds", elapsed, (("route", route),))
+    return response
+
+# 按大小阈值压缩响应
+@app.after_request
+def compress(response):
+    return compress_response(response, request.headers.get('Accept-Encoding', ''))
+
+# 性能分析开启时按路由和采样比例分析请求（不包括压缩和指标记录）
+@app.before_request
+def start_request_profile():
+    if profiler.enabled:
+        rule = request.url_rule
+        if rule is not None and profiler.should_profile(rule.rule):
+            g.profiling = profiler.begin()
+
+@app.after_request
+def finish_request_profile(response):
+    if g.pop("profiling", False):
+        profiler.end()
+    return response
 
 # API搜索端点
 @app.route('/api/search', methods=['GET'])
@@ -835,21 +2002,372 @@ def api_search():
     drama_ids_str = request.args.get('drama_ids', '')
     case_sensitive = request.args.get('case_sensitive', 'false').lower() == 'true'
     use_regex = request.args.get('regex', 'false').lower() == 'true'
+    speaker = request.args.get('speaker', '')
+    mode = request.args.get('mode', 'text')
+    exact = request.args.get('exact', 'false').lower() == 'true'
+    with_offsets = request.args.get('offsets', 'false').lower() == 'true' and mode == 'text'
+    # format=ndjson时逐行流式返回: 第一行为总数等信息，之后每行一条结果
+    stream = request.args.get('format', 'json') == 'ndjson'
     
     if not query:
         return jsonify({'error': '请提供搜索查询'}), 400
     
+    if mode not in SEARCH_MODES:
+        return jsonify({'error': f'不支持的搜索模式: {mode}'}), 400
+    
+    if mode == "boolean":
+        try:
+            parse_search_boolean_query(query, case_sensitive, use_regex, exact)
+        except ValueError as e:
+            return jsonify({'error': f'布尔查询格式错误: {e}'}), 400
+    
     # 处理剧集ID列表
     drama_ids = None
     if drama_ids_str:
         drama_ids = drama_ids_str.split(',')
     
-    results = search_subtitles(query, drama_ids, case_sensitive, use_regex)
+    # 模糊搜索按得分排序返回
+    if mode == "fuzzy":
+        try:
+            limit = max(1, int(request.args.get('limit', '50')))
+            max_distance = request.args.get('max_distance', '')
+            max_distance = max(0, int(max_distance)) if max_distance else None
+        except ValueError:
+            return jsonify({'error': '参数格式错误'}), 400
+        # 距离过大时计数过滤失效，每条字幕都要计算编辑距离
+        if max_distance is not None and max_distance > fuzzy_distance_limit(query):
+            return jsonify({'error': f'max_distance不能超过{fuzzy_distance_limit(query)}'}), 400
+        
+        scored = fuzzy_search_subtitles(query, drama_ids, max_distance, limit, speaker or None)
+        
+        return search_response({
+            'count': len(scored),
+            'query': query,
+            'speaker': speaker or None
+        }, (dumps(dict(subtitle, score=score)) for subtitle, score in scored), stream)
+    
+    # 跨行搜索返回合并后的命中
+    if mode == "cross_line":
+        if use_regex:
+            return jsonify({'error': '跨行搜索不支持正则表达式'}), 400
+        if request.args.get('rank', 'time') == 'relevance':
+            return jsonify({'error': '跨行搜索不支持按相关性排序'}), 400
+        try:
+            max_gap = float(request.args.get('max_gap', DEFAULT_MAX_LINE_GAP))
+        except ValueError:
+            return jsonify({'error': '参数格式错误'}), 400
+        if not math.isfinite(max_gap) or max_gap < 0:
+            return jsonify({'error': 'max_gap必须为非负数'}), 400
+        
+        hits = search_across_lines(query, drama_ids, max_gap, case_sensitive, exact, speaker or None)
+        
+        return search_response({
+            'count': len(hits),
+            'query': query,
+            'speaker': speaker or None
+        }, map(dumps, hits), stream)
+    
+    # 按相关性排序时只返回前limit条
+    if request.args.get('rank', 'time') == 'relevance':
+        try:
+            limit = max(1, int(request.args.get('limit', '50')))
+        except ValueError:
+            return jsonify({'error': '参数格式错误'}), 400
+        
+        try:
+            scored, count = rank_search_results(query, drama_ids, case_sensitive, use_regex, speaker or None, mode,
+                                                limit, exact)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return search_response({
+            'count': count,
+            'query': query,
+            'speaker': speaker or None
+        }, (dumps(dict(subtitle, score=score)) for subtitle, score in scored), stream)
+    
+    # 分页参数
+    limit = request.args.get('limit', '')
+    cursor = request.args.get('cursor', '')
+    count_only = request.args.get('count_only', 'false').lower() == 'true'
+    facets = request.args.get('facets', 'false').lower() == 'true'
+    
+    if limit or cursor or count_only or facets:
+        try:
+            limit = max(1, int(limit)) if limit else None
+            page = search_subtitles_page(query, drama_ids, case_sensitive, use_regex, speaker or None,
+                                         limit, cursor or None, count_only, facets, mode, exact)
+        except ValueError:
+            return jsonify({'error': '分页参数格式错误'}), 400
+        
+        response = {
+            'count': page['count'],
+            'query': query,
+            'speaker': speaker or None
+        }
+        if facets:
+            response['facets'] = page['facets']
+        if count_only:
+            return jsonify(response)
+        
+        response['next_cursor'] = page['next_cursor']
+        if with_offsets:
+            rows = map(dumps, with_match_offsets(page['results'], query, case_sensitive, use_regex, exact))
+        else:
+            rows = (line_fragments[drama_id][position] for drama_id, position in page['keys'])
+        return search_response(response, rows, stream)
+    
+    matches = get_search_matches(query, drama_ids, case_sensitive, use_regex, speaker or None, mode, exact)
+    if with_offsets:
+        results = [all_subtitles[drama_id][position] for drama_id, positions in matches for position in positions]
+        rows = map(dumps, with_match_offsets(results, query, case_sensitive, use_regex, exact))
+    else:
+        rows = (line_fragments[drama_id][position] for drama_id, positions in matches for position in positions)
+    
+    return search_response({
+        'count': sum(len(positions) for _, positions in matches),
+        'query': query,
+        'speaker': speaker or None
+    }, rows, stream)
+
+# 批量搜索端点
+@app.route('/api/search_batch', methods=['POST'])
+def api_search_batch():
+    """
+    批量搜索，多个查询共享语料扫描
+    请求: {"queries": [{"id", "query", "mode", "case_sensitive", "regex", "exact", "speaker", "drama_ids", "limit",
+                       "count_only"} 或查询文本, ...], "drama_ids": ..., "limit": ...}
+    顶层的drama_ids、limit等作为各查询的默认值；返回的results以查询id（未指定时为查询文本）为键，
+    因此id不能重复，重复的查询文本需要指定不同的id
+    """
+    data = request.json
+    if not data or not isinstance(data.get('queries'), list):
+        return jsonify({'error': '请提供查询列表'}), 400
+    
+    if len(data['queries']) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'一次最多{MAX_BATCH_QUERIES}个查询'}), 400
+    
+    def parse_drama_ids(value):
+        if isinstance(value, str):
+            return value.split(',') if value else None
+        return value or None
+    
+    def parse_flag(value):
+        """JSON布尔值，或与其他端点相同地解析字符串（只有"true"为真）"""
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str):
+            return value.lower() == 'true'
+        raise ValueError(f'布尔参数必须为true/false: {value!r}')
+    
+    defaults = {key: data[key] for key in ('mode', 'case_sensitive', 'regex', 'exact', 'speaker', 'limit', 'count_only')
+                if key in data}
+    
+    query_ids = []
+    seen_ids = set()
+    query_args = []
+    options = []
+    for item in data['queries']:
+        if not isinstance(item, (str, dict)):
+            return jsonify({'error': f'查询必须为文本或对象: {item!r}'}), 400
+        item = dict(defaults, **({'query': item} if isinstance(item, str) else item))
+        query = item.get('query', '')
+        mode = item.get('mode', 'text')
+        if not isinstance(query, str):
+            return jsonify({'error': f'查询必须为文本: {query!r}'}), 400
+        if not query:
+            return jsonify({'error': '查询不能为空'}), 400
+        if mode not in EXPORT_MODES:
+            return jsonify({'error': f'批量搜索不支持的搜索模式: {mode}'}), 400
+        try:
+            limit = max(0, int(item['limit'])) if item.get('limit') is not None else None
+            case_sensitive, use_regex, exact, count_only = (
+                parse_flag(item.get(flag, False)) for flag in ('case_sensitive', 'regex', 'exact', 'count_only'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'参数格式错误: {e}'}), 400
+        if mode == "boolean":
+            try:
+                parse_search_boolean_query(query, case_sensitive, use_regex, exact)
+            except ValueError as e:
+                return jsonify({'error': f'布尔查询格式错误 ({query}): {e}'}), 400
+        
+        query_id = str(item.get('id', query))
+        if query_id in seen_ids:
+            return jsonify({'error': f'查询id重复: {query_id}（相同的查询文本需要指定不同的id）'}), 400
+        seen_ids.add(query_id)
+        query_ids.append(query_id)
+        query_args.append((query, parse_drama_ids(item.get('drama_ids', data.get('drama_ids'))),
+                           case_sensitive, use_regex, item.get('speaker') or None, mode, exact))
+        options.append((limit, count_only))
+    
+    results = {}
+    for query_id, args, (limit, count_only), matches in zip(query_ids, query_args, options, search_batch(query_args)):
+        result = {
+            'query': args[0],
+            'count': sum(len(positions) for _, positions in matches)
+        }
+        if not count_only:
+            keys = ((drama_id, position) for drama_id, positions in matches for position in positions)
+            if limit is not None:
+                keys = itertools.islice(keys, limit)
+            result['results'] = [all_subtitles[drama_id][position] for drama_id, position in keys]
+        results[query_id] = result
     
     return jsonify({
         'results': results,
-        'count': len(results),
-        'query': query
+        'count': len(results)
+    })
+
+# 导出搜索结果端点
+@app.route('/api/export', methods=['GET'])
+def api_export():
+    """
+    流式导出匹配的字幕（NDJSON或CSV），边扫描边输出，内存占用与结果数量无关
+    过滤参数与/api/search相同，query为空时导出所选剧集的全部字幕
+    """
+    query = request.args.get('query', '')
+    drama_ids_str = request.args.get('drama_ids', '')
+    case_sensitive = request.args.get('case_sensitive', 'false').lower() == 'true'
+    use_regex = request.args.get('regex', 'false').lower() == 'true'
+    speaker = request.args.get('speaker', '')
+    mode = request.args.get('mode', 'text')
+    exact = request.args.get('exact', 'false').lower() == 'true'
+    output_format = request.args.get('format', 'ndjson')
+    columns_str = request.args.get('columns', '')
+    
+    if mode not in EXPORT_MODES:
+        return jsonify({'error': f'导出不支持的搜索模式: {mode}'}), 400
+    
+    if output_format not in ('ndjson', 'csv'):
+        return jsonify({'error': f'不支持的导出格式: {output_format}'}), 400
+    
+    if not query and mode != 'text':
+        return jsonify({'error': '请提供搜索查询'}), 400
+    
+    if mode == "boolean":
+        try:
+            parse_search_boolean_query(query, case_sensitive, use_regex, exact)
+        except ValueError as e:
+            return jsonify({'error': f'布尔查询格式错误: {e}'}), 400
+    
+    columns = columns_str.split(',') if columns_str else list(EXPORT_COLUMNS)
+    unknown = [column for column in columns if column not in EXPORT_COLUMNS]
+    if unknown:
+        return jsonify({'error': f'不支持的列: {",".join(unknown)}'}), 400
+    
+    try:
+        limit = request.args.get('limit', '')
+        limit = max(0, int(limit)) if limit else None
+    except ValueError:
+        return jsonify({'error': '参数格式错误'}), 400
+    
+    # 处理剧集ID列表
+    drama_ids = None
+    if drama_ids_str:
+        drama_ids = drama_ids_str.split(',')
+    
+    keys = iter_search_positions(query, drama_ids, case_sensitive, use_regex, speaker or None, mode, exact)
+    if limit is not None:
+        keys = itertools.islice(keys, limit)
+    
+    if output_format == 'csv':
+        rows = ([all_subtitles[drama_id][position][column] for column in columns] for drama_id, position in keys)
+        body, mimetype = iter_csv(columns, rows), CSV_MIMETYPE
+    elif len(columns) == len(EXPORT_COLUMNS) and set(columns) == set(EXPORT_COLUMNS):
+        # 全部列时直接使用预先编码的片段
+        body = iter_ndjson(line_fragments[drama_id][position] for drama_id, position in keys)
+        mimetype = NDJSON_MIMETYPE
+    else:
+        body = iter_ndjson(dumps({column: all_subtitles[drama_id][position][column] for column in columns})
+                           for drama_id, position in keys)
+        mimetype = NDJSON_MIMETYPE
+    
+    # 不设置Content-Length，以分块传输编码逐块发送
+    response = Response(body, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=subtitles.{output_format}'
+    return response
+
+# 字幕上下文端点
+@app.route('/api/context', methods=['GET'])
+def api_context():
+    """返回某条字幕前后的相邻字幕"""
+    drama_id = request.args.get('drama_id', DEFAULT_DRAMA)
+    episode = request.args.get('episode', '')
+    start_seconds = request.args.get('start_seconds', '')
+    count = request.args.get('count', '3')
+    window = request.args.get('window', '')
+    
+    if not episode or not start_seconds:
+        return jsonify({'error': '缺少必要参数'}), 400
+    
+    try:
+        start_seconds = float(start_seconds)
+        count = max(0, int(count))
+        window = float(window) if window else None
+    except ValueError:
+        return jsonify({'error': '参数格式错误'}), 400
+    if not math.isfinite(start_seconds) or (window is not None and not (math.isfinite(window) and window >= 0)):
+        return jsonify({'error': 'start_seconds必须为有限数值，window必须为非负有限数值'}), 400
+    
+    context = get_subtitle_context(drama_id, episode, start_seconds, count, window)
+    
+    if not context:
+        return jsonify({'error': '找不到该集字幕'}), 404
+    
+    return jsonify({
+        'results': context['lines'],
+        'count': len(context['lines']),
+        'index': context['index'],
+        'clip': context['clip']
+    })
+
+# 相似字幕端点
+@app.route('/api/similar', methods=['GET'])
+def api_similar():
+    """查找与给定文本相似的字幕"""
+    text = request.args.get('text', '')
+    drama_ids_str = request.args.get('drama_ids', '')
+    limit = request.args.get('limit', '10')
+    approximate = request.args.get('approximate', 'false').lower() == 'true'
+    
+    if not text:
+        return jsonify({'error': '缺少文本参数'}), 400
+    
+    try:
+        limit = max(1, int(limit))
+    except ValueError:
+        return jsonify({'error': '数量参数格式错误'}), 400
+    
+    drama_ids = None
+    if drama_ids_str:
+        drama_ids = drama_ids_str.split(',')
+    
+    scored = find_similar_subtitles(text, drama_ids, limit, approximate)
+    
+    return jsonify({
+        'source_text': text,
+        'results': [dict(subtitle, score=score) for subtitle, score in scored],
+        'count': len(scored)
+    })
+
+# 输入提示端点
+@app.route('/api/suggest', methods=['GET'])
+def api_suggest():
+    """返回以输入内容开头的高频整句和短语"""
+    prefix = request.args.get('prefix', '').strip()
+    limit = request.args.get('limit', '10')
+    
+    try:
+        limit = max(1, int(limit))
+    except ValueError:
+        return jsonify({'error': '数量参数格式错误'}), 400
+    
+    suggestions = suggestion_index.suggest(prefix, limit) if suggestion_index else []
+    
+    return jsonify({
+        'prefix': prefix,
+        'results': [{'text': text, 'count': count} for text, count in suggestions],
+        'count': len(suggestions)
     })
 
 # 获取随机句子端点
@@ -861,12 +2379,21 @@ def api_random_sentences():
     except ValueError:
         count = 8
     
+    try:
+        min_length = int(request.args.get('min_length', '3'))
+        max_length = int(request.args.get('max_length', '8'))
+    except ValueError:
+        min_length, max_length = 3, 8
+    
     drama_ids_str = request.args.get('drama_ids', '')
     drama_ids = None
     if drama_ids_str:
         drama_ids = drama_ids_str.split(',')
     
-    sentences = get_random_sentences(drama_ids, count)
+    # 传入session_id时同一会话内不重复返回
+    session_id = request.args.get('session_id') or None
+    
+    sentences = get_random_sentences(drama_ids, count, min_length, max_length, session_id)
     
     return jsonify({
         'results': sentences,
@@ -942,10 +2469,91 @@ def api_status():
         'status': 'ok',
         'dramas': get_drama_list(),
         'drama_stats': drama_stats,
+        'compaction': {drama_id: loader.compaction_stats for drama_id, loader in drama_loaders.items()
+                       if loader.merge_threshold is not None},
         'total_episodes': sum(stats['episode_count'] for stats in drama_stats.values()),
-        'total_subtitles': sum(stats['subtitle_count'] for stats in drama_stats.values())
+        'total_subtitles': sum(stats['subtitle_count'] for stats in drama_stats.values()),
+        'corpus_version': result_cache.version,
+        'cache': result_cache.stats(),
+        'script_folding': script_folding_status()
     })
 
+def corpus_subtitle_counts():
+    return [((("drama_id", drama_id),), len(subtitles)) for drama_id, subtitles in all_subtitles.items()]
+
+def corpus_episode_counts():
+    return [((("drama_id", drama_id),), len(episodes)) for drama_id, episodes in episode_data_cache.items()]
+
+def result_cache_counts():
+    return [((("result", "hit"),), result_cache.hits), ((("result", "miss"),), result_cache.misses)]
+
+metrics.register_callback("subtitle_api_corpus_subtitles", corpus_subtitle_counts)
+metrics.register_callback("subtitle_api_corpus_episodes", corpus_episode_counts)
+metrics.register_callback("subtitle_api_result_cache_requests_total", result_cache_counts)
+
+# Prometheus指标端点
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    """以Prometheus文本格式返回当前进程的运行指标"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def check_admin_token():
+    """校验X-Admin-Token请求头，不通过时返回错误响应；未设置ADMIN_TOKEN时管理端点不可用"""
+    if ADMIN_TOKEN is None:
+        return jsonify({'error': '管理端点未启用，启动时需指定--admin-token'}), 403
+    token = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        return jsonify({'error': '无权访问管理端点'}), 403
+    return None
+
+# 性能分析管理端点
+@app.route('/api/admin/profiler', methods=['GET', 'POST', 'DELETE'])
+def api_admin_profiler():
+    """
+    GET: 返回分析状态和各阶段span耗时
+    POST: 开始分析，JSON参数route（如/api/rhyming_sentences）、sample_rate、mode（cprofile或sample）、interval
+    DELETE: 停止分析，已累计的结果保留到下次开始
+    """
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        route = data.get('route', '')
+        if route not in {rule.rule for rule in app.url_map.iter_rules()}:
+            return jsonify({'error': f'未知的路由: {route}'}), 400
+        try:
+            profiler.start(route, float(data.get('sample_rate', 1.0)), data.get('mode', PROFILE_MODES[0]),
+                           float(data.get('interval', DEFAULT_SAMPLE_INTERVAL)))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+    elif request.method == 'DELETE':
+        profiler.stop()
+    
+    return jsonify(profiler.status())
+
+@app.route('/api/admin/profiler/pstats', methods=['GET'])
+def api_admin_profiler_pstats():
+    """下载累计的cProfile结果（pstats格式，可用python -m pstats或snakeviz查看）"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    data = profiler.pstats_data()
+    if data is None:
+        return jsonify({'error': '没有cProfile分析结果'}), 404
+    return Response(data, mimetype='application/octet-stream',
+                    headers={'Content-Disposition': 'attachment; filename=profile.pstats'})
+
+@app.route('/api/admin/profiler/collapsed', methods=['GET'])
+def api_admin_profiler_collapsed():
+    """下载sample模式累计的折叠调用栈（可用flamegraph.pl或speedscope生成火焰图）"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    return Response(profiler.collapsed_stacks(), mimetype='text/plain',
+                    headers={'Content-Disposition': 'attachment; filename=profile.collapsed'})
+
 # 合并视频片段端点
 @app.route('/api/merge_clips', methods=['POST'])
 def api_merge_clips():
@@ -1057,24 +2665,82 @@ def api_rhyming_sentences():
         # 只提取句子部分，不包含分数
         sentences = [item[0] for item in results_with_scores]
         
-        return jsonify({
-            "source_text": text,
-            "rhyme": rhyme,
-            "count": len(sentences),
-            "results": sentences
-        })
+        with profiler.span("rhyme.serialize"):
+            return jsonify({
+                "source_text": text,
+                "rhyme": rhyme,
+                "count": len(sentences),
+                "results": sentences
+            })
     except Exception as e:
         print(f"查找押韵句子出错: {str(e)}")
         return jsonify({"error": f"查找押韵句子出错: {str(e)}"}), 500
 
+# 押韵接龙端点
+@app.route('/api/rhyme_chain', methods=['GET'])
+def api_rhyme_chain():
+    """一次生成多步押韵接龙序列"""
+    text = request.args.get('text', '')
+    drama_ids_str = request.args.get('drama_ids', '')
+    
+    if not text:
+        return jsonify({"error": "缺少文本参数"}), 400
+    
+    # 处理剧集ID列表
+    drama_ids = None
+    if drama_ids_str:
+        drama_ids = drama_ids_str.split(',')
+    
+    try:
+        steps = min(int(request.args.get('steps', '5')), 50)
+        min_length = int(request.args.get('min_length', '3'))
+        max_length = int(request.args.get('max_length', '8'))
+        beam_width = min(int(request.args.get('beam_width', str(RHYME_CHAIN_BEAM_WIDTH))), 32)
+        time_budget = float(request.args.get('time_budget', str(RHYME_CHAIN_TIME_BUDGET)))
+    except ValueError:
+        return jsonify({"error": "步数、长度或时间参数格式错误"}), 400
+    
+    # nan与任何数比较都为False，必须先检查有限性再限制上限，否则时间预算失效
+    if steps < 1 or beam_width < 1 or not math.isfinite(time_budget) or time_budget <= 0:
+        return jsonify({"error": "步数、束宽和时间预算必须为大于0的有限数值"}), 400
+    time_budget = min(time_budget, 10.0)
+    
+    rhyme = get_last_char_rhyme(text)
+    if not rhyme:
+        return jsonify({
+            "source_text": text,
+            "rhyme": None,
+            "error": "无法获取文本的韵母",
+            "count": 0,
+            "results": []
+        })
+    
+    chain, timed_out = build_rhyme_chain(text, steps, drama_ids, min_length, max_length, beam_width, time_budget)
+    
+    return jsonify({
+        "source_text": text,
+        "rhyme": rhyme,
+        "steps": steps,
+        "timed_out": timed_out,
+        "total_score": sum(score for _, score in chain),
+        "count": len(chain),
+        "results": [dict(subtitle, score=score) for subtitle, score in chain]
+    })
+
 if __name__ == '__main__':
     # 添加命令行参数支持
     import argparse
     
     parser = argparse.ArgumentParser(description='启动字幕搜索API服务')
     parser.add_argument('--port', type=int, default=5000, help='API服务端口号')
+    parser.add_argument('--merge-threshold', type=float, default=None,
+                        help='合并相邻重复字幕的相似度阈值(0~1)，不指定则不合并')
+    parser.add_argument('--admin-token', default=None, help='管理端点（/api/admin/*）的访问令牌，不指定则管理端点不可用')
     args = parser.parse_args()
     
+    SUBTITLE_MERGE_THRESHOLD = args.merge_threshold
+    ADMIN_TOKEN = args.admin_token
+    
     # 初始化数据
     init_data()
     
@@ -0,0 +1,84 @@
+"""
+test_data_loader.py - DataLoader.attribute_speakers（扫描线人名归属）的测试
+与逐对检查字幕和人名时间区间是否重叠的暴力方法比较
+
+用法:
+    python -m pytest -q test_data_loader.py
+"""
+
+import random
+
+import pytest
+
+from data_loader import DataLoader
+
+
+def format_seconds(seconds: float) -> str:
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}"
+
+
+def random_interval(rng: random.Random):
+    # 整秒端点使区间经常首尾相接（闭区间，相接也算重叠）；偶尔结束早于开始
+    start = rng.randint(0, 60)
+    return format_seconds(start), format_seconds(max(0, start + rng.randint(-2, 8)))
+
+
+def brute_force_speakers(loader: DataLoader, subtitles, names):
+    speakers = []
+    for subtitle in subtitles:
+        start = loader.timestamp_to_seconds(subtitle["start_time"])
+        end = max(start, loader.timestamp_to_seconds(subtitle["end_time"]))
+        overlapping = set()
+        for name_entry in names:
+            if not name_entry["is_valid"] or not name_entry["name"].strip():
+                continue
+            name_start = loader.timestamp_to_seconds(name_entry["start_time"])
+            name_end = max(name_start, loader.timestamp_to_seconds(name_entry["end_time"]))
+            if name_start <= end and start <= name_end:
+                overlapping.add(name_entry["name"].strip())
+        speakers.append(overlapping)
+    return speakers
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_attribute_speakers_matches_brute_force(seed):
+    rng = random.Random(seed)
+    loader = DataLoader()
+    subtitles = []
+    for _ in range(rng.randint(0, 40)):
+        start, end = random_interval(rng)
+        subtitles.append({"start_time": start, "end_time": end, "text": "台词"})
+    names = []
+    for _ in range(rng.randint(0, 30)):
+        start, end = random_interval(rng)
+        names.append({
+            "start_time": start,
+            "end_time": end,
+            # 重复的人名、前后空白和空白人名
+            "name": rng.choice(["甄嬛", "皇上", " 华妃 ", "甄嬛", "  "]),
+            "is_valid": rng.random() < 0.85,
+        })
+
+    speakers = loader.attribute_speakers(subtitles, names)
+    assert len(speakers) == len(subtitles)
+    for names_found, expected in zip(speakers, brute_force_speakers(loader, subtitles, names)):
+        # 每条字幕的人名不重复
+        assert len(names_found) == len(set(names_found))
+        assert set(names_found) == expected
+
+
+def test_attribute_speakers_touching_intervals():
+    loader = DataLoader()
+    subtitles = [
+        {"start_time": "00:00:01.000", "end_time": "00:00:02.000", "text": "甲"},
+        {"start_time": "00:00:02.000", "end_time": "00:00:03.000", "text": "乙"},
+        {"start_time": "00:00:03.500", "end_time": "00:00:04.000", "text": "丙"},
+    ]
+    names = [
+        {"start_time": "00:00:00.000", "end_time": "00:00:01.000", "name": "甄嬛", "is_valid": True},
+        {"start_time": "00:00:03.000", "end_time": "00:00:03.200", "name": "皇上", "is_valid": True},
+        {"start_time": "00:00:03.500", "end_time": "00:00:04.000", "name": "华妃", "is_valid": False},
+    ]
+    assert loader.attribute_speakers(subtitles, names) == [["甄嬛"], ["皇上"], []]
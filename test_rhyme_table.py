@@ -0,0 +1,32 @@
+"""
+test_rhyme_table.py - RhymeTable的测试：表外字符不加入表中，保存和读取只包含语料用到的字
+
+用法:
+    python -m pytest -q test_rhyme_table.py
+"""
+
+from rhyme_table import EXTRA_FINALS_CACHE_SIZE, RhymeTable, cached_final, convert_final
+
+
+def test_final_does_not_grow_table_from_request_text():
+    table = RhymeTable()
+    table.ensure("我知道了")
+    size = len(table.finals)
+    for char in "你放心吧皇上万岁" * 3:
+        assert table.final(char) == convert_final(char)
+    assert len(table.finals) == size
+    assert cached_final.cache_info().currsize <= EXTRA_FINALS_CACHE_SIZE
+
+
+def test_save_and_load_round_trip(tmp_path):
+    table = RhymeTable()
+    table.ensure("臣妾做不到啊")
+    table.final("嗯")
+    path = tmp_path / "rhyme_finals.json"
+    table.save(path)
+
+    loaded = RhymeTable()
+    assert loaded.load(path) == len("臣妾做不到啊")
+    assert loaded.finals == table.finals
+    assert "嗯" not in loaded.finals
+    assert loaded.final("到") == "ao"
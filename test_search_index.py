@@ -0,0 +1,326 @@
+"""
+test_search_index.py - search_index中手写算法的测试
+在随机生成的小字母表文本上与暴力方法（str.find、in、全表扫描）比较结果
+
+用法:
+    python -m pytest -q test_search_index.py
+"""
+
+import math
+import random
+from array import array
+
+import pytest
+
+from search_index import (AhoCorasick, BM25Scorer, BooleanQueryEvaluator, LineBuffer, PinyinIndex, QGramIndex,
+                          SuggestionIndex,
+                          bounded_substring_distance, build_pinyin_matcher, max_filtered_distance,
+                          parse_boolean_query)
+from shared_corpus import PackedTextColumn
+
+# 小字母表使随机文本中频繁出现重叠和重复的匹配
+ALPHABET = "甲乙丙丁"
+
+
+def random_texts(rng: random.Random, count: int = 200, max_length: int = 12):
+    """随机文本列表，包括空行"""
+    return ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, max_length))) for _ in range(count)]
+
+
+def brute_force_lines(texts, pattern):
+    return [i for i, text in enumerate(texts) if pattern in text]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_line_buffer_find_lines_matches_in(seed):
+    rng = random.Random(seed)
+    texts = random_texts(rng)
+    lines = LineBuffer(texts)
+    for _ in range(50):
+        pattern = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 4)))
+        assert list(lines.find_lines(pattern)) == brute_force_lines(texts, pattern)
+
+
+def test_line_buffer_does_not_match_across_lines():
+    lines = LineBuffer(["甲乙", "丙丁", "", "甲"])
+    assert list(lines.find_lines("乙丙")) == []
+    assert list(lines.find_lines("甲")) == [0, 3]
+    assert list(lines.find_lines("丁")) == [1]
+
+
+def test_line_buffer_empty_column():
+    assert list(LineBuffer([]).find_lines("甲")) == []
+
+
+def test_aho_corasick_overlapping_patterns():
+    # 互为前缀/后缀/子串的模式，以及重复的模式
+    patterns = ["甲乙", "乙甲", "甲乙甲", "乙", "甲乙甲乙", "乙甲乙", "甲乙"]
+    texts = ["甲乙甲乙", "乙甲", "丙甲乙丙", "甲丙乙", "", "乙乙甲乙甲"]
+    matches = AhoCorasick(patterns).line_matches(LineBuffer(texts))
+    for pattern, lines in zip(patterns, matches):
+        assert list(lines) == brute_force_lines(texts, pattern), pattern
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_aho_corasick_matches_str_find(seed):
+    rng = random.Random(seed)
+    texts = random_texts(rng)
+    patterns = ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 5))) for _ in range(30)]
+    matches = AhoCorasick(patterns).line_matches(LineBuffer(texts))
+    assert len(matches) == len(patterns)
+    for pattern, lines in zip(patterns, matches):
+        expected = [i for i, text in enumerate(texts) if text.find(pattern) >= 0]
+        assert list(lines) == expected, pattern
+
+
+def test_aho_corasick_without_patterns():
+    assert AhoCorasick([]).line_matches(LineBuffer(["甲乙"])) == []
+
+
+def edit_distance(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(min(previous[j - 1] + (char != other), previous[j] + 1, current[j - 1] + 1))
+        previous = current
+    return previous[-1]
+
+
+def brute_force_substring_distance(pattern: str, text: str) -> int:
+    """pattern与text所有子串（包括空串）的最小编辑距离"""
+    return min(edit_distance(pattern, text[i:j]) for i in range(len(text) + 1) for j in range(i, len(text) + 1))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_bounded_substring_distance_matches_brute_force(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        pattern = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 6)))
+        text = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 10)))
+        max_distance = rng.randint(0, 3)
+        expected = brute_force_substring_distance(pattern, text)
+        assert bounded_substring_distance(pattern, text, max_distance) == (
+            expected if expected <= max_distance else None), (pattern, text, max_distance)
+
+
+def test_bounded_substring_distance_edge_cases():
+    assert bounded_substring_distance("甲乙", "丙甲乙丁", 0) == 0
+    assert bounded_substring_distance("甲乙", "", 2) == 2
+    assert bounded_substring_distance("甲乙", "", 1) is None
+    assert bounded_substring_distance("", "甲乙", 0) == 0
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_qgram_candidates_never_miss_a_match(seed):
+    rng = random.Random(seed)
+    # 较大的字母表使计数过滤能排除一部分字幕
+    alphabet = ALPHABET + "戊己庚辛"
+    texts = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 15))) for _ in range(150)]
+    index = QGramIndex()
+    for position, text in enumerate(texts):
+        index.add(position, text)
+
+    for _ in range(40):
+        query = "".join(rng.choice(alphabet) for _ in range(rng.randint(2, 9)))
+        for max_distance in range(max_filtered_distance(query) + 1):
+            candidates = index.candidates(query, max_distance)
+            assert candidates is not None
+            assert candidates == sorted(set(candidates))
+            matches = [position for position, text in enumerate(texts)
+                       if bounded_substring_distance(query, text, max_distance) is not None]
+            assert set(matches) <= set(candidates), (query, max_distance)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_qgram_threshold_reaching_zero(seed):
+    rng = random.Random(seed)
+    index = QGramIndex()
+    index.add(0, "甲乙丙丁")
+    for _ in range(100):
+        query = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 9)))
+        limit = max_filtered_distance(query)
+        # 超过max_filtered_distance时阈值<=0，过滤无效
+        assert index.candidates(query, limit + 1) is None
+        if limit >= 0:
+            assert index.candidates(query, limit) is not None
+        else:
+            # 查询短于q：没有gram
+            assert len(query) < index.q
+
+
+def test_max_filtered_distance_examples():
+    assert max_filtered_distance("") == -1
+    assert max_filtered_distance("甲") == -1
+    assert max_filtered_distance("甲乙") == 0
+    # 重复的gram只计一次：甲甲甲甲只有一个不同的二元组
+    assert max_filtered_distance("甲甲甲甲") == 0
+    assert max_filtered_distance("甲乙丙丁戊") == 1
+
+
+def boolean_evaluator(texts):
+    """与subtitle_api相同：单字倒排表(q=1)和二元组倒排表(q=2)"""
+    char_index = QGramIndex(q=1)
+    qgram_index = QGramIndex()
+    for position, text in enumerate(texts):
+        char_index.add(position, text)
+        qgram_index.add(position, text)
+    return BooleanQueryEvaluator(char_index, qgram_index, texts)
+
+
+def brute_force_matches(node, text: str) -> bool:
+    kind = node[0]
+    if kind == "term":
+        return node[1] in text
+    if kind == "not":
+        return not brute_force_matches(node[1], text)
+    if kind == "and":
+        return all(brute_force_matches(child, text) for child in node[1])
+    return any(brute_force_matches(child, text) for child in node[1])
+
+
+def random_boolean_query(rng: random.Random, depth: int = 0) -> str:
+    """随机布尔查询，包括NOT/-前缀、括号和隐式AND"""
+    roll = rng.random()
+    if depth >= 3 or roll < 0.4:
+        term = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 3)))
+        return rng.choice(["", "NOT ", "-", "!"]) + term if rng.random() < 0.3 else term
+    left = random_boolean_query(rng, depth + 1)
+    right = random_boolean_query(rng, depth + 1)
+    if roll < 0.6:
+        return f"{left} {right}"
+    if roll < 0.75:
+        return f"{left} AND {right}"
+    if roll < 0.9:
+        return f"({left} OR {right})"
+    return f"NOT ({left} | {right})"
+
+
+def test_parse_boolean_query_precedence():
+    assert parse_boolean_query("甲 乙 OR 丙") == ("or", [("and", [("term", "甲"), ("term", "乙")]), ("term", "丙")])
+    assert parse_boolean_query("甲 -乙") == ("and", [("term", "甲"), ("not", ("term", "乙"))])
+    assert parse_boolean_query("NOT 甲 OR 乙") == ("or", [("not", ("term", "甲")), ("term", "乙")])
+    assert parse_boolean_query('"甲 乙" 丙') == ("and", [("term", "甲 乙"), ("term", "丙")])
+    assert parse_boolean_query("（甲 | 乙） 丙") == ("and", [("or", [("term", "甲"), ("term", "乙")]), ("term", "丙")])
+
+
+@pytest.mark.parametrize("query", ["", "   ", '""', "(", "(甲", "甲)", "(甲 OR 乙))", "()", '"甲', "AND", "甲 OR",
+                                   "NOT", "甲 AND OR 乙"])
+def test_parse_boolean_query_rejects_invalid(query):
+    with pytest.raises(ValueError):
+        parse_boolean_query(query)
+
+
+@pytest.mark.parametrize("query", ["NOT 甲", "-甲乙", "!甲 !乙", "NOT (甲 OR 乙)", "NOT NOT 丙"])
+def test_boolean_not_only_queries_match_full_scan(query):
+    texts = random_texts(random.Random(0))
+    node = parse_boolean_query(query)
+    expected = [i for i, text in enumerate(texts) if brute_force_matches(node, text)]
+    assert boolean_evaluator(texts).evaluate(node) == expected
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_boolean_evaluator_matches_full_scan(seed):
+    rng = random.Random(seed)
+    texts = random_texts(rng)
+    evaluator = boolean_evaluator(texts)
+    for _ in range(100):
+        query = random_boolean_query(rng)
+        node = parse_boolean_query(query)
+        expected = [i for i, text in enumerate(texts) if brute_force_matches(node, text)]
+        assert evaluator.evaluate(node) == expected, query
+
+
+def test_boolean_evaluator_term_without_posting():
+    texts = ["甲乙", "乙丙"]
+    evaluator = boolean_evaluator(texts)
+    assert evaluator.evaluate(parse_boolean_query("戊")) == []
+    assert evaluator.evaluate(parse_boolean_query("甲戊")) == []
+    assert evaluator.evaluate(parse_boolean_query("-戊")) == [0, 1]
+
+
+def pinyin_matches(texts, query):
+    index = PinyinIndex()
+    for text in texts:
+        index.add(text)
+    columns = {"pinyin": index.syllable_texts, "initials": index.initials_texts}
+    readings = build_pinyin_matcher(query, {"drama": index})
+    return [i for i in range(len(texts)) if any(matcher(columns[column][i]) for column, matcher in readings)]
+
+
+def test_pinyin_query_matches_syllables_and_initials():
+    texts = ["饿了", "二哥", "西安", "现在", "昂首", "啊你哥", "你好"]
+    # "e"既是音节（饿）也是首字母（二哥）
+    assert pinyin_matches(texts, "e") == [0, 1]
+    # "ang"切分为一个音节（昂），也可以是首字母串（啊你哥）
+    assert pinyin_matches(texts, "ang") == [4, 5]
+    assert pinyin_matches(texts, "xian") == [3]
+    # 带空格时只按音节匹配
+    assert pinyin_matches(texts, "xi an") == [2]
+    # 无法切分时只按首字母匹配
+    assert pinyin_matches(texts, "nh") == [6]
+    assert pinyin_matches(texts, "饿") == [0]
+
+
+def test_bm25_score_matches_formula():
+    texts = {"a": ["甲乙丙", "甲乙", "丙丁丁", ""], "b": ["乙丙甲乙", "丁", "甲乙甲乙丁"]}
+    columns = {drama_id: {"text": column, "normalized": column} for drama_id, column in texts.items()}
+    indexes = []
+    for column in texts.values():
+        evaluator = boolean_evaluator(column)
+        indexes.append((evaluator.char_index, evaluator.qgram_index))
+    scorer = BM25Scorer(columns)
+    terms = scorer.query_terms(["甲乙丙", "丁"], indexes)
+    assert [term for term, _ in terms] == ["丁", "乙丙", "甲乙"]
+
+    all_texts = [text for column in texts.values() for text in column]
+    average_length = sum(map(len, all_texts)) / len(all_texts)
+    for text in all_texts:
+        expected = 0.0
+        for term in ("丁", "乙丙", "甲乙"):
+            df = sum(term in other for other in all_texts)
+            idf = math.log(1 + (len(all_texts) - df + 0.5) / (df + 0.5))
+            tf = text.count(term)
+            expected += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * len(text) / average_length))
+        assert scorer.score(text, terms) == pytest.approx(expected)
+
+
+def brute_force_suggestions(texts, prefix, k, min_ngram_count=3, max_line_length=20):
+    """逐条统计整句和2~4字短语的频次，选出以prefix开头的前k条"""
+    lines = {}
+    ngrams = {}
+    for text in texts:
+        text = text.strip()
+        if not text:
+            continue
+        if len(text) <= max_line_length:
+            lines[text] = lines.get(text, 0) + 1
+        for n in range(2, 5):
+            for i in range(len(text) - n + 1):
+                ngrams[text[i:i + n]] = ngrams.get(text[i:i + n], 0) + 1
+    entries = dict(lines)
+    for gram, count in ngrams.items():
+        if count >= min_ngram_count and count > entries.get(gram, 0):
+            entries[gram] = count
+    matching = sorted((phrase for phrase in entries if phrase.startswith(prefix)),
+                      key=lambda phrase: (-entries[phrase], len(phrase), phrase))
+    return [(phrase, entries[phrase]) for phrase in matching[:k]]
+
+
+@pytest.mark.parametrize("packed", [False, True])
+@pytest.mark.parametrize("seed", range(3))
+def test_suggest_matches_brute_force_prefix_count(seed, packed):
+    rng = random.Random(seed)
+    texts = random_texts(rng, 300, 8) + ["  ", "甲乙丙丁甲乙丙丁甲乙丙丁甲乙丙丁甲乙丙丁甲"]
+    index = SuggestionIndex(texts, top_k=5)
+    if packed:
+        # 与prepare_shared_corpus相同的多进程共享布局
+        index.phrases = PackedTextColumn(index.phrases)
+        index.counts = array('I', index.counts)
+        index.top_by_prefix = {prefix: array('I', indexes) for prefix, indexes in index.top_by_prefix.items()}
+    prefixes = [""] + ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 5))) for _ in range(60)]
+    for prefix in prefixes:
+        # k小于、等于和大于预计算的top_k
+        for k in (1, 5, 12, 1000):
+            expected = brute_force_suggestions(texts, prefix, k) if prefix else []
+            assert index.suggest(prefix, k) == expected, (prefix, k)
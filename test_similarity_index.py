@@ -0,0 +1,112 @@
+"""
+test_similarity_index.py - TfidfIndex（TF-IDF稀疏矩阵和SimHash LSH预过滤）的测试
+与逐条计算的稠密余弦相似度和完整排序比较
+
+用法:
+    python -m pytest -q test_similarity_index.py
+"""
+
+import math
+import random
+
+import numpy as np
+import pytest
+
+from similarity_index import TfidfIndex, iter_ngrams
+
+ALPHABET = "甲乙丙丁戊己庚辛"
+
+
+def random_texts(rng: random.Random, count: int = 300):
+    return ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 10))) for _ in range(count)]
+
+
+def brute_force_vectors(texts):
+    """与TfidfIndex相同的权重：次线性tf、平滑idf、L2归一化，返回(idf, 每行的{n-gram: 权重})"""
+    document_frequency = {}
+    for text in texts:
+        for gram in set(iter_ngrams(text)):
+            document_frequency[gram] = document_frequency.get(gram, 0) + 1
+    idf = {gram: math.log((1 + len(texts)) / (1 + df)) + 1 for gram, df in document_frequency.items()}
+    return idf, [vectorize(text, idf) for text in texts]
+
+
+def vectorize(text, idf):
+    counts = {}
+    for gram in iter_ngrams(text):
+        if gram in idf:
+            counts[gram] = counts.get(gram, 0) + 1
+    vector = {gram: (1 + math.log(count)) * idf[gram] for gram, count in counts.items()}
+    norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+    return {gram: weight / norm for gram, weight in vector.items()}
+
+
+def cosine(a, b):
+    return sum(weight * b.get(gram, 0.0) for gram, weight in a.items())
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_scores_match_dense_cosine(seed):
+    rng = random.Random(seed)
+    texts = random_texts(rng)
+    index = TfidfIndex(texts)
+    idf, vectors = brute_force_vectors(texts)
+    for _ in range(20):
+        query = "".join(rng.choice(ALPHABET + "子") for _ in range(rng.randint(1, 8)))
+        query_vector = vectorize(query, idf)
+        expected = [cosine(query_vector, vector) for vector in vectors]
+        assert index.scores(query) == pytest.approx(expected, abs=1e-5)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_top_k_matches_full_sort(seed):
+    rng = random.Random(seed)
+    texts = random_texts(rng)
+    index = TfidfIndex(texts)
+    idf, vectors = brute_force_vectors(texts)
+    mask = np.array([rng.random() < 0.5 for _ in texts])
+    for _ in range(20):
+        query = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 8)))
+        k = rng.randint(1, 15)
+        query_vector = vectorize(query, idf)
+        for row_mask in (None, mask):
+            expected = sorted((cosine(query_vector, vector) for row, vector in enumerate(vectors)
+                               if row_mask is None or row_mask[row]), reverse=True)
+            expected = [score for score in expected[:k] if score > 1e-6]
+            hits = index.top_k(query, k, row_mask)
+            # 得分相同的行顺序不确定，比较得分序列，并检查每个命中的得分
+            assert [score for _, score in hits] == pytest.approx(expected, abs=1e-5)
+            for row, score in hits:
+                assert row_mask is None or row_mask[row]
+                assert score == pytest.approx(cosine(query_vector, vectors[row]), abs=1e-5)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_lsh_candidates_are_exactly_rescored(seed):
+    rng = random.Random(seed)
+    texts = random_texts(rng, 500)
+    index = TfidfIndex(texts, use_lsh=True, seed=seed)
+    for _ in range(20):
+        query = rng.choice([text for text in texts if len(text) >= 3])
+        exact_scores = index.scores(query)
+        candidates = index.lsh_candidates(query)
+        assert list(candidates) == sorted(set(candidates.tolist()))
+        # 与查询相同的字幕签名完全相同，总在候选中，且为第一名
+        assert all(row in set(candidates.tolist()) for row, text in enumerate(texts) if text == query)
+        assert index.candidate_scores(query, candidates) == pytest.approx(exact_scores[candidates], abs=1e-5)
+
+        k = 10
+        hits = index.top_k(query, k, approximate=True)
+        assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+        # 近似结果是候选集合内按精确余弦相似度选出的前k条
+        expected = sorted(exact_scores[candidates], reverse=True)[:k]
+        assert [score for _, score in hits] == pytest.approx([score for score in expected if score > 0], abs=1e-5)
+        for row, score in hits:
+            assert score == pytest.approx(exact_scores[row], abs=1e-5)
+
+
+def test_query_without_known_ngrams():
+    index = TfidfIndex(["甲乙", "丙丁"], use_lsh=True)
+    assert index.top_k("子丑") == []
+    assert index.top_k("子丑", approximate=True) == []
+    assert len(index.lsh_candidates("子丑")) == 0
@@ -0,0 +1,223 @@
+"""
+test_subtitle_api.py - subtitle_api中检索、排序、抽句和对话挖掘的行为测试
+在benchmarks.corpus生成的小型合成语料上加载数据，与逐条扫描、完整排序等暴力方法比较结果
+
+用法:
+    python -m pytest -q test_subtitle_api.py
+"""
+
+import contextlib
+import io
+import os
+import time
+
+import pytest
+
+from benchmarks.corpus import generate_corpus, use_corpus
+from drama_config import DRAMAS
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    """生成语料并加载（subtitle_api导入时会在当前目录创建视频输出目录，在临时目录中导入）"""
+    root = tmp_path_factory.mktemp("corpus")
+    manifest = generate_corpus(str(root), dramas=2, episodes=3, lines=200, seed=1)
+    saved = dict(DRAMAS)
+    cwd = os.getcwd()
+    use_corpus(manifest)
+    os.chdir(root)
+    try:
+        import subtitle_api
+        with contextlib.redirect_stdout(io.StringIO()):
+            subtitle_api.init_data()
+        yield subtitle_api
+    finally:
+        os.chdir(cwd)
+        DRAMAS.clear()
+        DRAMAS.update(saved)
+
+
+@pytest.fixture
+def client(api):
+    return api.app.test_client()
+
+
+@pytest.mark.parametrize("query, mode, limit", [("皇上", "text", 5), ("知道", "text", 50), ("我 一定", "boolean", 7),
+                                                ("娘娘！", "text", 3), ("皇上", "pinyin", 10)])
+def test_rank_matches_full_sort(api, query, mode, limit):
+    ranked, count = api.rank_search_results(query, mode=mode, limit=limit)
+    matches = api.get_search_matches(query, mode=mode)
+    assert count == sum(len(positions) for _, positions in matches)
+
+    column, words = api.relevance_terms(query, mode=mode)
+    indexes = [api.get_posting_indexes(drama_id, column) for drama_id in sorted(api.all_subtitles)]
+    terms = api.bm25_scorer.query_terms(words, indexes)
+    scored = [(api.bm25_scorer.score(api.text_columns[drama_id][column][position], terms, column), drama_id, position)
+              for drama_id, positions in matches for position in positions]
+    # 完整的稳定排序：得分降序，得分相同时保持剧集、集数和时间顺序
+    expected = sorted(scored, key=lambda item: -item[0])[:limit]
+    assert [(subtitle, score) for subtitle, score in ranked] == [
+        (api.all_subtitles[drama_id][position], round(score, 4)) for score, drama_id, position in expected]
+    # 评分使用与匹配相同的文本，每条命中都至少包含一个查询词
+    assert all(score > 0 for _, score in ranked)
+
+
+def test_rank_endpoint_reports_full_count(client):
+    full = client.get('/api/search', query_string={'query': '皇上'}).get_json()
+    ranked = client.get('/api/search', query_string={'query': '皇上', 'rank': 'relevance', 'limit': '3'}).get_json()
+    assert full['count'] > 3
+    assert ranked['count'] == full['count']
+    assert len(ranked['results']) == 3
+
+
+@pytest.mark.parametrize("params", [{'regex': 'true'}, {'mode': 'pinyin', 'query': 'huangshang'},
+                                    {'mode': 'cross_line'}])
+def test_rank_rejects_unscorable_queries(client, params):
+    response = client.get('/api/search', query_string=dict({'query': '皇上', 'rank': 'relevance'}, **params))
+    assert response.status_code == 400
+
+
+def eligible_lines(api, drama_ids, min_length, max_length):
+    """逐条计算去除语气词后的长度，得到长度区间内的全部(剧集ID, 位置)"""
+    return {(drama_id, position)
+            for drama_id in api.get_target_dramas(drama_ids)
+            for position, text in enumerate(api.text_columns[drama_id]["text"])
+            if min_length <= len(api.MODAL_PARTICLE_PATTERN.sub('', text)) <= max_length}
+
+
+@pytest.mark.parametrize("drama_ids, min_length, max_length", [(None, 3, 8), (None, 1, 2), (None, 9, 40),
+                                                               ("first", 3, 8), (None, 100, 200)])
+def test_sample_length_pool_unique_in_range(api, drama_ids, min_length, max_length):
+    if drama_ids == "first":
+        drama_ids = sorted(api.all_subtitles)[:1]
+    eligible = eligible_lines(api, drama_ids, min_length, max_length)
+    ranges = api.get_length_pool_ranges(drama_ids, min_length, max_length)
+    assert sum(hi - lo for _, lo, hi in ranges) == len(eligible)
+
+    ordered = sorted(eligible)
+    other_drama = ("其他剧集", 0)
+    # 不排除、少量排除（拒绝采样）和大量排除（列出剩余候选）
+    for exclude in (None, set(ordered[::50]) | {other_drama}, set(ordered[::2])):
+        available = eligible - (exclude or set())
+        for count in (1, 8, len(available), len(available) + 5):
+            sampled = api.sample_length_pool(ranges, count, exclude)
+            assert len(sampled) == len(set(sampled)) == min(count, len(available))
+            assert set(sampled) <= available
+
+    # 抽取全部时恰好得到区间内的全部字幕
+    assert set(api.sample_length_pool(ranges, len(eligible))) == eligible
+
+
+def test_rhyme_chain_stops_inside_candidate_scan(api, monkeypatch):
+    text = "我知道了"
+    rhyme = api.get_last_char_rhyme(text)
+    group_size = sum(len(groups.get(rhyme, ())) for groups in api.rhyme_groups.values())
+    assert group_size > 20
+
+    # 每条候选评分耗时1毫秒：扫描一遍分组就会超出预算，必须在扫描中途停止
+    score = api.calculate_rhyme_score
+    monkeypatch.setattr(api, "calculate_rhyme_score", lambda a, b: time.sleep(0.001) or score(a, b))
+    monkeypatch.setattr(api, "RHYME_CHAIN_DEADLINE_INTERVAL", 4)
+    started = time.monotonic()
+    chain, timed_out = api.build_rhyme_chain(text, 5, min_length=1, max_length=100, time_budget=0.01)
+    assert timed_out
+    assert time.monotonic() - started < 0.01 + 0.001 * 4 + 0.05
+
+
+def test_dialogue_index_matches_adjacent_pairs(api):
+    for drama_id, subtitles in api.all_subtitles.items():
+        index = api.build_dialogue_index(subtitles)
+        expected_replies = {}
+        expected_pools = {"turn_pools": {}, "adjacent_pools": {}}
+        previous = None
+        for position, subtitle in enumerate(subtitles):
+            if (previous is not None and previous["episode"] == subtitle["episode"]
+                    and subtitle["start_seconds"] - previous["end_seconds"] <= api.DIALOGUE_PAIR_MAX_GAP
+                    and subtitle["text"] != previous["text"]):
+                expected_replies.setdefault(previous["text"], []).append(position)
+                turn = previous["speakers"] and subtitle["speakers"] and \
+                    set(previous["speakers"]) != set(subtitle["speakers"])
+                pools = expected_pools["turn_pools" if turn else "adjacent_pools"]
+                pools.setdefault(api.dialogue_cue_class(previous["text"]), []).append(position)
+            previous = subtitle
+
+        assert {text: list(positions) for text, positions in index["replies"].items()} == expected_replies
+        for name, pools in expected_pools.items():
+            assert {cue: list(positions) for cue, positions in index[name].items()} == pools
+        # 合成语料中换人说话和普通相邻的对话都存在
+        assert index["turn_pools"] and index["adjacent_pools"]
+
+
+def test_mined_responses_skip_current_episode(api):
+    drama_id = sorted(api.all_subtitles)[0]
+    replies = api.dialogue_index[drama_id]["replies"]
+    # 语料中回应最多的句子（常见短句）
+    text = max(replies, key=lambda line: len(replies[line]))
+    current_episode = api.all_subtitles[drama_id][replies[text][0]]["episode"]
+    targets = sorted(api.all_subtitles)
+
+    for count in (1, 3, 8, 30):
+        result = api.find_mined_dialogue_responses(text, drama_id, current_episode, targets, count)
+        texts = [subtitle["text"] for subtitle in result]
+        assert len(result) <= count
+        assert len(texts) == len(set(texts)) and text not in texts
+        assert not any(subtitle["drama_id"] == drama_id and subtitle["episode"] == current_episode
+                       for subtitle in result)
+
+        # 先返回同一句话的真实回应（按语料顺序，去重，跳过当前集）
+        true_replies = []
+        for target in targets:
+            for position in api.dialogue_index[target]["replies"].get(text, ()):
+                subtitle = api.all_subtitles[target][position]
+                if target == drama_id and subtitle["episode"] == current_episode:
+                    continue
+                if subtitle["text"] != text and subtitle["text"] not in true_replies:
+                    true_replies.append(subtitle["text"])
+        assert texts[:len(true_replies)] == true_replies[:count]
+
+
+def test_search_batch_rejects_invalid_items_and_duplicate_ids(client):
+    for queries in ([5], [None], ["皇上", ["皇上"]], [{"query": 5}],
+                    ["皇上", "皇上"], [{"id": "a", "query": "皇上"}, {"id": "a", "query": "臣妾"}],
+                    ["皇上", {"query": "皇上", "mode": "boolean"}]):
+        response = client.post('/api/search_batch', json={"queries": queries})
+        assert response.status_code == 400, queries
+
+    response = client.post('/api/search_batch', json={"queries": [
+        "皇上", {"id": "boolean", "query": "皇上", "mode": "boolean"}, {"id": 1, "query": "臣妾"}]})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert sorted(results) == ["1", "boolean", "皇上"]
+    assert results["皇上"]["count"] == results["boolean"]["count"]
+
+
+def test_admin_endpoints_require_token(api, client, monkeypatch):
+    monkeypatch.setattr(api, "ADMIN_TOKEN", None)
+    for path in ('/api/admin/profiler', '/api/admin/profiler/pstats', '/api/admin/profiler/collapsed'):
+        assert client.get(path).status_code == 403
+    assert client.post('/api/admin/profiler', json={"route": "/api/search"}).status_code == 403
+
+    monkeypatch.setattr(api, "ADMIN_TOKEN", "口令-secret")
+    assert client.get('/api/admin/profiler').status_code == 403
+    assert client.get('/api/admin/profiler', headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get('/api/admin/profiler', headers={"X-Admin-Token": "口令-secret"}).status_code == 200
+
+
+def test_profiler_rejects_non_finite_interval(api, client, monkeypatch):
+    monkeypatch.setattr(api, "ADMIN_TOKEN", "secret")
+    headers = {"X-Admin-Token": "secret"}
+    for interval in ("nan", "inf", "-inf", 0, 0.0001, 5):
+        response = client.post('/api/admin/profiler', headers=headers,
+                               json={"route": "/api/search", "mode": "sample", "interval": interval})
+        assert response.status_code == 400, interval
+    for sample_rate in ("nan", "inf", 0, 1.5):
+        response = client.post('/api/admin/profiler', headers=headers,
+                               json={"route": "/api/search", "sample_rate": sample_rate})
+        assert response.status_code == 400, sample_rate
+    assert not api.profiler.enabled
+
+    response = client.post('/api/admin/profiler', headers=headers,
+                           json={"route": "/api/search", "mode": "sample", "interval": 0.01})
+    assert response.status_code == 200
+    assert client.delete('/api/admin/profiler', headers=headers).status_code == 200
+    assert not api.profiler.enabled